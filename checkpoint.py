@@ -0,0 +1,282 @@
+import contextlib
+import gc
+import io
+import json
+import os
+import pickle
+
+import numpy as np
+
+from counters import Counters, Stats
+from creature import Creature
+from field import ChunkedField, Field
+from history import History
+from occupancy import DenseOccupancy, HashOccupancy, SortedOccupancy
+from population import COLUMNS, MUTATIONS, Population
+from traits import MUTATION_TRAITS, TRAITS
+
+# Bump this if the layout of a checkpoint changes.
+CHECKPOINT_VERSION = 1
+
+def _creature_arrays(world):
+  """Every creature's columns (see population.COLUMNS), whatever the engine."""
+  if world.population is not None:
+    return world.population.to_arrays()
+  creatures = world.creatures
+  arrays = {
+      name: np.array([getattr(x, name) for x in creatures],
+                     dtype=dtype).reshape((-1,) + shape)
+      for name, dtype, shape in COLUMNS
+      if name not in ("mutation", "diet_type")
+  }
+  arrays["mutation"] = np.array([MUTATIONS.index(x.mutation)
+                                 for x in creatures], dtype=np.int8)
+  arrays["diet_type"] = np.array([world.trophic_table.code(x.diet_type)
+                                  for x in creatures], dtype=np.int8)
+  return arrays
+
+@contextlib.contextmanager
+def _holding_off_gc():
+  """Holds off the garbage collector while lots of objects are made.
+
+  None of them are garbage, but every few hundred new objects it would
+  otherwise comb through everything made so far (and the rest of the heap).
+  """
+  collecting = gc.isenabled()
+  gc.disable()
+  try:
+    yield
+  finally:
+    if collecting:
+      gc.enable()
+
+def _creature_objects(arrays, diet_types):
+  """Creature objects for the rows of _creature_arrays."""
+  creatures = []
+  for (location, food_stored, mutation, diet_type, speed, metabolism, age,
+       is_alive, meat_value, reproduction_mutation_chance,
+       randomly_teleports) in zip(*[arrays[name].tolist()
+                                    for name, _, _ in COLUMNS]):
+    creature = Creature(
+        location=location,
+        mutation=MUTATIONS[mutation],
+        reproduction_mutation_chance=reproduction_mutation_chance,
+        diet_type=diet_types[diet_type],
+        randomly_teleports=randomly_teleports,
+        meat_value=meat_value,
+        speed=speed,
+        metabolism=metabolism)
+    creature.food_stored = food_stored
+    creature.age = age
+    creature.is_alive = is_alive
+    creatures.append(creature)
+  return creatures
+
+def save(world, file_name, history=True):
+  """Saves world to a checkpoint file (see World.save_checkpoint).
+
+  A checkpoint is a compressed .npz file. Its "metadata" entry is the world's
+  small stuff as JSON bytes (the same as a MEMMAP world's metadata.json, plus
+  the checkpoint version); every other entry is an array named
+  <part>.<name>, for the parts field, creatures (a Population's columns,
+  whatever the engine) and history. The file is written next to file_name
+  and then swapped in, so a crash leaves the old checkpoint in one piece.
+
+  Arguments:
+    world: World; The world to save.
+    file_name: string; Where to save it.
+    history: bool; Save the history books too? Without them, the world is
+      loaded with empty books.
+  """
+  with open(file_name + ".tmp", "wb") as f:
+    np.savez_compressed(f, **to_arrays(world, history))
+  os.replace(file_name + ".tmp", file_name)
+
+def dumps(world, history=True):
+  """Like save, but returns the checkpoint as bytes (see loads)."""
+  data = io.BytesIO()
+  np.savez_compressed(data, **to_arrays(world, history))
+  return data.getvalue()
+
+def to_arrays(world, history=True):
+  """The entries of world's checkpoint (see save), as {name: np.array}."""
+  if isinstance(world.occupancy, DenseOccupancy):
+    occupancy_index = "DENSE"
+  elif isinstance(world.occupancy, HashOccupancy):
+    occupancy_index = "HASH"
+  else:
+    occupancy_index = "SORTED"
+  metadata = dict(world._metadata(),
+                  checkpoint_version=CHECKPOINT_VERSION,
+                  occupancy_index=occupancy_index,
+                  history_snapshot_every=world.history.snapshot_every)
+  arrays = dict(metadata=np.frombuffer(json.dumps(metadata).encode(),
+                                       dtype=np.uint8))
+  parts = [("field", world.field.to_arrays()),
+           ("creatures", _creature_arrays(world))]
+  if history:
+    parts.append(("history", world.history.to_arrays()))
+  for part, part_arrays in parts:
+    for name, values in part_arrays.items():
+      arrays[part + "." + name] = values
+  return arrays
+
+def load(file_name, world_class):
+  """Loads a world from a checkpoint file (see World.load_checkpoint).
+
+  Arguments:
+    file_name: string; The checkpoint file.
+    world_class: class; World (passed in, as world.py imports this module).
+  Returns:
+    World; In memory, exactly as it was saved.
+  """
+  return _load(file_name, world_class, file_name)
+
+def loads(data, world_class):
+  """Loads a world from the bytes of dumps (see load)."""
+  return _load(io.BytesIO(data), world_class, "The data")
+
+def _load(source, world_class, name):
+  """Loads a world from the checkpoint in source (a file name or object)."""
+  with np.load(source) as data:
+    arrays = {key: data[key] for key in data.files}
+  return from_arrays(arrays, world_class, name=name)
+
+def from_arrays(arrays, world_class, copy=True, name="The checkpoint"):
+  """Builds a world from the entries of to_arrays (see load).
+
+  Arguments:
+    arrays: {string: np.array}; The entries.
+    world_class: class; World.
+    copy: bool; Copy the field's and population's arrays into memory? If
+      not, the world works on the arrays themselves (see forks.py).
+    name: string; What to call the arrays in errors.
+  Returns:
+    World; Exactly as it was saved (with MEMORY storage).
+  """
+  metadata = json.loads(np.asarray(arrays["metadata"]).tobytes())
+  if metadata.get("checkpoint_version") != CHECKPOINT_VERSION:
+    raise ValueError(
+        name + " is a version " + str(metadata.get("checkpoint_version")) +
+        " checkpoint, expected " + str(CHECKPOINT_VERSION))
+  parts = {"field": {}, "creatures": {}, "history": {}}
+  for key, values in arrays.items():
+    if key != "metadata":
+      part, entry = key.split(".", 1)
+      parts[part][entry] = values
+
+  world = world_class._from_metadata(metadata)
+  world.storage = "MEMORY"
+  world.storage_dir = None
+  diet_types = metadata["diet_types"]
+  if "chunk_size" in parts["field"]:
+    world.field = ChunkedField.from_arrays(parts["field"], rng=world.rng,
+                                           copy=copy)
+  else:
+    world.field = Field.from_arrays(parts["field"], rng=world.rng, copy=copy)
+  field_size = world.field.field_size
+  if world.engine == "OBJECTS":
+    world.population = None
+    with _holding_off_gc():
+      world._creatures = _creature_objects(parts["creatures"], diet_types)
+      if metadata["occupancy_index"] == "DENSE":
+        world.occupancy = DenseOccupancy(field_size)
+      else:
+        world.occupancy = HashOccupancy(field_size)
+      for creature in world._creatures:
+        world.occupancy.add(creature)
+  else:
+    world.population = Population.from_arrays(parts["creatures"],
+                                              diet_types=diet_types,
+                                              copy=copy)
+    world.occupancy = SortedOccupancy(field_size, world.population)
+  snapshot_every = metadata["history_snapshot_every"]
+  if parts["history"]:
+    world.history = History.from_arrays(parts["history"], diet_types,
+                                        snapshot_every=snapshot_every)
+  else:
+    world.history = History(diet_types, snapshot_every=snapshot_every)
+  return world
+
+def _upgrade_creature(creature):
+  """Gives a Creature unpickled from before traits its speed and metabolism."""
+  for name in ("speed", "metabolism"):
+    if name not in vars(creature):
+      setattr(creature, name, MUTATION_TRAITS[creature.mutation][name])
+  return creature
+
+def _upgrade(old):
+  """Rebuilds a World pickled by the original, object-only World.
+
+  Those worlds had a creatures list, a dense creatures_by_loc, a field
+  without its own random numbers and a list of DailyHistory for history.
+  The new world gets a fresh seed (the old ones drew from np.random). Their
+  DailyHistory creature_lists hold the creatures as they were when the world
+  was pickled, not as they were that day, so the age and food stored
+  histograms are only filled in for the last day.
+  """
+  state = vars(old)
+  old_field = state["field"]
+  world = type(old)(old_field.field_size,
+                    state["food_fill_factor"],
+                    0,
+                    field_has_boundaries=old_field.has_boundaries,
+                    food_spoils=state["food_spoils"])
+  world.field.food_grid[:] = old_field.food_grid
+  world.field.recount()
+  world.add_creatures([_upgrade_creature(x) for x in state["creatures"]])
+  world.days_passed = state["days_passed"]
+  diet_types = world.trophic_table.diet_types
+
+  world.history = History(diet_types)
+  for i, day in enumerate(state["history"]):
+    creatures = [_upgrade_creature(x) for x in day.creature_list]
+    columns = {name: np.array([getattr(x, name) for x in creatures])
+               for name in TRAITS}
+    last = i == len(state["history"]) - 1
+    columns["food_stored"] = np.array(
+        [x.food_stored for x in creatures] if last else [], dtype=float)
+    columns["age"] = np.array([x.age for x in creatures] if last else [],
+                              dtype=np.int64)
+    world.history.record(
+        Stats(day=day.day,
+              num_creatures=day.num_creatures,
+              diet_counts={name: sum(x.diet_type == name for x in creatures)
+                           for name in diet_types},
+              mutation_counts={name: sum(x.mutation == name
+                                         for x in creatures)
+                               for name in MUTATIONS},
+              num_births=day.num_births,
+              num_deaths=day.num_deaths,
+              food_on_field=day.food_on_field,
+              total_food_stored=day.total_food_stored),
+        columns)
+  if state["history"]:
+    world.counters.num_births = state["history"][-1].num_births
+    world.counters.num_deaths = state["history"][-1].num_deaths
+  return world
+
+def import_pickle(pickle_file, file_name):
+  """Turns a pickled World into a checkpoint, once and for all.
+
+  Handles worlds pickled by the scripts before checkpoints existed: current
+  ones, ones from before the running counters (see counters.py), which are
+  counted up, and ones from the original object-only World, which are
+  rebuilt (see _upgrade).
+
+  Arguments:
+    pickle_file: string; The pickled world (e.g. my_world.pkl).
+    file_name: string; Where to save the checkpoint.
+  Returns:
+    World; The world, as loaded (and saved).
+  """
+  with open(pickle_file, "rb") as f:
+    world = pickle.load(f)
+  state = vars(world)
+  if "engine" not in state:
+    world = _upgrade(world)
+  elif "counters" not in state:
+    world.counters = Counters(world.trophic_table.diet_types)
+    world.recount()
+  save(world, file_name)
+  return world
@@ -0,0 +1,77 @@
+import collections
+
+import numpy as np
+
+from population import MUTATIONS
+
+# A world's vital statistics at a glance (see World.stats).
+#   day: int; Days passed.
+#   num_creatures: int; Creatures in the world.
+#   diet_counts: {string: int}; Creatures of each diet type.
+#   mutation_counts: {string: int}; Creatures with each mutation.
+#   num_births: int; Babies born today.
+#   num_deaths: int; Creatures that died today (counted when they're removed,
+#     at the end of the day).
+#   food_on_field: float; Food on the field.
+#   total_food_stored: float; Food stored by all the creatures.
+Stats = collections.namedtuple(
+    'Stats',
+    ['day',
+     'num_creatures',
+     'diet_counts',
+     'mutation_counts',
+     'num_births',
+     'num_deaths',
+     'food_on_field',
+     'total_food_stored']
+)
+
+class Counters:
+  """Running totals of who's in a world, kept up to date as things happen.
+
+  The world adjusts these as creatures are added, born, grab food, eat each
+  other, eat and die, so reading them never needs a pass over the creatures.
+  Anything that changes the creatures behind the world's back (like setting
+  food_stored by hand) should be followed by World.recount.
+
+  Arguments:
+    diet_types: [string]; Names of the diet codes being counted.
+
+  Attributes:
+    diet_counts: int array; Creatures of each diet code.
+    mutation_counts: int array; Creatures with each mutation (see MUTATIONS).
+    food_stored: float; Food stored by all the creatures.
+    num_births: int; Babies born today.
+    num_deaths: int; Creatures removed (dead) today.
+  """
+  def __init__(self, diet_types):
+    self.diet_types = list(diet_types)
+    self.diet_counts = np.zeros(len(self.diet_types), dtype=np.int64)
+    self.mutation_counts = np.zeros(len(MUTATIONS), dtype=np.int64)
+    self.food_stored = 0.0
+    self.num_births = 0
+    self.num_deaths = 0
+
+  def add(self, diet, mutation, food_stored=0):
+    """Counts in creatures (one, or a batch as arrays of their codes)."""
+    np.add.at(self.diet_counts, diet, 1)
+    np.add.at(self.mutation_counts, mutation, 1)
+    self.food_stored += float(np.sum(food_stored))
+
+  def remove(self, diet, mutation, food_stored=0):
+    """Counts out creatures (one, or a batch as arrays of their codes)."""
+    np.subtract.at(self.diet_counts, diet, 1)
+    np.subtract.at(self.mutation_counts, mutation, 1)
+    self.food_stored -= float(np.sum(food_stored))
+
+  def recount(self, diet, mutation, food_stored):
+    """Starts over from every creature's diet and mutation codes and food."""
+    self.diet_counts[:] = 0
+    self.mutation_counts[:] = 0
+    self.food_stored = 0.0
+    self.add(diet, mutation, food_stored)
+
+  def new_day(self):
+    """Starts counting today's births and deaths from 0."""
+    self.num_births = 0
+    self.num_deaths = 0
@@ -1,5 +1,7 @@
 import numpy as np
 
+from traits import MUTATION_TRAITS
+
 class Creature:
   """ Creates a creature object with specified location and mutation chars.
 
@@ -9,7 +11,11 @@ class Creature:
     NORMAL: takes 1 step, eats 1 food (+1 more to reproduce).
     SPEEDY: takes 2 steps, eats 1 food (+1 more to reproduce).
     EFFICIENT: takes 1 step, eats 0.5 food (0.5 more to reproduce).
-  They have a diet type:
+  A mutation just sets the creature's speed and metabolism traits, which are
+  numbers in their own right and can drift from generation to generation (see
+  traits.py).
+  They have a diet type, and their world's TrophicTable says what each diet
+  eats. The default food chain is
     HERBIVORE: Eats food that grows on the field.
     CARNIVORE: Eats creatures with diet_type HERBIVORE.
     SUPER_CARNIVORE: Eats creatures with diet_type CARNIVORE.
@@ -19,9 +25,11 @@ class Creature:
     mutation: string; See supported mutations above.
     reproduction_mutation_chance: float; [0, 1] chance the creature will mutate
       on reproducing.
-    diet_type: string; See supported diet types above.
+    diet_type: string; See diet types above (or the world's TrophicTable).
     randomly_teleports: bool; does the creature teleport randomly at end of day?
     meat_value: float; Food value to predators.
+    speed: int; Spaces moved per step. Defaults to the mutation's.
+    metabolism: float; Food eaten each day. Defaults to the mutation's.
 
   Other attributes:
     food_stored: float; Amount of food the creature has currently.
@@ -35,7 +43,9 @@ class Creature:
                reproduction_mutation_chance=0,
                diet_type="HERBIVORE",
                randomly_teleports=False,
-               meat_value=2):
+               meat_value=2,
+               speed=None,
+               metabolism=None):
     self.location = location
     self.food_stored = 0
     self.mutation = mutation
@@ -45,34 +55,37 @@ class Creature:
     self.randomly_teleports = randomly_teleports
     self.is_alive = True
     self.meat_value = meat_value
+    self.speed = (MUTATION_TRAITS[mutation]["speed"] if speed is None
+                  else speed)
+    self.metabolism = (MUTATION_TRAITS[mutation]["metabolism"]
+                       if metabolism is None else metabolism)
 
     # udlr = up, down, left, right - choices for movement.
     self._udlr = [[0,1], [0,-1], [-1,0], [1,0]]
 
-  def move_and_grab(self, world):
+  def move_and_grab(self, world, direction=None):
     """Move through the world and store any food you find.
 
-    Most creatures move 1 space in random dir., fast creatures move 2 spaces.
+    Creatures move speed spaces in a random dir. (most 1, speedy ones 2).
 
     Arguments:
       world: world; Other creatures and a field to interact with.
+      direction: int; Index into up, down, left, right to move in. Drawn from
+        world.rng if not given.
     """
-    direction = self._udlr[np.random.choice(4)]
+    if direction is None:
+      direction = world.rng.integers(4)
+    direction = self._udlr[direction]
 
     # Dead dudes can't move (or grab). :(
     if not self.is_alive:
       return
 
-    # Normal creatures move 1.
-    steps_to_take = 1
-    # Speedy creatures get a boost.
-    if self.mutation == "SPEEDY":
-      steps_to_take = 2
+    # Normal creatures move 1; speedy creatures get a boost.
+    steps_to_take = self.speed
 
     # Pick yourself up off where you're standing.
-    world.creatures_by_loc[self.location[0]][self.location[1]] = [
-      x for x in world.creatures_by_loc[self.location[0]][self.location[1]]
-      if x != self]
+    world.occupancy.remove(self)
 
     for i in range(steps_to_take):
       if world.field.has_boundaries:
@@ -101,38 +114,37 @@ class Creature:
           self.location[1] = self.location[1] - world.field.field_size
 
       # Grab all the food from the field at this new location and store it.
-      if self.diet_type == "HERBIVORE":
-        self.food_stored += world.field.remove_food(self.location)
-      elif self.diet_type == "CARNIVORE":
-        for prey in [
-            x for x in world.creatures_by_loc[self.location[0]][self.location[1]]
-            if x.diet_type == "HERBIVORE" and x.is_alive]:
-          if self.location == prey.location:
-            prey.is_alive = False
-            self.food_stored += prey.meat_value
-      elif self.diet_type == "SUPER_CARNIVORE":
-        for prey in [
-            x for x in world.creatures_by_loc[self.location[0]][self.location[1]]
-            if x.diet_type == "CARNIVORE" and x.is_alive]:
-          if self.location == prey.location:
-            prey.is_alive = False
-            self.food_stored += prey.meat_value
+      # (The world keeps a running total of everybody's food, too.)
+      if world.trophic_table.grabs_food(self.diet_type):
+        food = world.field.remove_food(self.location)
+        self.food_stored += food
+        world.counters.food_stored += food
+      # And eat everybody here that's on the menu. (Check they really are
+      # here: the index is only as good as its bookkeeping.)
+      for prey in [
+          x for x in world.occupancy.at(self.location)
+          if x.is_alive and x.location == self.location and
+          world.trophic_table.predator_eats(self.diet_type, x.diet_type)]:
+        prey.is_alive = False
+        self.food_stored += prey.meat_value
+        world.counters.food_stored += prey.meat_value
 
     # And settle into your new location.
-    world.creatures_by_loc[self.location[0]][self.location[1]].append(self)
+    world.occupancy.add(self)
 
   def eat_die_reproduce(self, world):
     """Creatures eat, possibly die, and possibly reproduce depending on food.
 
-    Most creatures require 1 food to eat, 1 food to reproduce.  They die if they
-    cannot eat. EFFICIENT creatures require 0.5 food to eat/reproduce.
+    Creatures require metabolism food to eat, and as much again to reproduce.
+    They die if they cannot eat. Most creatures need 1 food to eat/reproduce,
+    EFFICIENT creatures 0.5.
 
     Returns: (survived, babies)
       babies: [creatures]; A list of creatures resulting from reproduction
     """
     # Got a little bit older.
     self.age += 1
-    food_required = (0.5 if self.mutation=="EFFICIENT" else 1)
+    food_required = self.metabolism
     # Eat, if you can (die if you can't.)
     self._eat(food_required)
     if not self.is_alive or self.food_stored < food_required:
@@ -163,35 +175,60 @@ class Creature:
       [creature] length 1; A single (possibly mutated) offspring.
     """
     self.food_stored -= food_required
+    mutation = self._get_mutation(self.reproduction_mutation_chance, world.rng)
+    # Babies take after their parent, unless they mutated into something else.
+    if mutation == self.mutation:
+      speed, metabolism = self.speed, self.metabolism
+    else:
+      speed = MUTATION_TRAITS[mutation]["speed"]
+      metabolism = MUTATION_TRAITS[mutation]["metabolism"]
+    traits = dict(
+        speed=np.array([speed]),
+        metabolism=np.array([metabolism], dtype=float),
+        meat_value=np.array([self.meat_value], dtype=float),
+        reproduction_mutation_chance=np.array(
+            [self.reproduction_mutation_chance], dtype=float))
+    world.trait_drift.drift(traits, world.rng)
     return [
         Creature(
           location=self.location.copy(),
-          mutation=self._get_mutation(self.reproduction_mutation_chance),
-          reproduction_mutation_chance=self.reproduction_mutation_chance,
+          mutation=mutation,
+          reproduction_mutation_chance=traits[
+              'reproduction_mutation_chance'].item(),
           diet_type=self.diet_type,
-          randomly_teleports=self.randomly_teleports
+          randomly_teleports=self.randomly_teleports,
+          meat_value=traits['meat_value'].item(),
+          speed=traits['speed'].item(),
+          metabolism=traits['metabolism'].item()
         )
     ]
 
-  def _get_mutation(self, mutation_chance):
+  def _get_mutation(self, mutation_chance, rng):
     """Mutates randomly (perhaps to own species) w/ prob mutation_chance.
 
     Arguments:
       mutation_chance: float; Chance to mutate.
+      rng: np.random.Generator; Random numbers to roll the dice with.
     Returns:
       mutation: string; see list of acceptable mutations above.
     """
-    if np.random.rand() < mutation_chance:
-      return np.random.choice(['NORMAL', 'EFFICIENT', 'SPEEDY'])
+    if mutation_chance > 0 and rng.random() < mutation_chance:
+      return ['NORMAL', 'EFFICIENT', 'SPEEDY'][rng.integers(3)]
     return self.mutation
 
-  def maybe_teleport(self, world):
+  def maybe_teleport(self, world, destination=None):
     """If the creature teleports, teleport randomly to somewhere in the world.
 
     Arguments:
       world: world; The world to teleport to.
+      destination: list of length 2; Where to teleport to. Drawn at random
+        from world.rng if not given.
     """
     if not self.randomly_teleports:
       return
 
-    self.location = list(np.random.choice(range(world.field.field_size), 2))
\ No newline at end of file
+    if destination is None:
+      destination = list(world.rng.integers(world.field.field_size, size=2))
+    world.occupancy.remove(self)
+    self.location = destination
+    world.occupancy.add(self)
\ No newline at end of file
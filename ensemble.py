@@ -0,0 +1,323 @@
+import numpy as np
+
+from field import Field
+from history import DailyHistory
+import kernels
+from population import MUTATIONS, Population
+import streams
+from traits import TraitDrift
+from trophic import DEFAULT_TROPHIC_TABLE
+
+# The ensemble's books: each column has a row per day and an entry per
+# replicate, like a History's columns.
+#   day: int (days,); Days passed.
+#   num_creatures: int (days, replicates); Creatures at the end of the day.
+#   total_food_stored: float (days, replicates); Food stored by all the
+#     creatures.
+#   num_births: int (days, replicates); Babies born today.
+#   num_deaths: int (days, replicates); Creatures that died today.
+#   food_on_field: float (days, replicates); Food left on the field.
+#   mutation_counts: int (days, replicates, len(MUTATIONS)); Creatures with
+#     each mutation.
+ENSEMBLE_COLUMNS = [
+    ("num_creatures", np.int64, ()),
+    ("total_food_stored", np.float64, ()),
+    ("num_births", np.int64, ()),
+    ("num_deaths", np.int64, ()),
+    ("food_on_field", np.float64, ()),
+    ("mutation_counts", np.int64, (len(MUTATIONS),)),
+]
+
+# What each of a day's random numbers is for (hashed in with the day).
+_PLACE, _MOVE, _BABIES, _SPROUT, _TELEPORT = range(5)
+
+def _column_property(name):
+  """A read-only property exposing the recorded days of one column."""
+  def getter(self):
+    return self._columns[name][:self.num_days]
+  return property(getter)
+
+class Ensemble:
+  """Lots of replicates of a small world, all passing their days together.
+
+  Estimating, say, how likely a population is to survive takes many small
+  replicate worlds, and a World per replicate pays Python's overhead per
+  replicate, every day. An Ensemble keeps every replicate's creatures in one
+  Population and every replicate's field in one tall food grid (replicate
+  r's field is rows r*field_size to (r + 1)*field_size), so a day is the
+  same handful of array operations however many replicates there are: the
+  creatures of all of them walk with kernels.herbivore_day (each around its
+  own field), eat, die and reproduce with kernels.eat_die_reproduce, and
+  the fields sprout all at once. A creature's replicate is just its row of
+  the grid // field_size, so babies (born where their parent stands) and
+  the survivors of a compaction keep theirs without any bookkeeping.
+
+  A replicate follows the same rules as a World with the TRAJECTORIES engine
+  (the same kernels, in the same order), so the statistics are the same.
+  Nobody eats anybody: all creatures are HERBIVOREs.
+
+  Every replicate has its own random numbers. Replicate r gets a key from
+  seed.spawn(num_replicates)[r], and each of its random numbers is a hash of
+  that key, the day, what the number is for and the creature drawing it (its
+  place among its replicate's creatures, which only that replicate's own
+  history decides; see streams.py). So a replicate's fate depends on the
+  seed and r alone: replicate r plays out the same in an ensemble of any
+  size (with at least r + 1 replicates), and the whole ensemble still
+  replays exactly from its seed. A generator per replicate would bring back
+  a Python loop per replicate for every draw.
+
+  Once a replicate dies out it's done: its field stops sprouting (it still
+  spoils), so extinct replicates cost next to nothing.
+
+  Arguments:
+    num_replicates: int; How many replicate worlds.
+    field_size, food_fill_factor, num_initial_creatures, creature_mutation,
+    creature_reproduction_mutation_prob, creatures_randomly_teleport,
+    field_has_boundaries, food_spoils, creature_meat_value, trait_drift,
+    seed: As for World, for every replicate.
+
+  Attributes:
+    num_days: int; Days recorded in the books (days_passed + 1).
+    And the books (see ENSEMBLE_COLUMNS).
+  """
+  day = _column_property('day')
+  num_creatures = _column_property('num_creatures')
+  total_food_stored = _column_property('total_food_stored')
+  num_births = _column_property('num_births')
+  num_deaths = _column_property('num_deaths')
+  food_on_field = _column_property('food_on_field')
+  mutation_counts = _column_property('mutation_counts')
+
+  def __init__(self,
+               num_replicates,
+               field_size,
+               food_fill_factor,
+               num_initial_creatures,
+               creature_mutation="NORMAL",
+               creature_reproduction_mutation_prob=0,
+               creatures_randomly_teleport=False,
+               field_has_boundaries=False,
+               food_spoils=False,
+               creature_meat_value=2,
+               trait_drift=None,
+               seed=None):
+    if num_initial_creatures > field_size**2:
+      raise ValueError("Can't fit " + str(num_initial_creatures) +
+                       " creatures on a field of size " + str(field_size))
+    self.num_replicates = num_replicates
+    self.food_fill_factor = food_fill_factor
+    self.food_spoils = food_spoils
+    self.trait_drift = trait_drift or TraitDrift()
+    self.trophic_table = DEFAULT_TROPHIC_TABLE
+    if not isinstance(seed, np.random.SeedSequence):
+      seed = np.random.SeedSequence(seed)
+    self.seed_sequence = seed
+    self._keys = streams.replicate_keys(seed, num_replicates)
+    # One tall grid of every replicate's field.
+    self.field = Field(field_size, has_boundaries=field_has_boundaries,
+                       num_stacked=num_replicates)
+    self.sprout(np.ones(num_replicates, dtype=bool), 0)
+
+    self.population = Population(
+        capacity=num_replicates*num_initial_creatures,
+        diet_types=self.trophic_table.diet_types)
+    replicate = np.arange(num_replicates)
+    spots = self._random_spots(replicate, num_initial_creatures, 0, _PLACE)
+    x, y = np.divmod(spots, field_size)
+    x += self._first_rows(replicate)[:, None]
+    self.population.append(
+        np.stack([x.ravel(), y.ravel()], axis=1),
+        mutation=MUTATIONS.index(creature_mutation),
+        reproduction_mutation_chance=creature_reproduction_mutation_prob,
+        randomly_teleports=creatures_randomly_teleport,
+        meat_value=creature_meat_value)
+
+    self.days_passed = 0
+    self.num_days = 0
+    self._columns = {
+        name: np.zeros((64, num_replicates) + shape, dtype=dtype)
+        for name, dtype, shape in ENSEMBLE_COLUMNS
+    }
+    self._columns["day"] = np.zeros(64, dtype=np.int64)
+
+  @property
+  def field_size(self):
+    return self.field.field_size
+
+  def _first_rows(self, replicate):
+    """The first row of the grid of each of the replicates."""
+    return replicate*self.field_size
+
+  def replicates(self):
+    """The replicate of each creature (int array)."""
+    return self.population.location[:, 0]//self.field_size
+
+  def _creature_keys(self, day, purpose):
+    """Keys for each creature's random numbers of the day (uint64 array).
+
+    A creature is known by its replicate and its place among its
+    replicate's creatures (rows keep their order within a replicate).
+    """
+    replicate = self.replicates()
+    counts = np.bincount(replicate, minlength=self.num_replicates)
+    order = np.argsort(replicate, kind='stable')
+    place = np.empty(len(replicate), dtype=np.int64)
+    place[order] = (np.arange(len(replicate)) -
+                    (np.cumsum(counts) - counts)[replicate[order]])
+    return streams.hash_words(self._keys[replicate], day, purpose, place)
+
+  def _moves(self, keys):
+    """Draws a day's moves for herbivore_day from each creature's key."""
+    def moves(steps, num, max_draws):
+      block_steps = max(1, max_draws//max(num, 1))
+      for first_step in range(0, steps, block_steps):
+        step = np.arange(first_step, min(first_step + block_steps, steps))
+        bits = streams.hash_words(keys[None, :], step[:, None])
+        # The top two bits pick the direction, the rest the move order.
+        yield (first_step, (bits >> np.uint64(62)).astype(np.int8),
+               bits << np.uint64(2))
+    return moves
+
+  def _random_spots(self, replicate, num_spots, day, purpose):
+    """num_spots distinct spots (numbered x*field_size + y) on the fields of
+    the replicates, as an int array (len(replicate), num_spots)."""
+    if num_spots == 0:
+      return np.zeros((len(replicate), 0), dtype=np.int64)
+    keys = streams.hash_words(self._keys[replicate][:, None], day, purpose,
+                              np.arange(self.field_size**2)[None, :])
+    return np.argpartition(keys, num_spots - 1, axis=1)[:, :num_spots]
+
+  def sprout(self, which, day, food_value=1):
+    """Sprouts food on the fields of the replicates flagged in which.
+
+    Each field gets ceil(field_size**2*food_fill_factor) spots of food, as a
+    World's does.
+
+    Arguments:
+      which: bool array (num_replicates,); Which replicates to sprout.
+      day: int; Whose random numbers to use (0 before the first day).
+      food_value: float; How much food to add to each spot.
+    """
+    replicate = np.flatnonzero(which)
+    num_spots = int(np.ceil(self.field_size**2*self.food_fill_factor))
+    spots = self._random_spots(replicate, num_spots, day, _SPROUT)
+    x, y = np.divmod(spots, self.field_size)
+    x += self._first_rows(replicate)[:, None]
+    self.field.add_food(x.ravel(), y.ravel(), food_value)
+
+  def extinct(self):
+    """Which replicates have died out (bool array)."""
+    if self.num_days == 0:
+      return np.bincount(self.replicates(),
+                         minlength=self.num_replicates) == 0
+    return self.num_creatures[-1] == 0
+
+  def pass_day(self, steps_in_day):
+    """Every replicate passes a day (see World.pass_day).
+
+    Arguments:
+      steps_in_day: int; Number of steps in the day.
+    """
+    if self.days_passed == 0:
+      # Record starting state (0 births or deaths).
+      self._record_history(np.zeros(self.num_replicates, dtype=np.int64),
+                           np.zeros(self.num_replicates, dtype=np.int64))
+    population = self.population
+    day = self.days_passed + 1
+
+    # Go, little dudes, go!! (Each around their own field.)
+    kernels.herbivore_day(population, self.field, steps_in_day, None,
+                          self.trophic_table,
+                          rows=self._first_rows(self.replicates()),
+                          moves=self._moves(self._creature_keys(day, _MOVE)))
+
+    # Eat and reproduce, if you can, my dudes!
+    num_before = len(population)
+    babies_keys = self._creature_keys(day, _BABIES)
+    kernels.eat_die_reproduce(
+        population, None, self.trait_drift,
+        babies_rng=lambda parents: streams.KeyedDraws(babies_keys[parents]))
+    replicate = self.replicates()
+    births = np.bincount(replicate[num_before:],
+                         minlength=self.num_replicates)
+
+    # Goodbye, loyal dudes! :(
+    deaths = np.bincount(replicate[~population.is_alive],
+                         minlength=self.num_replicates)
+    population.compact(population.is_alive)
+
+    # Spoil food if we need to.
+    if self.food_spoils:
+      self.field.spoil()
+      population.food_stored = 0
+
+    # The land is fertile (where there's anybody left)! :)
+    replicate = self.replicates()
+    self.sprout(np.bincount(replicate, minlength=self.num_replicates) > 0, day)
+
+    # Everybody who can teleport, does (somewhere on their own field).
+    jumpers = np.flatnonzero(population.randomly_teleports)
+    bits = self._creature_keys(day, _TELEPORT)[jumpers]
+    destinations = np.stack([streams.below(bits, self.field_size),
+                             streams.below(streams.mix(bits), self.field_size)],
+                            axis=1)
+    destinations[:, 0] += self._first_rows(replicate[jumpers])
+    population.location[jumpers] = destinations
+    population.moved()
+
+    # Long day...
+    self.days_passed += 1
+    self._record_history(births, deaths)
+
+  def _record_history(self, births, deaths):
+    """Records a row of the books, for every replicate at once."""
+    if self.num_days == len(self._columns["day"]):
+      for name, column in self._columns.items():
+        grown = np.zeros((2*len(column),) + column.shape[1:],
+                         dtype=column.dtype)
+        grown[:self.num_days] = column
+        self._columns[name] = grown
+    population = self.population
+    replicate = self.replicates()
+    num_replicates = self.num_replicates
+    row = dict(
+        num_creatures=np.bincount(replicate, minlength=num_replicates),
+        total_food_stored=np.bincount(replicate,
+                                      weights=population.food_stored,
+                                      minlength=num_replicates),
+        num_births=births,
+        num_deaths=deaths,
+        food_on_field=self.field.food_grid.reshape(
+            num_replicates, -1).sum(axis=1),
+        mutation_counts=np.bincount(
+            replicate*len(MUTATIONS) + population.mutation,
+            minlength=num_replicates*len(MUTATIONS)).reshape(
+                num_replicates, len(MUTATIONS)))
+    self._columns["day"][self.num_days] = self.days_passed
+    for name, values in row.items():
+      self._columns[name][self.num_days] = values
+    self.num_days += 1
+
+  def history(self, replicate):
+    """One replicate's books, as the DailyHistory rows of a World's.
+
+    Arguments:
+      replicate: int; Which replicate.
+    Returns:
+      [DailyHistory]; A row per day (without creature lists).
+    """
+    return [DailyHistory(day=day,
+                         num_creatures=num_creatures,
+                         total_food_stored=total_food_stored,
+                         num_births=num_births,
+                         num_deaths=num_deaths,
+                         food_on_field=food_on_field,
+                         creature_list=None)
+            for day, num_creatures, total_food_stored, num_births,
+            num_deaths, food_on_field in zip(
+                self.day.tolist(),
+                self.num_creatures[:, replicate].tolist(),
+                self.total_food_stored[:, replicate].tolist(),
+                self.num_births[:, replicate].tolist(),
+                self.num_deaths[:, replicate].tolist(),
+                self.food_on_field[:, replicate].tolist())]
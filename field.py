@@ -5,6 +5,109 @@ matplotlib.use('Agg')
 from matplotlib import pyplot as plt
 
 import SET_ME
+import storage
+from streams import GOLDEN, mix
+
+def _check_sprout(field, food_fill_factor, food_value,
+                  low_grid_x_index, high_grid_x_index,
+                  low_grid_y_index, high_grid_y_index):
+  """Checks the arguments of sprout make sense for field.
+
+  Returns:
+    (low_x, high_x, low_y, high_y); The section to sprout, with the high
+      indices' default of 0 replaced by the field size.
+  """
+  # Check food_fill_factor makes sense.
+  if food_fill_factor < 0 or food_fill_factor > 1:
+    raise ValueError(
+      "food_fill_factor must be between 0 and 1, got " + str(food_fill_factor)
+    )
+  if (np.issubdtype(field.dtype, np.integer) and
+      food_value != int(food_value)):
+    raise ValueError(
+      "A " + str(field.dtype) + " field can't hold food_value " +
+      str(food_value) + "; use a float dtype for fractional food."
+    )
+
+  # High grid index defaults to 0, which is interpreted at the field size.
+  if high_grid_x_index == 0:
+    high_grid_x_index = field.field_size
+  if high_grid_y_index == 0:
+    high_grid_y_index = field.field_size
+  if not (0 <= low_grid_x_index < high_grid_x_index <= field.field_size and
+          0 <= low_grid_y_index < high_grid_y_index <= field.field_size):
+    raise ValueError(
+      "Section [" + str(low_grid_x_index) + ", " + str(high_grid_x_index) +
+      ") x [" + str(low_grid_y_index) + ", " + str(high_grid_y_index) +
+      ") is not inside a field of size " + str(field.field_size)
+    )
+  return (low_grid_x_index, high_grid_x_index,
+          low_grid_y_index, high_grid_y_index)
+
+def _add_food(grid, spots, food_value):
+  """Adds food_value to grid at the (distinct) spots, all in one go.
+
+  The spots are distinct, so a plain fancy-indexed += is a proper scatter-add.
+  Integer grids top out at the biggest number they can hold rather than wrap
+  around.
+
+  Arguments:
+    grid: np.array; Food to add to, in place.
+    spots: tuple of int arrays; Index of each spot in grid.
+    food_value: float; How much food to add to each spot.
+  Returns:
+    float; How much food was actually added (less than food_value per spot
+      where an integer grid topped out).
+  """
+  if np.issubdtype(grid.dtype, np.integer):
+    most = np.iinfo(grid.dtype).max
+    before = grid[spots]
+    after = np.minimum(before, most - food_value) + food_value
+    grid[spots] = after
+    return float((after - before.astype(np.int64)).sum())
+  grid[spots] += food_value
+  return float(len(spots[0])*food_value)
+
+def _check_blocks(field, block_size, section):
+  """Checks the arguments of block_food make sense for field.
+
+  Returns:
+    (low_x, high_x, low_y, high_y); The section, the whole field by default.
+  """
+  if block_size < 1 or block_size != int(block_size):
+    raise ValueError("block_size must be a whole number >= 1, got " +
+                     str(block_size))
+  if section is None:
+    return (0, field.field_size, 0, field.field_size)
+  low_x, high_x, low_y, high_y = section
+  if not (0 <= low_x < high_x <= field.field_size and
+          0 <= low_y < high_y <= field.field_size):
+    raise ValueError("Section " + str(section) +
+                     " is not inside a field of size " +
+                     str(field.field_size))
+  return tuple(section)
+
+def _block_edges(low, high, block_size):
+  """Edges of the blocks tiling [low, high) (the last block may be short)."""
+  return np.minimum(np.arange(low, high + block_size, block_size), high)
+
+def _block_sum(grid, block_size):
+  """Sums grid over block_size x block_size blocks.
+
+  Works a band of rows at a time, so a memory-mapped grid is never read in
+  all at once.
+  """
+  x_starts = np.arange(0, grid.shape[0], block_size)
+  y_starts = np.arange(0, grid.shape[1], block_size)
+  total = np.zeros((len(x_starts), len(y_starts)))
+  rows_per_band = block_size*max(1, 2**22//(block_size*grid.shape[1]))
+  for start in range(0, grid.shape[0], rows_per_band):
+    band = grid[start:start + rows_per_band]
+    band = np.add.reduceat(band, np.arange(0, len(band), block_size), axis=0,
+                           dtype=np.float64)
+    first = start//block_size
+    total[first:first + len(band)] = np.add.reduceat(band, y_starts, axis=1)
+  return total
 
 class Field:
   """Create a field object which is a square 2D lattice with food on it.
@@ -17,17 +120,108 @@ class Field:
     has_boundaries: Bool; Does the field have boundaries? Creatures that run off
       the edge of a field without boundaries will appear on the opposite edge.
       Defaults to False (field w/ no boundaries).
+    rng: np.random.Generator; Random numbers used to sprout food. Defaults to
+      a freshly seeded generator.
+    dtype: np.dtype; Type of the food grid. Defaults to float64; a small type
+      like float32 or uint8 cuts the memory of huge fields by 2-8x. Integer
+      grids only take whole amounts of food, and cap out at the largest
+      number the type can hold instead of overflowing.
+    directory: string; If set, the food grid is a memory-mapped file in this
+      directory (food_grid.npy), so the OS only pages in the parts of the
+      field the creatures are using. See Field.open to pick it back up.
+    num_stacked: int; How many fields to keep, one above the other, in one
+      tall food grid (num_stacked*field_size rows of field_size), e.g. the
+      replicates of an ensemble.Ensemble. A stacked field is fed with
+      add_food: sprout and block_food only know about square fields, so
+      they raise a ValueError.
 
   Additional Attributes:
-    food_grid: np.array; Square array of floating point numbers > 0. Number
-      indicates the amount of food at each location.
+    food_grid: np.array; Square array of numbers >= 0 (tall, if stacked).
+      Number indicates the amount of food at each location. Allocated once;
+      every method updates it in place, so it's safe to hold on to. The
+      field keeps a running total of its food as the methods add and take
+      it, so if you change food_grid yourself, call recount afterwards.
   """
-  def __init__(self, field_size, has_boundaries=False):
+  def __init__(self, field_size, has_boundaries=False, rng=None,
+               dtype=np.float64, directory=None, num_stacked=1):
     self.field_size = field_size
     self.has_boundaries = has_boundaries
-    self.food_grid = np.array(
-      [[0 for x in range(field_size)] for y in range(field_size)]
-    )
+    self.rng = rng if rng is not None else np.random.default_rng()
+    self.directory = directory
+    self.num_stacked = num_stacked
+    shape = (num_stacked*field_size, field_size)
+    if directory is None:
+      self.food_grid = np.zeros(shape, dtype=dtype)
+    else:
+      self.food_grid = storage.create_array(directory, "food_grid", shape,
+                                            dtype)
+    # Running total of the food on the field (see total_food).
+    self._total_food = 0.0
+
+  @classmethod
+  def open(cls, directory, has_boundaries=False, rng=None, total_food=None):
+    """Picks up a field stored in directory (see directory above).
+
+    Arguments:
+      total_food: float; The food on the field, if it was saved along with
+        it. Otherwise it's added up from the file.
+    Returns:
+      Field; Backed by the same file, nothing is read up front (given
+        total_food).
+    """
+    field = cls(0, has_boundaries=has_boundaries, rng=rng)
+    field.food_grid = storage.open_array(directory, "food_grid")
+    field.field_size = field.food_grid.shape[1]
+    field.num_stacked = len(field.food_grid)//max(field.field_size, 1)
+    field.directory = directory
+    if total_food is None:
+      field.recount()
+    else:
+      field._total_food = float(total_food)
+    return field
+
+  def flush(self):
+    """Writes any changes to a stored field out to its file."""
+    if self.directory is not None:
+      self.food_grid.flush()
+
+  def to_arrays(self):
+    """The field as a few named arrays, for a checkpoint (see from_arrays)."""
+    return dict(food_grid=np.asarray(self.food_grid),
+                has_boundaries=np.array(self.has_boundaries),
+                total_food=np.array(self._total_food))
+
+  @classmethod
+  def from_arrays(cls, arrays, rng=None, copy=True):
+    """Builds a field from the arrays of to_arrays.
+
+    Arguments:
+      copy: bool; Copy the food grid into memory? If not, the field works on
+        arrays["food_grid"] itself (see forks.py).
+    """
+    field = cls(0, has_boundaries=bool(arrays["has_boundaries"]), rng=rng)
+    field.food_grid = (np.array(arrays["food_grid"]) if copy
+                       else arrays["food_grid"])
+    field.field_size = field.food_grid.shape[1]
+    field.num_stacked = len(field.food_grid)//max(field.field_size, 1)
+    field._total_food = float(arrays["total_food"])
+    return field
+
+  def reseed(self, rng):
+    """Sprouts food with rng from now on (see forks.py)."""
+    self.rng = rng
+
+  def _check_unstacked(self, method):
+    """Raises a ValueError if this is a stacked field (see num_stacked)."""
+    if self.num_stacked > 1:
+      raise ValueError(
+        "Can't " + method + " a field of " + str(self.num_stacked) +
+        " stacked fields; feed them with add_food instead"
+      )
+
+  @property
+  def dtype(self):
+    return self.food_grid.dtype
 
   def sprout(self,
              food_fill_factor,
@@ -52,36 +246,99 @@ class Field:
       upper right corner of the section of field to sprout. Defaults to 0 (which
       is interpreted as self.field_size).
     """
-    # Check food_fill_factor makes sense.
-    if food_fill_factor < 0 or food_fill_factor > 1:
-      raise(
-        "food_fill_factor must be between 0 and 1, got" + str(food_fill_factor)
-      )
-
-    # High grid index defaults to 0, which is interpreted at the field size.
-    if high_grid_x_index == 0:
-      high_grid_x_index = self.field_size
-    if high_grid_y_index == 0:
-      high_grid_y_index = self.field_size
+    self._check_unstacked("sprout")
+    low_grid_x_index, high_grid_x_index, low_grid_y_index, high_grid_y_index = (
+        _check_sprout(self, food_fill_factor, food_value,
+                      low_grid_x_index, high_grid_x_index,
+                      low_grid_y_index, high_grid_y_index))
 
     # Calculate the width and height of the section of field to fill.
     width = (high_grid_x_index-low_grid_x_index)
     height = (high_grid_y_index-low_grid_y_index)
 
-    # Fill the field at random with food_value worth of food.
-    for r in np.random.choice(width*height,
-                              int(np.ceil(width*height*food_fill_factor)),
-                              replace=False):
-      self.food_grid[low_grid_x_index+int(np.floor(r/(width))),
-                     low_grid_y_index+r%(width)] += food_value
+    # Pick the spots to fill at random (each spot at most once), numbered
+    # row by row through the section.
+    spots = self.rng.choice(width*height,
+                            int(np.ceil(width*height*food_fill_factor)),
+                            replace=False)
+    self._total_food += _add_food(self.food_grid,
+                                  (low_grid_x_index + spots//height,
+                                   low_grid_y_index + spots%height),
+                                  food_value)
+
+  def add_food(self, x, y, food_value=1):
+    """Adds food_value at each of the (distinct) spots x, y.
+
+    Arguments:
+      x, y: int arrays; Locations on the field to add food to.
+      food_value: float; How much food to add to each spot.
+    """
+    if (np.issubdtype(self.dtype, np.integer) and
+        food_value != int(food_value)):
+      raise ValueError(
+        "A " + str(self.dtype) + " field can't hold food_value " +
+        str(food_value) + "; use a float dtype for fractional food."
+      )
+    self._total_food += _add_food(self.food_grid, (x, y), food_value)
 
   def spoil(self):
     """ Spoils all food on the field.
 
-    Sets the food grid to statee without food.
+    Sets the food grid to state without food (in place).
+    """
+    self.food_grid.fill(0)
+    self._total_food = 0.0
+
+  def food_at(self, x, y):
+    """Returns the food at each of the spots x, y (int arrays)."""
+    return self.food_grid[x, y]
+
+  def take_food(self, x, y):
+    """Removes all the food at each of the (distinct) spots x, y.
+
+    Arguments:
+      x, y: int arrays; Locations on the field to take food from.
+    Returns:
+      np.array; Amount of food that was removed from each spot.
+    """
+    food = self.food_grid[x, y]
+    self.food_grid[x, y] = 0
+    self._total_food -= float(food.sum())
+    return food
+
+  def total_food(self):
+    """Returns the total amount of food on the field.
+
+    This is a running total, kept up to date by sprout, spoil and taking
+    food, so it costs nothing however big the field is.
+    """
+    return self._total_food
+
+  def recount(self):
+    """Adds up the food on the field from scratch (after editing food_grid).
+
+    Works a band of rows at a time, so a memory-mapped grid is never read in
+    all at once.
+    """
+    rows = max(1, 2**22//max(self.field_size, 1))
+    self._total_food = float(sum(
+        self.food_grid[start:start + rows].sum(dtype=np.float64)
+        for start in range(0, len(self.food_grid), rows)))
+
+  def block_food(self, block_size, section=None):
+    """Totals the food in each block_size x block_size block of the field.
+
+    Arguments:
+      block_size: int; Length of a side of each block, in cells.
+      section: (low_x, high_x, low_y, high_y); Only look at [low_x, high_x) x
+        [low_y, high_y). Defaults to the whole field.
+    Returns:
+      float np.array; Food in each block, starting from the section's low
+        corner (the blocks on the high edges may be cut short).
     """
-    self.food_grid = np.array(
-      [[0 for x in range(self.field_size)] for y in range(self.field_size)])
+    self._check_unstacked("block_food")
+    low_x, high_x, low_y, high_y = _check_blocks(self, block_size, section)
+    return _block_sum(self.food_grid[low_x:high_x, low_y:high_y], block_size)
 
   def remove_food(self, location):
     """Removes all food from the specified location on the field.
@@ -91,8 +348,9 @@ class Field:
     Returns:
       float; Amount of food that was removed.
     """
-    removed_food = self.food_grid[location[0], location[1]]
+    removed_food = self.food_grid[location[0], location[1]].item()
     self.food_grid[location[0], location[1]] = 0
+    self._total_food -= removed_food
     return removed_food
 
   def show_me(self, save_plot=False):
@@ -103,11 +361,402 @@ class Field:
     """
     fig, ax = plt.subplots(1,1, figsize = (6, 6))
     # Plot the grass.
-    ax.spy((self.food_grid-1)*-1, markersize=3, c="palegoldenrod")
+    ax.spy(self.food_grid == 0, markersize=3, c="palegoldenrod")
     # Plot the food.
     ax.spy(self.food_grid, markersize=3, c="g")
     if save_plot:
       fig.savefig(
         '/mnt/c/Users/dmcin/Desktop/projects/simulations/tmp_plots/' +
         datetime.now().strftime("field_%Y%m%d%H%M%S%f.png"), fmt='png')
-      plt.close()
\ No newline at end of file
+      plt.close()
+
+class ChunkedField:
+  """A Field split into square chunks that are only allocated when touched.
+
+  A dense food grid for a 100k x 100k field doesn't fit in memory, but the
+  creatures only ever visit a small part of it. So the field is tiled into
+  chunk_size x chunk_size chunks, and a chunk's food is only worked out the
+  first time somebody looks at it.
+
+  Allocated chunks sprout right away: every spot gets its own random number
+  for each sprout (a hash of the spot, the sprout and the field's seed), and
+  each chunk fills the spots with the smallest numbers, so a chunk's food
+  doesn't depend on which other chunks are allocated. An untouched chunk
+  gets all the food sprouted since the food last spoiled in one go when it's
+  first touched: only how many sprouts of each kind (food_fill_factor,
+  food_value, section) there have been is remembered, and the number of
+  times each spot was picked is drawn all at once from a generator seeded by
+  a hash of the chunk and the field's seed. It's a multivariate
+  hypergeometric draw, so the chunk gets exactly the food it's owed, and for
+  a single sprout each spot is exactly as likely to get food as a replay
+  would make it; over several sprouts the spots' counts are only a close
+  approximation of replaying each sprout in turn. Touching a chunk, like
+  sprouting and spoiling, then costs the same on day 1000 as on day 1, and
+  a day costs time in proportion to the area the creatures are actually
+  using.
+
+  Each chunk gets its own share of the food (rounded up, like a whole Field
+  does), so the total can be a touch more than a dense Field sprouts.
+
+  Has the same methods as Field (and works with both topologies, wrap-around
+  or walls). food_grid is only there for plotting small fields: it allocates
+  every chunk.
+
+  Arguments:
+    field_size: Int; Linear dimension (height or width) of the square field.
+    has_boundaries: Bool; Does the field have boundaries? (see Field)
+    rng: np.random.Generator; Seeds the chunks' random numbers. Defaults to
+      a freshly seeded generator.
+    dtype: np.dtype; Type of the food in each chunk (see Field).
+    chunk_size: int; Length of a side of each chunk.
+
+  Additional Attributes:
+    num_allocated_chunks: int; How many chunks have been touched so far.
+  """
+  def __init__(self, field_size, has_boundaries=False, rng=None,
+               dtype=np.float64, chunk_size=256):
+    self.field_size = field_size
+    self.has_boundaries = has_boundaries
+    self.rng = rng if rng is not None else np.random.default_rng()
+    self.dtype = np.dtype(dtype)
+    self.chunk_size = chunk_size
+    self.num_chunks = -(-field_size//chunk_size)
+    # All of the chunks' random numbers are derived from this.
+    self._entropy = int(self.rng.integers(2**63))
+    # Where in _blocks each chunk lives (-1 while it's untouched).
+    self._slot = np.full((self.num_chunks, self.num_chunks), -1,
+                         dtype=np.int32)
+    self._blocks = np.zeros((0, chunk_size, chunk_size), dtype=self.dtype)
+    self._chunk_xy = np.zeros((0, 2), dtype=np.int64)
+    self.num_allocated_chunks = 0
+    # How many sprouts of each (food_fill_factor, food_value, section) there
+    # have been since the food last spoiled, for the untouched chunks.
+    self._sprouts = {}
+    self._num_sprouts = 0
+    # How much food each untouched chunk has. That doesn't depend on which
+    # spots got it, so it's kept without allocating anything. (It doesn't
+    # know about integer grids topping out, though.)
+    self._untouched_food = np.zeros((self.num_chunks, self.num_chunks))
+    # Running total: the food in the allocated chunks plus _untouched_food
+    # of the rest (see total_food).
+    self._total_food = 0.0
+
+  def to_arrays(self):
+    """The field as a few named arrays, for a checkpoint (see from_arrays).
+
+    Only the allocated chunks are saved, and how many sprouts of each kind
+    the others are owed.
+    """
+    num = self.num_allocated_chunks
+    return dict(
+        field_size=np.array(self.field_size),
+        has_boundaries=np.array(self.has_boundaries),
+        chunk_size=np.array(self.chunk_size),
+        entropy=np.array(self._entropy, dtype=np.int64),
+        slot=self._slot,
+        blocks=self._blocks[:num],
+        chunk_xy=self._chunk_xy[:num],
+        # One row per kind of sprout: how many, food_fill_factor, food_value,
+        # section.
+        sprout_counts=np.array([(count, food_fill_factor, food_value) +
+                                tuple(section)
+                                for (food_fill_factor, food_value, section),
+                                count in self._sprouts.items()],
+                               dtype=np.float64).reshape(-1, 7),
+        num_sprouts=np.array(self._num_sprouts),
+        untouched_food=self._untouched_food,
+        total_food=np.array(self._total_food))
+
+  @classmethod
+  def from_arrays(cls, arrays, rng=None, copy=True):
+    """Builds a field from the arrays of to_arrays.
+
+    Arguments:
+      copy: bool; Copy the chunks into memory? If not, the field works on
+        the arrays themselves (see forks.py).
+    """
+    as_given = np.array if copy else np.asarray
+    blocks = arrays["blocks"]
+    # (Handing over rng only afterwards, so it's not used up on entropy.)
+    field = cls(int(arrays["field_size"]),
+                has_boundaries=bool(arrays["has_boundaries"]),
+                dtype=blocks.dtype,
+                chunk_size=int(arrays["chunk_size"]))
+    field.rng = rng if rng is not None else field.rng
+    field._entropy = int(arrays["entropy"])
+    field._slot = as_given(arrays["slot"])
+    field._blocks = as_given(blocks)
+    field._chunk_xy = as_given(arrays["chunk_xy"])
+    field.num_allocated_chunks = len(blocks)
+    if "sprout_counts" in arrays:
+      sprout_counts = arrays["sprout_counts"]
+    else:
+      # Older checkpoints have a row per sprout (its number first).
+      sprout_counts = np.array(arrays["sprouts"], dtype=np.float64)
+      sprout_counts[:, 0] = 1
+    for row in sprout_counts:
+      kind = (row[1].item(), row[2].item(), tuple(int(x) for x in row[3:]))
+      field._sprouts[kind] = field._sprouts.get(kind, 0) + int(row[0])
+    field._num_sprouts = int(arrays["num_sprouts"])
+    field._untouched_food = as_given(arrays["untouched_food"])
+    field._total_food = float(arrays["total_food"])
+    return field
+
+  def reseed(self, rng):
+    """Sprouts food with rng from now on (see forks.py).
+
+    The chunks' random numbers come from the field's entropy and the number
+    of the sprout (or, for an untouched chunk, the number of sprouts so far),
+    so instead the sprouts from now on are numbered from a point drawn from
+    rng. Fields reseeded differently then sprout differently.
+    """
+    self.rng = rng
+    self._num_sprouts += int(rng.integers(1, 2**32)) << 20
+
+  def _spots_per_chunk(self, food_fill_factor, section):
+    """How many spots each chunk fills in a sprout of section."""
+    low_x, high_x, low_y, high_y = section
+    low = np.arange(self.num_chunks)*self.chunk_size
+    high = np.minimum(low + self.chunk_size, self.field_size)
+    width = np.clip(np.minimum(high, high_x) - np.maximum(low, low_x), 0, None)
+    height = np.clip(np.minimum(high, high_y) - np.maximum(low, low_y), 0, None)
+    return np.ceil(np.outer(width, height)*food_fill_factor)
+
+  def _sprout_chunks(self, slots, sprout):
+    """Applies one sprout to the chunks in slots, all at once.
+
+    Returns:
+      float; How much food was added.
+    """
+    number, food_fill_factor, food_value, section = sprout
+    low_x, high_x, low_y, high_y = section
+    size = self.chunk_size
+    with np.errstate(over='ignore'):
+      seed = mix(np.uint64(self._entropy) + np.uint64(number)*GOLDEN)
+    # A few million spots at a time.
+    batch = max(1, 2**22//size**2)
+    added = 0.0
+    for first in range(0, len(slots), batch):
+      these = slots[first:first + batch]
+      x = (self._chunk_xy[these, 0, None, None]*size +
+           np.arange(size)[None, :, None])
+      y = (self._chunk_xy[these, 1, None, None]*size +
+           np.arange(size)[None, None, :])
+      inside = ((x >= low_x) & (x < high_x) & (y >= low_y) & (y < high_y))
+      inside = inside.reshape(len(these), -1)
+      with np.errstate(over='ignore'):
+        keys = mix(seed + (x*self.field_size + y + 1).astype(np.uint64)*
+                   GOLDEN).reshape(len(these), -1)
+      keys[~inside] = np.iinfo(np.uint64).max
+      # Each chunk fills its share of the spots, smallest numbers first.
+      num_spots = np.ceil(inside.sum(axis=1)*food_fill_factor).astype(np.int64)
+      threshold = np.zeros(len(these), dtype=np.uint64)
+      # (Most chunks fill the same number of spots, so this is a loop or two.)
+      for count in np.unique(num_spots[num_spots > 0]):
+        rows = np.flatnonzero(num_spots == count)
+        threshold[rows] = np.partition(keys[rows], count - 1,
+                                       axis=1)[:, count - 1]
+      chunk, spot = np.nonzero((keys <= threshold[:, None]) & inside &
+                               (num_spots > 0)[:, None])
+      added += _add_food(self._blocks,
+                         (these[chunk], spot//size, spot%size),
+                         food_value)
+    return added
+
+  def _sprout_untouched(self, slots):
+    """Gives the newly allocated chunks in slots all the food sprouted since
+    the food last spoiled.
+
+    Each spot of a chunk can be picked once per sprout, so over count
+    sprouts of num_spots spots each the times the spots were picked is
+    drawn as count*num_spots balls from an urn with count balls per spot.
+    That gets the total right, and each spot exactly when count is 1;
+    otherwise it only approximates count separate sprouts (the spots'
+    counts agree to within about 1/num_inside).
+
+    Returns:
+      float; How much food was added.
+    """
+    size = self.chunk_size
+    most = (np.iinfo(self.dtype).max
+            if np.issubdtype(self.dtype, np.integer) else None)
+    added = 0.0
+    for slot in slots:
+      chunk_x, chunk_y = self._chunk_xy[slot]
+      rng = np.random.default_rng(
+          [self._entropy, self._num_sprouts, int(chunk_x), int(chunk_y)])
+      x = chunk_x*size + np.arange(size)[:, None]
+      y = chunk_y*size + np.arange(size)[None, :]
+      block = self._blocks[slot]
+      for (food_fill_factor, food_value, section), count in (
+          self._sprouts.items()):
+        low_x, high_x, low_y, high_y = section
+        inside = (x >= low_x) & (x < high_x) & (y >= low_y) & (y < high_y)
+        num_inside = int(inside.sum())
+        num_spots = int(np.ceil(num_inside*food_fill_factor))
+        if num_spots == 0:
+          continue
+        picked = rng.multivariate_hypergeometric(
+            np.full(num_inside, count), count*num_spots, method='marginals')
+        before = block[inside]
+        after = before + picked*food_value
+        if most is not None:
+          after = np.minimum(after, most)
+        block[inside] = after
+        added += float((after - before).sum())
+    return added
+
+  def _allocate(self, chunk_x, chunk_y):
+    """Allocates the (untouched) chunks chunk_x, chunk_y and sprouts them."""
+    first = self.num_allocated_chunks
+    needed = first + len(chunk_x)
+    if needed > len(self._blocks):
+      capacity = max(needed, 2*len(self._blocks))
+      grown = np.zeros((capacity,) + self._blocks.shape[1:], dtype=self.dtype)
+      grown[:first] = self._blocks[:first]
+      self._blocks = grown
+      grown = np.zeros((capacity, 2), dtype=np.int64)
+      grown[:first] = self._chunk_xy[:first]
+      self._chunk_xy = grown
+    self._slot[chunk_x, chunk_y] = np.arange(first, needed)
+    self._chunk_xy[first:needed, 0] = chunk_x
+    self._chunk_xy[first:needed, 1] = chunk_y
+    self.num_allocated_chunks = needed
+    # Their food is counted spot by spot from now on.
+    self._total_food -= float(self._untouched_food[chunk_x, chunk_y].sum())
+    self._total_food += self._sprout_untouched(np.arange(first, needed))
+
+  def _locate(self, x, y):
+    """Returns (slot, x, y within the chunk) of the spots x, y.
+
+    Allocates any chunks that haven't been touched yet.
+    """
+    x = np.asarray(x, dtype=np.int64)
+    y = np.asarray(y, dtype=np.int64)
+    chunk_x = x//self.chunk_size
+    chunk_y = y//self.chunk_size
+    slot = self._slot[chunk_x, chunk_y]
+    untouched = slot < 0
+    if untouched.any():
+      chunks = np.unique(chunk_x[untouched]*self.num_chunks +
+                         chunk_y[untouched])
+      self._allocate(*np.divmod(chunks, self.num_chunks))
+      slot = self._slot[chunk_x, chunk_y]
+    return slot, x%self.chunk_size, y%self.chunk_size
+
+  def sprout(self,
+             food_fill_factor,
+             food_value=1,
+             low_grid_x_index=0, high_grid_x_index=0,
+             low_grid_y_index=0, high_grid_y_index=0):
+    """Fills the field (or a section of it) randomly with some food.
+
+    Takes the same arguments as Field.sprout.
+    """
+    section = _check_sprout(self, food_fill_factor, food_value,
+                            low_grid_x_index, high_grid_x_index,
+                            low_grid_y_index, high_grid_y_index)
+    sprout = (self._num_sprouts, food_fill_factor, food_value, section)
+    self._num_sprouts += 1
+    kind = (food_fill_factor, food_value, section)
+    self._sprouts[kind] = self._sprouts.get(kind, 0) + 1
+    self._total_food += self._sprout_chunks(
+        np.arange(self.num_allocated_chunks), sprout)
+    untouched_food = self._spots_per_chunk(food_fill_factor, section)*food_value
+    self._untouched_food += untouched_food
+    self._total_food += float(untouched_food[self._slot < 0].sum())
+
+  def spoil(self):
+    """Spoils all food on the field (in place)."""
+    self._blocks[:self.num_allocated_chunks].fill(0)
+    self._sprouts = {}
+    self._untouched_food[:] = 0
+    self._total_food = 0.0
+
+  def food_at(self, x, y):
+    """Returns the food at each of the spots x, y (int arrays)."""
+    slot, x, y = self._locate(x, y)
+    return self._blocks[slot, x, y]
+
+  def take_food(self, x, y):
+    """Removes all the food at each of the (distinct) spots x, y.
+
+    Arguments:
+      x, y: int arrays; Locations on the field to take food from.
+    Returns:
+      np.array; Amount of food that was removed from each spot.
+    """
+    slot, x, y = self._locate(x, y)
+    food = self._blocks[slot, x, y]
+    self._blocks[slot, x, y] = 0
+    self._total_food -= float(food.sum())
+    return food
+
+  def total_food(self):
+    """Returns the total amount of food on the field (a running total)."""
+    return self._total_food
+
+  def recount(self):
+    """Adds up the food on the field from scratch."""
+    self._total_food = float(self._blocks[:self.num_allocated_chunks].sum() +
+                             self._untouched_food[self._slot < 0].sum())
+
+  def remove_food(self, location):
+    """Removes all food from the specified location on the field.
+
+    Arguments:
+      location: list of length 2.  Location on field to remove food from.
+    Returns:
+      float; Amount of food that was removed.
+    """
+    return self.take_food([location[0]], [location[1]])[0].item()
+
+  def block_food(self, block_size, section=None):
+    """Totals the food in each block of the field (see Field.block_food).
+
+    Nothing gets allocated: the allocated chunks are added up spot by spot,
+    and each untouched chunk's food is spread evenly over its cells.
+    """
+    low_x, high_x, low_y, high_y = _check_blocks(self, block_size, section)
+    edges_x = _block_edges(low_x, high_x, block_size)
+    edges_y = _block_edges(low_y, high_y, block_size)
+    total = np.zeros((len(edges_x) - 1, len(edges_y) - 1))
+
+    # Food in the allocated chunks that overlap the section.
+    size = self.chunk_size
+    chunk_xy = self._chunk_xy[:self.num_allocated_chunks]*size
+    slots = np.flatnonzero((chunk_xy[:, 0] < high_x) &
+                           (chunk_xy[:, 0] + size > low_x) &
+                           (chunk_xy[:, 1] < high_y) &
+                           (chunk_xy[:, 1] + size > low_y))
+    food = self._blocks[slots]
+    chunk, x, y = np.nonzero(food)
+    food = food[chunk, x, y]
+    x = x + chunk_xy[slots[chunk], 0]
+    y = y + chunk_xy[slots[chunk], 1]
+    inside = (x >= low_x) & (x < high_x) & (y >= low_y) & (y < high_y)
+    block = (((x[inside] - low_x)//block_size)*total.shape[1] +
+             (y[inside] - low_y)//block_size)
+    total += np.bincount(block, weights=food[inside],
+                         minlength=total.size).reshape(total.shape)
+
+    # Food in the untouched chunks, by how much of each block they cover.
+    chunk_edges = _block_edges(0, self.field_size, size)
+    def overlap(block_edges):
+      return np.clip(np.minimum(chunk_edges[1:, None], block_edges[None, 1:]) -
+                     np.maximum(chunk_edges[:-1, None], block_edges[None, :-1]),
+                     0, None)
+    chunk_width = np.diff(chunk_edges)
+    density = (np.where(self._slot < 0, self._untouched_food, 0)/
+               np.outer(chunk_width, chunk_width))
+    total += overlap(edges_x).T @ density @ overlap(edges_y)
+    return total
+
+  @property
+  def food_grid(self):
+    """The whole field as one dense array (allocates every chunk!)."""
+    x, y = np.divmod(np.arange(self.num_chunks**2), self.num_chunks)
+    self._locate(x*self.chunk_size, y*self.chunk_size)
+    size = self.num_chunks*self.chunk_size
+    grid = self._blocks[self._slot].transpose(0, 2, 1, 3).reshape(size, size)
+    return grid[:self.field_size, :self.field_size]
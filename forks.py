@@ -0,0 +1,91 @@
+from datetime import datetime
+import multiprocessing
+import os
+
+import numpy as np
+
+import checkpoint
+from SET_ME import TMP_DIR
+
+def new_trunk_dir():
+  """A new fork_<timestamp> directory name under TMP_DIR, for a trunk."""
+  return os.path.join(TMP_DIR,
+                      datetime.now().strftime("fork_%Y%m%d%H%M%S%f"))
+
+def write_trunk(world, directory):
+  """Saves world as the trunk that its branches share (see open_branch).
+
+  The trunk is the world's checkpoint (see checkpoint.to_arrays), but as a
+  directory of plain .npy files, one per entry, so the branches can map
+  them rather than read them.
+
+  Arguments:
+    world: World; The world to branch.
+    directory: string; Where to put the trunk.
+  """
+  os.makedirs(directory, exist_ok=True)
+  for name, values in checkpoint.to_arrays(world).items():
+    np.save(os.path.join(directory, name + ".npy"), values)
+
+def open_branch(directory, seed, world_class):
+  """A new branch off the trunk in directory (see World.fork).
+
+  The trunk's files are mapped copy-on-write: every branch (in this process
+  or any other) reads the same pages, and a branch only gets its own copy of
+  a page when it writes to it. So a branch costs memory in proportion to
+  what it changes, not to the size of the world. The population moves into
+  the branch's own memory the first time it grows, and an OBJECTS world's
+  creatures are always the branch's own (they're objects, not arrays).
+
+  Arguments:
+    directory: string; The trunk (see write_trunk).
+    seed: np.random.SeedSequence; The branch's seed. Its random numbers
+      (food sprouting included) are drawn from a generator seeded with it.
+    world_class: class; World.
+  Returns:
+    World; The branch, with MEMORY storage, the trunk's history books and no
+      keyframes.
+  """
+  arrays = {
+      name[:-len(".npy")]: np.load(os.path.join(directory, name),
+                                   mmap_mode="c")
+      for name in os.listdir(directory) if name.endswith(".npy")
+  }
+  branch = checkpoint.from_arrays(arrays, world_class, copy=False,
+                                  name=directory)
+  branch.seed_sequence = seed
+  branch.rng = np.random.default_rng(seed)
+  branch.field.reseed(branch.rng)
+  return branch
+
+def _run_branch(job):
+  """Runs one branch in a worker (see run_branches)."""
+  directory, seed, world_class, what_if, index = job
+  return what_if(open_branch(directory, seed, world_class), index)
+
+def run_branches(world, num_branches, what_if, directory=None,
+                 processes=None):
+  """Forks world and runs every branch in a pool of worker processes.
+
+  Only the trunk's directory and each branch's seed are sent to the
+  workers, which map the trunk for themselves, so starting a branch costs
+  the same however big the world is.
+
+  Arguments:
+    world: World; The world to branch.
+    num_branches: int; How many branches.
+    what_if: function; Called as what_if(branch, index) in a worker for each
+      branch: changes the branch (say, adds wolves, or turns on spoiling),
+      runs it and returns what's to be kept. It (and what it returns) must
+      pickle, so it has to be defined at the top level of a module.
+    directory: string; Where to put the trunk. Defaults to new_trunk_dir().
+    processes: int; How many worker processes. Defaults to one per CPU.
+  Returns:
+    list; What what_if returned for each branch, in order.
+  """
+  directory = directory or new_trunk_dir()
+  write_trunk(world, directory)
+  jobs = [(directory, seed, type(world), what_if, index)
+          for index, seed in enumerate(world.spawn_seeds(num_branches))]
+  with multiprocessing.Pool(processes) as pool:
+    return pool.map(_run_branch, jobs)
@@ -0,0 +1,265 @@
+import collections
+import multiprocessing
+import queue
+
+import numpy as np
+
+import render
+
+# What to do with a new frame when the workers have fallen behind and the
+# queue is full:
+#   BLOCK: Wait for room, holding up the simulation (no frames lost).
+#   DROP_NEWEST: Throw the new frame away.
+#   DROP_OLDEST: Throw away the oldest frame still waiting, to make room.
+POLICIES = ["BLOCK", "DROP_NEWEST", "DROP_OLDEST"]
+
+# Everything needed to draw a frame, copied out of the world so the world can
+# carry on. Coordinates are int32 and diets int8 to keep the queue light.
+Snapshot = collections.namedtuple(
+    'Snapshot',
+    ['file_name',
+     'title',
+     'field_size',
+     'has_boundaries',
+     'glyphs',
+     'food_x',
+     'food_y',
+     'x',
+     'y',
+     'diet',
+     'is_alive']
+)
+
+def snapshot(world, file_name, title=None):
+  """Copies what's needed to draw world as it is right now.
+
+  Arguments:
+    world: World; The world to draw.
+    file_name: string; Where the frame should be saved.
+    title: string; Optional title (drawn with matplotlib, so slower).
+  Returns:
+    Snapshot; Independent of the world.
+  """
+  food_x, food_y, x, y, diet, is_alive = render.world_layers(world)
+  field_size = world.field.field_size
+  index_type = np.int32 if field_size <= np.iinfo(np.int32).max else np.int64
+  return Snapshot(file_name, title, field_size, world.field.has_boundaries,
+                  render.diet_glyphs(world.trophic_table.diet_types),
+                  food_x.astype(index_type), food_y.astype(index_type),
+                  x.astype(index_type), y.astype(index_type),
+                  diet.astype(np.int8), np.array(is_alive, dtype=bool))
+
+def render_snapshot(snapshot, cell_pixels=None):
+  """Paints a Snapshot (see render.render_frame)."""
+  return render.render_frame(snapshot.field_size,
+                             snapshot.food_x, snapshot.food_y,
+                             snapshot.x, snapshot.y,
+                             snapshot.diet, snapshot.is_alive,
+                             snapshot.glyphs,
+                             cell_pixels=cell_pixels,
+                             has_boundaries=snapshot.has_boundaries)
+
+def draw(snapshot, cell_pixels=None):
+  """Renders a Snapshot and saves it to its file."""
+  render.save_frame(render_snapshot(snapshot, cell_pixels),
+                    snapshot.file_name, title=snapshot.title)
+
+def _work(jobs, results, cell_pixels, frame_duration):
+  """A worker: draws snapshots until it gets a None.
+
+  Each job is a (number, Snapshot). Without a results queue the frame is
+  saved to its file; with one, it's encoded as a gif frame and sent back as
+  (number, (data, size)) for the GifWriter.
+  """
+  while True:
+    job = jobs.get()
+    if job is None:
+      return
+    number, snapshot = job
+    if results is None:
+      draw(snapshot, cell_pixels)
+    else:
+      results.put((number, render.gif_frame(
+          render_snapshot(snapshot, cell_pixels), frame_duration)))
+
+class FramePipeline:
+  """Draws and saves frames in background processes.
+
+  The world hands over a Snapshot of each frame and carries on; a pool of
+  worker processes renders and saves them. The queue between them is bounded,
+  so when the workers fall behind, the policy decides whether the simulation
+  waits or frames get dropped. Files are named when the frame is submitted,
+  so they sort in simulation order however the workers finish.
+
+  With gif_name set, no PNGs are written at all: the workers encode each
+  frame for a render.GifWriter, which appends them to one animated gif in
+  simulation order (titles are ignored). Only frames still in flight are held
+  in memory.
+
+  Use it as a context manager (or call close) so every frame is saved before
+  you go looking for the files:
+  ```
+  with FramePipeline() as frame_pipeline:
+    world.pass_day(40, plot_steps=True, frame_pipeline=frame_pipeline)
+  ```
+
+  Arguments:
+    num_workers: int; Number of worker processes. With 0, frames are drawn
+      right away by the caller, like show_me does. Defaults to one per spare
+      CPU (so 0 on a single CPU, where workers would only get in the way).
+    max_pending: int; How many frames can wait in the queue.
+    policy: string; What to do when the queue is full (see POLICIES).
+    cell_pixels: int; Width of a cell in pixels (see render.render_frame).
+    gif_name: string; If set, the frames go into this gif instead of PNGs.
+    frame_duration: int; How long to show each frame of the gif, in
+      milliseconds.
+  """
+  def __init__(self, num_workers=None, max_pending=16, policy="BLOCK",
+               cell_pixels=None, gif_name=None, frame_duration=100):
+    if num_workers is None:
+      num_workers = multiprocessing.cpu_count() - 1
+    if policy not in POLICIES:
+      raise ValueError("policy must be one of " + ", ".join(POLICIES) +
+                       ", got " + str(policy))
+    if num_workers < 0 or max_pending < 1:
+      raise ValueError("need num_workers >= 0 and max_pending >= 1, got " +
+                       str(num_workers) + " and " + str(max_pending))
+    self.policy = policy
+    self.cell_pixels = cell_pixels
+    self.num_submitted = 0
+    self.num_dropped = 0
+    self.gif = None
+    self._results = None
+    self._encoded = {}
+    self._dropped = set()
+    self._next_to_write = 0
+    if gif_name is not None:
+      self.gif = render.GifWriter(gif_name, frame_duration=frame_duration)
+      if num_workers:
+        self._results = multiprocessing.Queue()
+    self._jobs = multiprocessing.Queue(max_pending) if num_workers else None
+    self._workers = [
+        multiprocessing.Process(
+            target=_work,
+            args=(self._jobs, self._results, cell_pixels, frame_duration),
+            daemon=True)
+        for _ in range(num_workers)
+    ]
+    for worker in self._workers:
+      worker.start()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+  def _check_workers(self):
+    """Complains if a worker has died, rather than waiting on it forever."""
+    for worker in self._workers:
+      if not worker.is_alive() and worker.exitcode != 0:
+        raise RuntimeError("A frame worker died (exit code " +
+                           str(worker.exitcode) + ")")
+
+  def submit(self, world, file_name, title=None):
+    """Queues up a frame of world as it is right now.
+
+    Arguments:
+      world: World; The world to draw.
+      file_name: string; Where to save the frame.
+      title: string; Optional title.
+    Returns:
+      bool; False if the frame was dropped.
+    """
+    number = self.num_submitted
+    self.num_submitted += 1
+    if self._jobs is None:
+      frame = snapshot(world, file_name, title)
+      if self.gif is None:
+        draw(frame, self.cell_pixels)
+      else:
+        self.gif.add(render_snapshot(frame, self.cell_pixels))
+      return True
+    self._check_workers()
+    self._write_encoded()
+    if self.policy == "DROP_NEWEST" and self._jobs.full():
+      self._drop(number)
+      return False
+    job = (number, snapshot(world, file_name, title))
+    while True:
+      try:
+        if self.policy == "BLOCK":
+          self._jobs.put(job, timeout=1)
+        else:
+          self._jobs.put_nowait(job)
+        return True
+      except queue.Full:
+        self._check_workers()
+        self._write_encoded()
+        if self.policy == "DROP_NEWEST":
+          self._drop(number)
+          return False
+      if self.policy == "DROP_OLDEST":
+        try:
+          self._drop(self._jobs.get_nowait()[0])
+        except queue.Empty:
+          # The workers beat us to it, so there's room now.
+          pass
+
+  def _drop(self, number):
+    """Records that frame number won't be drawn."""
+    self.num_dropped += 1
+    self._dropped.add(number)
+
+  def _write_encoded(self, block=False):
+    """Appends the workers' encoded frames to the gif, in order.
+
+    Arguments:
+      block: bool; Wait until every frame submitted so far is written.
+    """
+    if self._results is None:
+      return
+    while True:
+      while (self._next_to_write in self._encoded or
+             self._next_to_write in self._dropped):
+        self._dropped.discard(self._next_to_write)
+        encoded = self._encoded.pop(self._next_to_write, None)
+        if encoded is not None:
+          self.gif.add_encoded(*encoded)
+        self._next_to_write += 1
+      if self._next_to_write == self.num_submitted:
+        return
+      try:
+        number, encoded = self._results.get(block=block, timeout=1)
+      except queue.Empty:
+        if not block:
+          return
+        self._check_workers()
+        continue
+      self._encoded[number] = encoded
+
+  def close(self):
+    """Waits for every queued frame to be saved and stops the workers."""
+    if self._jobs is None:
+      if self.gif is not None:
+        self.gif.close()
+      return
+    self._write_encoded(block=True)
+    if self.gif is not None:
+      self.gif.close()
+    for worker in self._workers:
+      if worker.is_alive():
+        self._jobs.put(None)
+    for worker in self._workers:
+      worker.join()
+    self._jobs.close()
+    self._jobs = None
+    if self._results is not None:
+      self._results.close()
+      self._results = None
+    failed = [worker.exitcode for worker in self._workers
+              if worker.exitcode != 0]
+    self._workers = []
+    if failed:
+      raise RuntimeError("Frame workers died (exit codes " + str(failed) +
+                         "), some frames weren't saved")
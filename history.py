@@ -0,0 +1,309 @@
+import collections
+import os
+
+import numpy as np
+
+from population import MUTATIONS, Population
+import storage
+from traits import QUANTILES, TRAITS, trait_quantiles
+
+DailyHistory = collections.namedtuple(
+    'DailyHistory',
+    ['day',
+     'num_creatures',
+     'total_food_stored',
+     'num_births',
+     'num_deaths',
+     'food_on_field',
+     'creature_list',
+     'trait_quantiles'],
+    defaults=(None,)
+)
+
+# Ages are counted up to MAX_AGE days; older creatures go in the last bin.
+MAX_AGE = 63
+# Food stored is counted in bins FOOD_BIN_WIDTH wide; the last of the
+# FOOD_BINS bins takes everybody with more.
+FOOD_BIN_WIDTH = 0.5
+FOOD_BINS = 64
+
+def _column_property(name):
+  """A read-only property exposing the recorded days of one column."""
+  def getter(self):
+    if self.directory is None:
+      return self._columns[name][:self.num_days]
+    if name not in self._mapped:
+      dtype, shape = self._shapes[name]
+      self._mapped[name] = storage.open_rows(
+          self.directory, "history_" + name, dtype, shape, self.num_days)
+    return self._mapped[name]
+  return property(getter)
+
+class History:
+  """The history books: a row of numbers for every day, kept as columns.
+
+  Each day gets a handful of totals, counts of each diet type and mutation,
+  histograms of the ages and the food stored, and the quantiles of each trait,
+  so the books grow by the same small amount every day however many
+  creatures there are, and plot_history can slice out whole columns at once.
+  Columns are over-allocated and grow by doubling, like a Population's.
+
+  A frozen copy of every creature (a Population) is only kept every
+  snapshot_every days, if asked for.
+
+  With a directory, the books are kept on disk instead: every day is
+  appended to one file per column (history_<column>.bin) as soon as it's
+  recorded, so memory doesn't grow however long the world runs, and the
+  columns are memory-mapped when read. History.open reads them back, even
+  from a run that's still going or one that crashed.
+
+  Indexing gives the days as DailyHistory rows, like the list of them the
+  history used to be: history[-1].num_creatures, history[10:], etc. Their
+  creature_list is only filled in on snapshot days.
+
+  Arguments:
+    diet_types: [string]; Names of the diet codes being counted.
+    snapshot_every: int; Keep a copy of every creature every this many days
+      (counting from day 0). None keeps no copies.
+    capacity: int; Number of days to allocate space for up front.
+    directory: string; If set, the books are kept in files in this directory
+      (any books already there are started over).
+
+  Columns (each a numpy array with an entry per recorded day):
+    day: int; Days passed.
+    num_creatures: int; Creatures at the end of the day.
+    total_food_stored: float; Food stored by all the creatures.
+    num_births: int; Babies born today.
+    num_deaths: int; Creatures that died today.
+    food_on_field: float; Food left on the field.
+    diet_counts: int array (days, len(diet_types)); Creatures of each diet.
+    mutation_counts: int array (days, len(MUTATIONS)); Creatures with each
+      mutation.
+    age_histogram: int array (days, MAX_AGE + 1); Creatures of each age.
+    food_stored_histogram: int array (days, FOOD_BINS); Non-newborns (who
+      always start with nothing) in each bin of food stored.
+    trait_quantiles: float array (days, len(TRAITS), len(QUANTILES));
+      QUANTILES of each trait (NaN once everybody's gone).
+
+  Other attributes:
+    snapshots: {int: Population}; Copies of every creature, by day.
+  """
+  day = _column_property('day')
+  num_creatures = _column_property('num_creatures')
+  total_food_stored = _column_property('total_food_stored')
+  num_births = _column_property('num_births')
+  num_deaths = _column_property('num_deaths')
+  food_on_field = _column_property('food_on_field')
+  diet_counts = _column_property('diet_counts')
+  mutation_counts = _column_property('mutation_counts')
+  age_histogram = _column_property('age_histogram')
+  food_stored_histogram = _column_property('food_stored_histogram')
+  trait_quantiles = _column_property('trait_quantiles')
+
+  def __init__(self, diet_types, snapshot_every=None, capacity=64,
+               directory=None):
+    if snapshot_every is not None and snapshot_every < 1:
+      raise ValueError("snapshot_every must be at least 1, got " +
+                       str(snapshot_every))
+    self.diet_types = list(diet_types)
+    self.snapshot_every = snapshot_every
+    self.snapshots = {}
+    self.num_days = 0
+    self.directory = directory
+    self._shapes = {name: (dtype, shape)
+                    for name, dtype, shape in self._layout()}
+    self._mapped = {}
+    if directory is None:
+      self._columns = {
+          name: np.zeros((capacity,) + shape, dtype=dtype)
+          for name, dtype, shape in self._layout()
+      }
+      return
+    self._columns = None
+    os.makedirs(directory, exist_ok=True)
+    storage.write_metadata(directory, dict(diet_types=self.diet_types,
+                                           snapshot_every=snapshot_every),
+                           name="history")
+    for name in self._shapes:
+      open(storage.rows_path(directory, "history_" + name), "wb").close()
+
+  def _layout(self):
+    """(name, dtype, shape of a day's entry) of every column."""
+    return [
+        ('day', np.int64, ()),
+        ('num_creatures', np.int64, ()),
+        ('total_food_stored', np.float64, ()),
+        ('num_births', np.int64, ()),
+        ('num_deaths', np.int64, ()),
+        ('food_on_field', np.float64, ()),
+        ('diet_counts', np.int64, (len(self.diet_types),)),
+        ('mutation_counts', np.int64, (len(MUTATIONS),)),
+        ('age_histogram', np.int64, (MAX_AGE + 1,)),
+        ('food_stored_histogram', np.int64, (FOOD_BINS,)),
+        ('trait_quantiles', np.float64, (len(TRAITS), len(QUANTILES))),
+    ]
+
+  def __len__(self):
+    return self.num_days
+
+  def wants_snapshot(self, day):
+    """Should day's record come with a copy of every creature?"""
+    return self.snapshot_every is not None and day % self.snapshot_every == 0
+
+  def record(self, stats, creatures, snapshot=None):
+    """Adds a day to the books.
+
+    Arguments:
+      stats: counters.Stats; The day's totals and counts (see World.stats).
+      creatures: {string: np.array}; Every creature's food_stored, age and
+        traits (see traits.TRAITS), e.g. the columns of a Population, for
+        the histograms and quantiles.
+      snapshot: Population; A frozen copy of every creature to keep (see
+        wants_snapshot).
+    """
+    if (self.directory is None and
+        self.num_days == len(self._columns['day'])):
+      for name, column in self._columns.items():
+        grown = np.zeros((2*len(column),) + column.shape[1:],
+                         dtype=column.dtype)
+        grown[:self.num_days] = column[:self.num_days]
+        self._columns[name] = grown
+    age = np.asarray(creatures['age'])
+    food_stored = np.asarray(creatures['food_stored'])
+    food_bin = np.minimum(food_stored[age > 0]//FOOD_BIN_WIDTH,
+                          FOOD_BINS - 1).astype(np.int64)
+    quantiles = trait_quantiles(creatures)
+    row = dict(
+        day=stats.day,
+        num_creatures=stats.num_creatures,
+        total_food_stored=stats.total_food_stored,
+        num_births=stats.num_births,
+        num_deaths=stats.num_deaths,
+        food_on_field=stats.food_on_field,
+        diet_counts=[stats.diet_counts[name] for name in self.diet_types],
+        mutation_counts=[stats.mutation_counts[name] for name in MUTATIONS],
+        age_histogram=np.bincount(np.minimum(age, MAX_AGE),
+                                  minlength=MAX_AGE + 1),
+        food_stored_histogram=np.bincount(food_bin, minlength=FOOD_BINS),
+        trait_quantiles=[quantiles[name] for name in TRAITS],
+    )
+    for name, value in row.items():
+      if self.directory is None:
+        self._columns[name][self.num_days] = value
+        continue
+      dtype, shape = self._shapes[name]
+      storage.append_rows(self.directory, "history_" + name,
+                          np.asarray(value, dtype=dtype).reshape((1,) + shape),
+                          self.num_days)
+    self._mapped = {}
+    if snapshot is not None:
+      self.snapshots[stats.day] = snapshot
+    self.num_days += 1
+
+  def _row(self, i):
+    """Day i of the books as a DailyHistory."""
+    day = int(self.day[i])
+    snapshot = self.snapshots.get(day)
+    return DailyHistory(
+        day=day,
+        num_creatures=int(self.num_creatures[i]),
+        total_food_stored=self.total_food_stored[i],
+        num_births=int(self.num_births[i]),
+        num_deaths=int(self.num_deaths[i]),
+        food_on_field=self.food_on_field[i],
+        creature_list=[] if snapshot is None else snapshot.creatures(),
+        trait_quantiles={name: self.trait_quantiles[i, k]
+                         for k, name in enumerate(TRAITS)})
+
+  def __getitem__(self, index):
+    if isinstance(index, slice):
+      return [self._row(i) for i in range(*index.indices(self.num_days))]
+    if not -self.num_days <= index < self.num_days:
+      raise IndexError("History has " + str(self.num_days) +
+                       " days, there's no day " + str(index))
+    return self._row(index % self.num_days)
+
+  def __iter__(self):
+    return (self._row(i) for i in range(self.num_days))
+
+  def read(self, names=None, days=slice(None)):
+    """Copies some columns, for some days, out of the books.
+
+    Handy for books on disk: only the rows asked for are read.
+
+    Arguments:
+      names: [string]; Which columns. Defaults to all of them.
+      days: slice or index array; Which rows (row i is day i, for a world's
+        books).
+    Returns:
+      {string: np.array}; The columns.
+    """
+    names = names or [name for name, dtype, shape in self._layout()]
+    return {name: np.array(getattr(self, name)[days]) for name in names}
+
+  def to_arrays(self, num_days=None):
+    """The books as named arrays, for a checkpoint (see from_arrays).
+
+    Every column, plus the snapshots' columns (as snapshot.<day>.<column>).
+
+    Arguments:
+      num_days: int; Only the first num_days days (and their snapshots).
+    """
+    if num_days is None:
+      num_days = self.num_days
+    arrays = self.read(days=slice(0, num_days))
+    days = sorted(day for day in self.snapshots if day < num_days)
+    arrays["snapshot_days"] = np.array(days, dtype=np.int64)
+    for day in days:
+      for name, column in self.snapshots[day].to_arrays().items():
+        arrays["snapshot." + str(day) + "." + name] = column
+    return arrays
+
+  @classmethod
+  def from_arrays(cls, arrays, diet_types, snapshot_every=None):
+    """Builds the books (in memory) from the arrays of to_arrays."""
+    num_days = len(arrays["day"])
+    history = cls(diet_types, snapshot_every=snapshot_every,
+                  capacity=max(num_days, 1))
+    for name, column in history._columns.items():
+      column[:num_days] = arrays[name]
+    history.num_days = num_days
+    for day in arrays["snapshot_days"].tolist():
+      prefix = "snapshot." + str(day) + "."
+      history.snapshots[day] = Population.from_arrays(
+          {name[len(prefix):]: column for name, column in arrays.items()
+           if name.startswith(prefix)},
+          diet_types=diet_types)
+    return history
+
+  @classmethod
+  def open(cls, directory, num_days=None):
+    """Opens the books kept in directory (see directory above).
+
+    Nothing is read up front: columns are memory-mapped as they're asked
+    for. The books can be read while the world is still writing them, and
+    after a crash they hold every day that was completely written.
+
+    Arguments:
+      directory: string; Where the books are.
+      num_days: int; Only look at (and from now on write after) the first
+        num_days days.
+    Returns:
+      History; Backed by the files in directory.
+    """
+    header = storage.read_metadata(directory, name="history")
+    history = cls(header["diet_types"],
+                  snapshot_every=header["snapshot_every"], capacity=1)
+    history.directory = directory
+    history._columns = None
+    history.num_days = min(
+        len(storage.open_rows(directory, "history_" + name, dtype, shape))
+        for name, dtype, shape in history._layout())
+    if num_days is not None:
+      history.num_days = min(history.num_days, num_days)
+    return history
+
+  def __getstate__(self):
+    state = dict(self.__dict__)
+    state["_mapped"] = {}
+    return state
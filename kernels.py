@@ -0,0 +1,467 @@
+import functools
+
+import numpy as np
+
+from population import MUTATION_METABOLISM, MUTATION_SPEED, MUTATIONS
+from traits import TraitDrift
+from trophic import DEFAULT_TROPHIC_TABLE
+
+# udlr = up, down, left, right - choices for movement (same as Creature).
+UDLR = np.array([[0, 1], [0, -1], [-1, 0], [1, 0]])
+
+def draw_moves(rng, steps, num, max_draws=2**22):
+  """Draws the directions and move orders for a day's steps, in bulk.
+
+  Arguments:
+    rng: np.random.Generator; The world's random numbers.
+    steps: int; How many steps to draw for.
+    num: int; How many creatures move in each step.
+    max_draws: int; Roughly how many numbers to hold in memory at once; long
+      days are drawn in blocks of steps.
+  Yields: (first_step, directions, rank) per block of steps
+    directions: int array (steps in block, num); Index into UDLR.
+    rank: int array (steps in block, num); Each creature's place in the
+      shuffled move order of each step.
+  """
+  block_steps = max(1, max_draws//max(num, 1))
+  for first_step in range(0, steps, block_steps):
+    block = min(block_steps, steps - first_step)
+    directions = rng.integers(4, size=(block, num), dtype=np.int8)
+    # The inverse of a random shuffle is just another random shuffle.
+    rank = rng.permuted(np.tile(np.arange(num), (block, 1)), axis=1)
+    yield first_step, directions, rank
+
+def walk(location, directions, steps_to_take, field_size, has_boundaries):
+  """Moves every creature steps_to_take spaces in its direction.
+
+  Arguments:
+    location: int array (N, 2); Where each creature starts.
+    directions: int array (N,); Index into UDLR for each creature.
+    steps_to_take: int array (N,); How many spaces each creature moves.
+    field_size: int; Length of a side of the square field.
+    has_boundaries: bool; Clamp at the walls (True) or wrap around (False).
+  Returns: (path, stepped)
+    path: int array (N, max(steps_to_take), 2); Location after each space.
+      Creatures that have run out of spaces stay put.
+    stepped: bool array (N, max(steps_to_take)); Which entries of path the
+      creature actually stepped into.
+  """
+  max_steps = int(steps_to_take.max()) if len(steps_to_take) else 0
+  path = np.empty((len(location), max_steps, 2), dtype=np.int64)
+  here = np.array(location, dtype=np.int64)
+  delta = UDLR[directions]
+  for i in range(max_steps):
+    here += delta*(steps_to_take > i)[:, None]
+    if has_boundaries:
+      # Move or just run into the wall.
+      np.clip(here, 0, field_size - 1, out=here)
+    else:
+      # If you ran off the field, appear on the other side.
+      np.mod(here, field_size, out=here)
+    path[:, i] = here
+  return path, steps_to_take[:, None] > np.arange(max_steps)
+
+def grab_food(field, cells, grabbers, priority, food_stored):
+  """The first visitor of each cell takes all of the food there.
+
+  Arguments:
+    field: Field; The field to take the food from.
+    cells: int array; Flat cell index (x*field_size + y) of each visit.
+    grabbers: int array; Which creature made each visit.
+    priority: int array, or tuple of them; When each visit happened (lowest
+      goes first). A tuple is compared entry by entry, the first entry
+      first.
+    food_stored: float array; Everyone's food stores, credited in place.
+  Returns:
+    float; How much food was grabbed in all.
+  """
+  if len(cells) == 0:
+    return 0.0
+  if not isinstance(priority, tuple):
+    priority = (priority,)
+  order = np.lexsort(priority[::-1] + (cells,))
+  cells = cells[order]
+  first = np.ones(len(cells), dtype=bool)
+  first[1:] = cells[1:] != cells[:-1]
+  x, y = np.divmod(cells[first], field.field_size)
+  food = field.take_food(x, y)
+  np.add.at(food_stored, grabbers[order][first], food)
+  return float(food.sum())
+
+def _first_arrival(arrival_cells, arrival_times, cells, after, before):
+  """Finds the earliest arrival at each cell in an open window of time.
+
+  Arguments:
+    arrival_cells, arrival_times: int arrays; Where and when things arrived.
+    cells, after, before: int arrays; The cells and (after, before) windows to
+      look in.
+  Returns:
+    (found, which): bool array saying whether anything arrived in each window,
+    and the index of the earliest arrival (only meaningful where found).
+  """
+  if len(arrival_cells) == 0 or len(cells) == 0:
+    return np.zeros(len(cells), dtype=bool), np.zeros(len(cells), dtype=int)
+  # Sort by (cell, time). Cells are renumbered so the key can't overflow.
+  arrival_cell_ids, arrival_pos = np.unique(arrival_cells, return_inverse=True)
+  span = max(arrival_times.max(), before.max()) + 2
+  keys = arrival_pos*span + arrival_times
+  order = np.argsort(keys, kind='stable')
+  keys = keys[order]
+  pos = np.minimum(np.searchsorted(arrival_cell_ids, cells),
+                   len(arrival_cell_ids) - 1)
+  which = np.searchsorted(keys, pos*span + after, side='right')
+  found = which < len(keys)
+  which = np.minimum(which, len(keys) - 1)
+  found &= ((arrival_cell_ids[pos] == cells) &
+           (keys[which]//span == pos) &
+           (keys[which]%span < before))
+  return found, order[which]
+
+def _hunt(population, cells, stepped, old_cells, rank, moving, trophic):
+  """Works out who gets eaten this step, in move order.
+
+  Each predator eats every live prey standing on a cell it steps into. A
+  creature that has already moved this step is found at its new cell, the
+  rest at their old ones. Encounters for the whole food web are found in one
+  go: every predator step is keyed by (cell, predator diet), and every prey
+  looks up the earliest step onto its cell by any diet that eats it (one
+  lookup per row of the trophic table that has it on the menu).
+
+  Who gets to move depends on who was eaten before their turn, so we start by
+  assuming nobody gets eaten and re-resolve until nothing changes. Each pass
+  gets at least the next kill in move order right, so this always settles on
+  exactly what happens one-at-a-time, usually in a couple of passes.
+
+  Returns: (killed_at, meat)
+    killed_at: int array (N,); The rank of the predator that ate each
+      creature (N for creatures nobody ate).
+    meat: float; How much food the predators got out of it.
+  """
+  num = len(rank)
+  killed_at = np.full(num, num)
+  diet = population.diet_type
+  num_diets = len(trophic.diet_types)
+  hunters = np.flatnonzero(moving & trophic.is_predator[diet])
+  hunted = np.flatnonzero(moving & trophic.is_prey[diet])
+  if len(hunters) == 0 or len(hunted) == 0:
+    return killed_at, 0.0
+  hunt_who, hunt_step = np.nonzero(stepped[hunters])
+  hunt_who = hunters[hunt_who]
+  hunt_keys = cells[hunt_who, hunt_step]*num_diets + diet[hunt_who]
+  # Every (prey, diet that eats it) pair.
+  pair_prey, pair_diet = np.nonzero(trophic.eats.T[diet[hunted]])
+  pair_prey = hunted[pair_prey]
+  new_cells = cells[:, -1]
+
+  while True:
+    # Dudes eaten before their turn neither move nor hunt.
+    moves = killed_at > rank
+    arrivals = moves[hunt_who]
+    # Prey stand on their old cell until their turn, then on their new one.
+    goes = moves[pair_prey]
+    prey = np.concatenate([pair_prey, pair_prey[goes]])
+    keys = np.concatenate([old_cells[pair_prey], new_cells[pair_prey[goes]]])
+    keys = keys*num_diets + np.concatenate([pair_diet, pair_diet[goes]])
+    after = np.concatenate([np.full(len(pair_prey), -1), rank[pair_prey[goes]]])
+    before = np.concatenate([np.where(goes, rank[pair_prey], num),
+                             np.full(goes.sum(), num)])
+    found, which = _first_arrival(hunt_keys[arrivals],
+                                  rank[hunt_who[arrivals]],
+                                  keys, after, before)
+    new_killed_at = np.full(num, num)
+    np.minimum.at(new_killed_at, prey[found],
+                  rank[hunt_who[arrivals]][which[found]])
+    if (new_killed_at == killed_at).all():
+      break
+    killed_at = new_killed_at
+
+  # Ranks are unique, so the time of a kill tells us who the killer was.
+  eaten = killed_at < num
+  by_rank = np.empty(num, dtype=np.int64)
+  by_rank[rank] = np.arange(num)
+  np.add.at(population.food_stored, by_rank[killed_at[eaten]],
+            population.meat_value[eaten])
+  return killed_at, float(population.meat_value[eaten].sum())
+
+def sequential_step(population, field, directions, rank,
+                    trophic=DEFAULT_TROPHIC_TABLE):
+  """Moves every creature once, as if one at a time in a random order.
+
+  Gives the same results as calling Creature.move_and_grab for each creature
+  in a shuffled order: the earliest creature to step on a cell gets its food,
+  and predators eat whoever is standing where they step when it's their turn.
+
+  Arguments:
+    population: Population; Everyone in the world, updated in place.
+    field: Field; The field to grab food from.
+    directions: int array (N,); Index into UDLR for each creature.
+    rank: int array (N,); Each creature's place in the shuffled move order.
+    trophic: TrophicTable; Who eats whom (and who eats food).
+  Returns:
+    float; How much food (grabbed or eaten) everybody stored this step.
+  """
+  num = len(population)
+  if not population.is_alive.any():
+    return 0.0
+
+  # Dead dudes can't move (or grab). Speedy creatures get a boost.
+  moving = population.is_alive.copy()
+  steps_to_take = population.speed*moving
+  path, stepped = walk(population.location, directions, steps_to_take,
+                       field.field_size, field.has_boundaries)
+  cells = path[..., 0]*field.field_size + path[..., 1]
+  old_cells = (population.location[:, 0]*field.field_size +
+               population.location[:, 1])
+
+  killed_at, meat = _hunt(population, cells, stepped, old_cells, rank, moving,
+                          trophic)
+  # Only dudes that were still alive on their turn got to move.
+  moved = moving & (killed_at > rank)
+
+  grabbers, step = np.nonzero(
+      stepped & (moved & trophic.eats_food[population.diet_type])[:, None])
+  grabbed = grab_food(field,
+                      cells[grabbers, step],
+                      grabbers,
+                      rank[grabbers]*path.shape[1] + step,
+                      population.food_stored)
+
+  # And settle into your new location.
+  if path.shape[1]:
+    population.location[moved] = path[moved, -1]
+    population.moved()
+  population.is_alive[killed_at < num] = False
+  return grabbed + meat
+
+def synchronous_step(population, field, directions, priority,
+                      trophic=DEFAULT_TROPHIC_TABLE):
+  """Moves every creature once, all at the same time.
+
+  Everybody walks from where they stood at the start of the step, then the
+  spoils are handed out. When several creatures land on the same food, the one
+  with the lowest priority gets it; when several predators land on the same
+  prey, the one with the lowest priority eats it. Predators catch prey where
+  the prey ends the step. Creatures eaten this step still got to move, grab
+  and hunt (they're only gone at the end of it).
+
+  Unlike sequential_step, nothing depends on who went before whom, so the
+  whole step is a single pass of array operations.
+
+  Arguments:
+    population: Population; Everyone in the world, updated in place.
+    field: Field; The field to grab food from.
+    directions: int array (N,); Index into UDLR for each creature.
+    priority: int array (N,); A shuffle of 0..N-1; lowest wins contention.
+    trophic: TrophicTable; Who eats whom (and who eats food).
+  Returns:
+    float; How much food (grabbed or eaten) everybody stored this step.
+  """
+  num = len(population)
+  if not population.is_alive.any():
+    return 0.0
+
+  # Dead dudes can't move (or grab).
+  moving = population.is_alive.copy()
+  path, stepped = walk(population.location, directions,
+                       population.speed*moving,
+                       field.field_size, field.has_boundaries)
+  cells = path[..., 0]*field.field_size + path[..., 1]
+  # Where everybody ends up (creatures that can't move stay put).
+  final = np.array(population.location)
+  if path.shape[1]:
+    final[moving] = path[moving, -1]
+  new_cells = final[:, 0]*field.field_size + final[:, 1]
+
+  grabbers, step = np.nonzero(
+      stepped & (moving & trophic.eats_food[population.diet_type])[:, None])
+  grabbed = grab_food(field,
+                      cells[grabbers, step],
+                      grabbers,
+                      priority[grabbers],
+                      population.food_stored)
+
+  # Every predator step, keyed by (cell, predator diet), at its priority.
+  diet = population.diet_type
+  num_diets = len(trophic.diet_types)
+  hunt_who, hunt_step = np.nonzero(
+      stepped & (moving & trophic.is_predator[diet])[:, None])
+  hunt_keys = cells[hunt_who, hunt_step]*num_diets + diet[hunt_who]
+  # Every (prey, diet that eats it) pair, looked up where the prey ends up.
+  # Cannibals don't eat themselves: look before and after their own priority.
+  pair_prey, pair_diet = np.nonzero(
+      trophic.eats.T[diet[moving & trophic.is_prey[diet]]])
+  pair_prey = np.flatnonzero(moving & trophic.is_prey[diet])[pair_prey]
+  keys = np.tile(new_cells[pair_prey]*num_diets + pair_diet, 2)
+  after = np.concatenate([np.full(len(pair_prey), -1), priority[pair_prey]])
+  before = np.concatenate([priority[pair_prey], np.full(len(pair_prey), num)])
+  found, which = _first_arrival(hunt_keys, priority[hunt_who],
+                                keys, after, before)
+  killed_by = np.full(num, num)
+  np.minimum.at(killed_by, np.tile(pair_prey, 2)[found],
+                priority[hunt_who][which[found]])
+
+  # Priorities are unique, so the winning priority tells us who the killer was.
+  eaten = killed_by < num
+  by_priority = np.empty(num, dtype=np.int64)
+  by_priority[priority] = np.arange(num)
+  np.add.at(population.food_stored, by_priority[killed_by[eaten]],
+            population.meat_value[eaten])
+
+  # And settle into your new location.
+  population.location = final
+  population.is_alive[eaten] = False
+  return grabbed + float(population.meat_value[eaten].sum())
+
+def herbivore_day(population, field, steps_in_day, rng,
+                  trophic=DEFAULT_TROPHIC_TABLE, max_visits=2**22, rows=None,
+                  moves=None):
+  """Moves every creature for a whole day at once, for worlds w/o predators.
+
+  When nobody eats anybody, the only thing creatures share is food, so each
+  creature's whole random walk can be drawn up front (a cumulative sum of
+  steps, clamped at the walls if there are any). Food then goes to whoever
+  got to it first, ordered by (step, shuffled move order within the step,
+  space within the step), exactly as if sequential_step (or, as it's the same
+  thing without predators, synchronous_step) had been called steps_in_day
+  times.
+
+  Arguments:
+    population: Population; Everyone in the world, updated in place. Nobody
+      may be a predator.
+    field: Field; The field to grab food from.
+    steps_in_day: int; How many times the creatures move today.
+    rng: np.random.Generator; The world's random numbers.
+    trophic: TrophicTable; Who eats food (nobody may eat anybody).
+    max_visits: int; Roughly how many (creature, space) visits to hold in
+      memory at once. Long days are walked in blocks of steps this big.
+    rows: int array (N,); For fields stacked on top of each other in one
+      tall food grid (see ensemble.Ensemble): the row of the grid each
+      creature's own field starts at. Locations are rows of the tall grid,
+      and everybody wraps around (or runs into the walls of) their own
+      field. None for a single field.
+    moves: function; Draws the day's moves instead of draw_moves(rng, ...),
+      e.g. from each replicate's own random numbers (see ensemble.Ensemble).
+      Called as moves(steps_in_day, num, max_draws), it yields what
+      draw_moves does, except that rank can be any numbers that put each
+      step's creatures in their move order.
+  Returns:
+    float; How much food everybody grabbed today.
+  """
+  num = len(population)
+  steps_to_take = population.speed*population.is_alive
+  if num == 0 or steps_in_day == 0 or not steps_to_take.any():
+    return 0.0
+  size = field.field_size
+  max_steps = int(steps_to_take.max())
+  eats_food = trophic.eats_food[population.diet_type]
+  # Spaces every creature moves in each step (0 once it's out of spaces).
+  moves_in_space = (steps_to_take[:, None] > np.arange(max_steps)).T
+  if rows is None:
+    rows = np.zeros(num, dtype=np.int64)
+
+  # (Walking around each creature's own field.)
+  here = np.array(population.location, dtype=np.int64)
+  here[:, 0] -= rows
+  grabbed = 0.0
+  if moves is None:
+    moves = functools.partial(draw_moves, rng)
+  for first_step, directions, rank in moves(steps_in_day, num,
+                                            max_visits//max_steps):
+    steps = len(directions)
+    # (steps, spaces per step, creature, xy) moves, then the walk itself.
+    delta = (UDLR[directions][:, None, :, :]*
+             moves_in_space[None, :, :, None]).reshape(-1, num, 2)
+    if field.has_boundaries:
+      # Running into the wall doesn't cancel out, so walk it space by space.
+      path = np.empty_like(delta)
+      for i in range(len(delta)):
+        here = np.clip(here + delta[i], 0, size - 1)
+        path[i] = here
+    else:
+      path = np.mod(here + np.cumsum(delta, axis=0), size)
+      here = path[-1]
+
+    # Only visits to food by creatures that eat it matter.
+    cells = (path[..., 0] + rows)*size + path[..., 1]
+    visited = np.repeat(moves_in_space[None], steps, axis=0).reshape(-1, num)
+    visited &= eats_food[None, :]
+    space, grabbers = np.nonzero(visited)
+    has_food = field.food_at(path[space, grabbers, 0] + rows[grabbers],
+                             path[space, grabbers, 1]) > 0
+    space = space[has_food]
+    grabbers = grabbers[has_food]
+    step, substep = np.divmod(space, max_steps)
+    grabbed += grab_food(field,
+                         cells[space, grabbers],
+                         grabbers,
+                         (first_step + step, rank[step, grabbers], substep),
+                         population.food_stored)
+
+  # And settle into your new location.
+  here[:, 0] += rows
+  population.location = here
+  return grabbed
+
+def eat_die_reproduce(population, rng, trait_drift=None, babies_rng=None):
+  """Everyone eats, possibly dies, and possibly reproduces.
+
+  Vectorized version of Creature.eat_die_reproduce; babies are appended to the
+  end of the population.
+
+  Arguments:
+    population: Population; Everyone in the world, updated in place.
+    rng: np.random.Generator; The world's random numbers.
+    trait_drift: TraitDrift; How far babies' traits drift from their
+      parent's (no drift if not given).
+    babies_rng: function; If given, called as babies_rng(parents) (their
+      rows) for the Generator the babies' random numbers come from, rather
+      than rng (see ensemble.Ensemble). Every draw is one number per baby.
+  Returns: (num_babies, food_eaten)
+    num_babies: int; Number of babies born.
+    food_eaten: float; How much food everybody ate (for themselves and their
+      babies), taken from food_stored.
+  """
+  # Got a little bit older.
+  population.age += 1
+  food_required = population.metabolism
+  food_eaten = float(food_required.sum())
+  # Eat, if you can (die if you can't.)
+  population.food_stored -= food_required
+  population.is_alive &= population.food_stored >= 0
+  parents = np.flatnonzero(population.is_alive &
+                           (population.food_stored >= food_required))
+  # Else, reproduce.
+  population.food_stored[parents] -= food_required[parents]
+  food_eaten += float(food_required[parents].sum())
+  if babies_rng is not None:
+    rng = babies_rng(parents)
+  mutates = (rng.random(len(parents)) <
+             population.reproduction_mutation_chance[parents])
+  mutation = np.where(mutates,
+                      rng.integers(len(MUTATIONS), size=len(parents)),
+                      population.mutation[parents])
+  # Babies take after their parent, unless they mutated into something else.
+  changed = mutation != population.mutation[parents]
+  traits = dict(
+      speed=np.where(changed, MUTATION_SPEED[mutation],
+                     population.speed[parents]),
+      metabolism=np.where(changed, MUTATION_METABOLISM[mutation],
+                          population.metabolism[parents]),
+      meat_value=population.meat_value[parents],
+      reproduction_mutation_chance=(
+          population.reproduction_mutation_chance[parents]))
+  (trait_drift or TraitDrift()).drift(traits, rng)
+  population.append(
+      population.location[parents],
+      mutation=mutation,
+      diet_type=population.diet_type[parents],
+      randomly_teleports=population.randomly_teleports[parents],
+      **traits)
+  return len(parents), food_eaten
+
+def teleport(population, field_size, rng):
+  """Everybody who can teleport, does, to a random location on the field."""
+  jumpers = np.flatnonzero(population.randomly_teleports)
+  population.location[jumpers] = rng.integers(field_size,
+                                              size=(len(jumpers), 2))
+  population.moved()
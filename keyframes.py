@@ -0,0 +1,189 @@
+import os
+
+import numpy as np
+
+import checkpoint
+from history import History
+import storage
+
+# A day's entry in the log: steps_in_day, whether the day was stepped one
+# step at a time (see Keyframes.start_day), then the random number
+# generator's state as it started the day (see rng_words).
+LOG_WORDS = 8
+
+def rng_words(rng):
+  """A PCG64 generator's state as 6 uint64s (the 128-bit state and
+  increment, high word first, then has_uint32 and uinteger)."""
+  state = rng.bit_generator.state
+  if state["bit_generator"] != "PCG64":
+    raise ValueError("Keyframes need a PCG64 random number generator, got " +
+                     str(state["bit_generator"]))
+  words = []
+  for name in ("state", "inc"):
+    value = state["state"][name]
+    words += [value >> 64, value & (2**64 - 1)]
+  return np.array(words + [state["has_uint32"], state["uinteger"]],
+                  dtype=np.uint64)
+
+class _NoFrames:
+  """Stands in for a FramePipeline while days are replayed: draws nothing."""
+  def submit(self, world, file_name, title=None):
+    return False
+
+class Keyframes:
+  """Keeps a full copy of the world every few days, to replay any day from.
+
+  At the start of every day the world logs how long the day is and the state
+  of its random number generator, and every `every` days it also saves a
+  keyframe: a checkpoint of the whole world (without its history books,
+  which it keeps anyway). Any past day can then be rebuilt exactly by
+  loading the keyframe before it and replaying at most every - 1 days (see
+  replay), so `every` trades memory (one compressed world per keyframe) for
+  time (days to replay).
+
+  Replaying a day only redoes what pass_day does. The log is checked as the
+  days are replayed, so if the world was changed in between days (say, with
+  create_creatures), replay complains, rather than quietly giving a
+  different world; starting again from a later keyframe gets around it.
+
+  Arguments:
+    every: int; Save a keyframe every this many days (counting from day 0).
+    directory: string; If set, the keyframes (keyframe_<day>.npz) and the
+      log (keyframes_log.bin) are kept in files in this directory rather
+      than in memory (any already there are started over).
+    capacity: int; Number of days of log to allocate space for up front.
+  """
+  def __init__(self, every, directory=None, capacity=64):
+    if every < 1:
+      raise ValueError("Keyframes need every >= 1, got " + str(every))
+    self.every = every
+    self.directory = directory
+    self.num_days = 0
+    # Day -> checkpoint bytes (in memory), or day -> None (in files).
+    self._keyframes = {}
+    self._log = None
+    if directory is None:
+      self._log = np.zeros((capacity, LOG_WORDS), dtype=np.uint64)
+      return
+    os.makedirs(directory, exist_ok=True)
+    storage.write_metadata(directory, dict(every=every), name="keyframes")
+    open(storage.rows_path(directory, "keyframes_log"), "wb").close()
+
+  @classmethod
+  def open(cls, directory, num_days=None):
+    """Picks up keyframes kept in directory (see directory above).
+
+    Arguments:
+      directory: string; Where the keyframes are.
+      num_days: int; Only look at (and from now on log after) the first
+        num_days days.
+    Returns:
+      Keyframes; Backed by the files in directory.
+    """
+    header = storage.read_metadata(directory, name="keyframes")
+    keyframes = cls(header["every"], capacity=1)
+    keyframes.directory = directory
+    keyframes._log = None
+    keyframes.num_days = len(storage.open_rows(
+        directory, "keyframes_log", np.uint64, (LOG_WORDS,), num_days))
+    keyframes._keyframes = {
+        day: None for day in range(0, keyframes.num_days, keyframes.every)
+        if os.path.exists(keyframes._path(day))
+    }
+    return keyframes
+
+  def _path(self, day):
+    return os.path.join(self.directory, "keyframe_" + str(day) + ".npz")
+
+  def log(self, num_days=None):
+    """The log, a row of LOG_WORDS uint64s for each day started so far."""
+    if num_days is None:
+      num_days = self.num_days
+    if self.directory is None:
+      return self._log[:num_days]
+    return storage.open_rows(self.directory, "keyframes_log", np.uint64,
+                             (LOG_WORDS,), num_days)
+
+  def days(self):
+    """The days with a keyframe, in order."""
+    return sorted(self._keyframes)
+
+  def start_day(self, world, steps_in_day, step_by_step):
+    """Logs the start of world's day, saving a keyframe if it's time.
+
+    Arguments:
+      world: World; The world, about to pass a day.
+      steps_in_day: int; How long the day is.
+      step_by_step: bool; Are the steps taken one at a time (as for
+        plot_steps)? The TRAJECTORIES engine uses its random numbers
+        differently then.
+    """
+    day = world.days_passed
+    if day != self.num_days:
+      raise ValueError("Keyframes have logged " + str(self.num_days) +
+                       " days, but the world is starting day " + str(day))
+    if day % self.every == 0:
+      data = checkpoint.dumps(world, history=False)
+      if self.directory is None:
+        self._keyframes[day] = data
+      else:
+        with open(self._path(day) + ".tmp", "wb") as f:
+          f.write(data)
+        os.replace(self._path(day) + ".tmp", self._path(day))
+        self._keyframes[day] = None
+    row = np.concatenate([np.array([steps_in_day, step_by_step],
+                                   dtype=np.uint64),
+                          rng_words(world.rng)])
+    if self.directory is None:
+      if day == len(self._log):
+        grown = np.zeros((2*len(self._log), LOG_WORDS), dtype=np.uint64)
+        grown[:day] = self._log
+        self._log = grown
+      self._log[day] = row
+    else:
+      storage.append_rows(self.directory, "keyframes_log", row[None], day)
+    self.num_days += 1
+
+  def _load(self, day, world_class):
+    """The world as it started day (which must have a keyframe)."""
+    if self.directory is None:
+      return checkpoint.loads(self._keyframes[day], world_class)
+    return checkpoint.load(self._path(day), world_class)
+
+  def replay(self, world, day):
+    """Rebuilds world as it was after day days (see World.at_day).
+
+    Arguments:
+      world: World; The world these keyframes were saved from.
+      day: int; How many days should have passed.
+    Returns:
+      World; A new world (in memory, without keyframes of its own) just as
+        world was at the end of day - 1, history books and all.
+    """
+    if not 0 <= day <= world.days_passed:
+      raise ValueError("The world has passed " + str(world.days_passed) +
+                       " days, there's no day " + str(day))
+    start = max(x for x in self._keyframes if x <= day)
+    past = self._load(start, type(world))
+    # The books as they were at the keyframe (day 0's record is made again).
+    past.history = History.from_arrays(
+        world.history.to_arrays(num_days=start + 1 if start else 0),
+        world.history.diet_types,
+        snapshot_every=world.history.snapshot_every)
+    log = self.log()
+    for replayed in range(start, day):
+      steps_in_day, step_by_step = log[replayed, :2].tolist()
+      if not np.array_equal(rng_words(past.rng), log[replayed, 2:]):
+        raise RuntimeError(
+            "Replaying day " + str(replayed) + " from the keyframe of day " +
+            str(start) + " went wrong: the random numbers don't match. Was "
+            "the world changed in between days?")
+      past.pass_day(int(steps_in_day), plot_steps=bool(step_by_step),
+                    frame_pipeline=_NoFrames())
+      if (past.history.num_creatures[-1] !=
+          world.history.num_creatures[replayed + 1]):
+        raise RuntimeError(
+            "Replaying day " + str(replayed) + " from the keyframe of day " +
+            str(start) + " went wrong: the creatures don't match the history "
+            "books. Was the world changed in between days?")
+    return past
@@ -0,0 +1,159 @@
+import numpy as np
+
+import storage
+
+class HashOccupancy:
+  """Keeps track of which creatures are standing in which cell.
+
+  Only occupied cells are stored (in a dict keyed by cell id,
+  x*field_size + y), so memory scales with the number of creatures rather
+  than the area of the field.
+
+  The index remembers which cell it filed each creature under, so a creature
+  can always be removed, even if its location was changed behind the index's
+  back. That memory is keyed by id(creature), so it isn't pickled (or
+  copied): a copy rebuilds it from its own cells, whose creatures have new
+  ids.
+
+  Arguments:
+    field_size: int; Length of a side of the square field.
+  """
+  def __init__(self, field_size):
+    self.field_size = field_size
+    self._by_cell = {}
+    self._cell_of = {}
+
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    del state['_cell_of']
+    return state
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self._cell_of = {
+        id(creature): cell
+        for cell, here in self._occupied() for creature in here}
+
+  def _occupied(self):
+    """(cell, list of creatures) for every cell with anybody in it."""
+    return self._by_cell.items()
+
+  def _cell(self, location):
+    return int(location[0])*self.field_size + int(location[1])
+
+  def _creatures_in(self, cell, create=False):
+    """The list of creatures filed under cell (None if empty and not create)."""
+    if create:
+      return self._by_cell.setdefault(cell, [])
+    return self._by_cell.get(cell)
+
+  def _forget_cell(self, cell):
+    """Called when the last creature leaves cell."""
+    del self._by_cell[cell]
+
+  def add(self, creature):
+    """Files the creature under its current location."""
+    cell = self._cell(creature.location)
+    self._creatures_in(cell, create=True).append(creature)
+    self._cell_of[id(creature)] = cell
+
+  def remove(self, creature):
+    """Takes the creature out of the index."""
+    cell = self._cell_of.pop(id(creature), None)
+    if cell is None:
+      raise ValueError("Can't remove a creature that isn't in the index: " +
+                       str(creature))
+    here = self._creatures_in(cell)
+    here.remove(creature)
+    if not here:
+      self._forget_cell(cell)
+
+  def remove_many(self, creatures):
+    """Takes a batch of creatures out, tidying each of their cells once."""
+    gone = set(id(x) for x in creatures)
+    for cell in set(self._cell_of.pop(x, None) for x in gone) - {None}:
+      self._by_cell[cell] = [
+          x for x in self._creatures_in(cell) if id(x) not in gone]
+      if not self._by_cell[cell]:
+        self._forget_cell(cell)
+
+  def at(self, location):
+    """Returns the list of creatures standing at location."""
+    return self._creatures_in(self._cell(location)) or []
+
+  def occupied_cells(self):
+    """Returns an int array (K, 2) of the locations with anybody in them."""
+    cells = np.array(sorted(self._by_cell), dtype=np.int64)
+    return np.stack(np.divmod(cells, self.field_size), axis=1)
+
+class DenseOccupancy(HashOccupancy):
+  """Like HashOccupancy, but with a list for every cell of the field.
+
+  This is what the world has always done: cheap lookups on small, crowded
+  fields, but memory grows with the area of the field.
+  """
+  def __init__(self, field_size):
+    super().__init__(field_size)
+    self._by_cell = [[] for x in range(field_size**2)]
+
+  def _occupied(self):
+    return ((cell, here) for cell, here in enumerate(self._by_cell) if here)
+
+  def _creatures_in(self, cell, create=False):
+    return self._by_cell[cell]
+
+  def _forget_cell(self, cell):
+    pass
+
+  def occupied_cells(self):
+    cells = np.array([cell for cell, here in enumerate(self._by_cell) if here],
+                     dtype=np.int64)
+    return np.stack(np.divmod(cells, self.field_size), axis=1)
+
+class SortedOccupancy:
+  """Occupancy of a Population, as sorted cell-id arrays.
+
+  Rather than being updated on every move, the index is rebuilt (one sort)
+  the first time it's queried after the creatures have moved, which it tells
+  from the population's location_version (so a query is just a binary
+  search).
+
+  Arguments:
+    field_size: int; Length of a side of the square field.
+    population: Population; The creatures to keep track of.
+    directory: string; If set, the index is kept in memory-mapped files in
+      this directory (occupancy_*.npy) rather than in RAM.
+  """
+  def __init__(self, field_size, population, directory=None):
+    self.field_size = field_size
+    self.population = population
+    self.directory = directory
+    self._built_version = None
+
+  def _store(self, name, values):
+    """Keeps values as the index's array name (in a file, if stored)."""
+    if self.directory is None:
+      return values
+    return storage.replace_array(self.directory, "occupancy_" + name, values)
+
+  def _rebuild_if_moved(self):
+    if self._built_version == self.population.location_version:
+      return
+    self._built_version = self.population.location_version
+    location = self.population.location
+    cells = location[:, 0]*self.field_size + location[:, 1]
+    order = np.argsort(cells, kind='stable')
+    self._order = self._store("order", order)
+    self._cells = self._store("cells", cells[order])
+
+  def at(self, location):
+    """Returns an int array of the population rows standing at location."""
+    self._rebuild_if_moved()
+    cell = int(location[0])*self.field_size + int(location[1])
+    lo, hi = np.searchsorted(self._cells, [cell, cell + 1])
+    return self._order[lo:hi]
+
+  def occupied_cells(self):
+    """Returns an int array (K, 2) of the locations with anybody in them."""
+    self._rebuild_if_moved()
+    return np.stack(np.divmod(np.unique(self._cells), self.field_size), axis=1)
@@ -0,0 +1,339 @@
+import numpy as np
+
+import storage
+from traits import MUTATION_TRAITS
+
+# Integer codes used by the array engine (index into these lists). Worlds
+# with their own TrophicTable use its diet_types instead of DIET_TYPES.
+DIET_TYPES = ["HERBIVORE", "CARNIVORE", "SUPER_CARNIVORE"]
+MUTATIONS = ["NORMAL", "EFFICIENT", "SPEEDY"]
+MUTATION_SPEED = np.array([MUTATION_TRAITS[x]["speed"] for x in MUTATIONS])
+MUTATION_METABOLISM = np.array(
+    [MUTATION_TRAITS[x]["metabolism"] for x in MUTATIONS])
+
+# (name, dtype, shape of a single creature's entry)
+COLUMNS = [
+    ('location', np.int64, (2,)),
+    ('food_stored', np.float64, ()),
+    ('mutation', np.int8, ()),
+    ('diet_type', np.int8, ()),
+    ('speed', np.int64, ()),
+    ('metabolism', np.float64, ()),
+    ('age', np.int64, ()),
+    ('is_alive', np.bool_, ()),
+    ('meat_value', np.float64, ()),
+    ('reproduction_mutation_chance', np.float64, ()),
+    ('randomly_teleports', np.bool_, ()),
+]
+
+def _column_property(name):
+  """A read/write property exposing the live rows of one column."""
+  def getter(self):
+    return self._columns[name][:self.size]
+  def setter(self, value):
+    self._columns[name][:self.size] = value
+  return property(getter, setter)
+
+def _location_property():
+  """Like _column_property, but setting it counts as the creatures moving."""
+  def getter(self):
+    return self._columns['location'][:self.size]
+  def setter(self, value):
+    self._columns['location'][:self.size] = value
+    self.moved()
+  return property(getter, setter)
+
+class Population:
+  """Stores every creature in a world as a set of parallel numpy arrays.
+
+  Row i of every column describes creature i, so a step for the whole
+  population is a handful of array operations instead of a Python call per
+  creature. Columns are over-allocated and grow by doubling, so appending
+  babies is amortized O(1) per creature.
+
+  Arguments:
+    capacity: int; Number of creatures to allocate space for up front.
+    diet_types: [string]; Names of the diet codes stored in diet_type.
+    directory: string; If set, every column is a memory-mapped .npy file in
+      this directory (population_<column>.npy), so the population can be
+      bigger than RAM. See Population.open to pick it back up.
+
+  Columns (each a numpy array of length len(population)):
+    location: int array (N, 2); Location of each creature.
+    food_stored: float; Amount of food each creature has currently.
+    mutation: int8; Index into MUTATIONS.
+    diet_type: int8; Index into diet_types.
+    speed: int; Spaces moved per step (see traits.py).
+    metabolism: float; Food eaten each day.
+    age: int; How many days each creature has survived.
+    is_alive: bool; indicates if the creature is alive.
+    meat_value: float; Food value to predators.
+    reproduction_mutation_chance: float; [0, 1] chance to mutate on
+      reproducing.
+    randomly_teleports: bool; does the creature teleport at end of day?
+
+  Attributes:
+    location_version: int; Goes up whenever anybody moves (or comes, goes
+      or changes row), so an index of who's where (see
+      occupancy.SortedOccupancy) knows when it's out of date without looking
+      at every location. Setting location, append and compact count it;
+      anything writing into the location array in place has to call moved().
+  """
+  location = _location_property()
+  food_stored = _column_property('food_stored')
+  mutation = _column_property('mutation')
+  diet_type = _column_property('diet_type')
+  speed = _column_property('speed')
+  metabolism = _column_property('metabolism')
+  age = _column_property('age')
+  is_alive = _column_property('is_alive')
+  meat_value = _column_property('meat_value')
+  reproduction_mutation_chance = _column_property(
+      'reproduction_mutation_chance')
+  randomly_teleports = _column_property('randomly_teleports')
+
+  def __init__(self, capacity=16, diet_types=DIET_TYPES, directory=None):
+    self.size = 0
+    self.location_version = 0
+    self.diet_types = list(diet_types)
+    self.directory = directory
+    self._columns = {}
+    for name, dtype, shape in COLUMNS:
+      shape = (max(capacity, 1),) + shape
+      if directory is None:
+        self._columns[name] = np.zeros(shape, dtype=dtype)
+      else:
+        self._columns[name] = storage.create_array(
+            directory, "population_" + name, shape, dtype)
+
+  @classmethod
+  def open(cls, directory, size, diet_types=DIET_TYPES):
+    """Picks up a population stored in directory (see directory above).
+
+    Arguments:
+      directory: string; Where the population's columns are stored.
+      size: int; How many creatures there are (the files have spare room).
+      diet_types: [string]; Names of the diet codes stored in diet_type.
+    Returns:
+      Population; Backed by the same files, nothing is read up front.
+    """
+    population = cls(capacity=1, diet_types=diet_types)
+    population.directory = directory
+    population._columns = {
+        name: storage.open_array(directory, "population_" + name)
+        for name, dtype, shape in COLUMNS
+    }
+    population.size = size
+    return population
+
+  def moved(self):
+    """Says that the creatures' locations have changed (see
+    location_version)."""
+    self.location_version += 1
+
+  def flush(self):
+    """Writes any changes to a stored population out to its files."""
+    if self.directory is not None:
+      for column in self._columns.values():
+        column.flush()
+
+  def __len__(self):
+    return self.size
+
+  def _reserve(self, capacity):
+    """Makes sure there is room for at least capacity creatures."""
+    old_capacity = len(self._columns['age'])
+    if capacity <= old_capacity:
+      return
+    new_capacity = max(capacity, 2*old_capacity)
+    for name, column in self._columns.items():
+      if self.directory is not None:
+        self._columns[name] = storage.grow_array(
+            self.directory, "population_" + name, column, self.size,
+            new_capacity)
+        continue
+      grown = np.zeros((new_capacity,) + column.shape[1:], dtype=column.dtype)
+      grown[:self.size] = column[:self.size]
+      self._columns[name] = grown
+
+  def append(self, location, **columns):
+    """Adds a batch of creatures to the end of the population.
+
+    Arguments:
+      location: int array (n, 2); Locations of the new creatures.
+      columns: Values for the other columns, either arrays of length n or
+        scalars shared by the whole batch. Missing columns get the defaults of
+        a brand new Creature (speed and metabolism those of its mutation).
+    Returns:
+      np.array; Indices of the new creatures.
+    """
+    location = np.asarray(location, dtype=np.int64).reshape(-1, 2)
+    num_new = len(location)
+    defaults = dict(food_stored=0, mutation=0, diet_type=0, age=0,
+                    is_alive=True, meat_value=2,
+                    reproduction_mutation_chance=0, randomly_teleports=False)
+    defaults.update(columns)
+    defaults.setdefault('speed', MUTATION_SPEED[defaults['mutation']])
+    defaults.setdefault('metabolism',
+                        MUTATION_METABOLISM[defaults['mutation']])
+    self._reserve(self.size + num_new)
+    new_rows = slice(self.size, self.size + num_new)
+    self._columns['location'][new_rows] = location
+    for name, value in defaults.items():
+      self._columns[name][new_rows] = value
+    self.size += num_new
+    self.moved()
+    return np.arange(new_rows.start, new_rows.stop)
+
+  def append_creature(self, creature):
+    """Adds a Creature (object or view) to the population.
+
+    Arguments:
+      creature: Creature; The creature to copy into the arrays.
+    Returns:
+      int; The index of the new row.
+    """
+    return self.append(
+        [creature.location],
+        food_stored=creature.food_stored,
+        mutation=MUTATIONS.index(creature.mutation),
+        diet_type=self.diet_types.index(creature.diet_type),
+        speed=creature.speed,
+        metabolism=creature.metabolism,
+        age=creature.age,
+        is_alive=creature.is_alive,
+        meat_value=creature.meat_value,
+        reproduction_mutation_chance=creature.reproduction_mutation_chance,
+        randomly_teleports=creature.randomly_teleports)[0]
+
+  def compact(self, keep, block_size=2**20):
+    """Keeps only the creatures flagged in keep, preserving their order.
+
+    Works through the rows a block at a time (kept rows only ever move
+    towards the front), so it needs little memory beyond keep itself, even
+    for a stored population.
+
+    Arguments:
+      keep: bool array of length len(self); Which creatures to keep.
+      block_size: int; How many rows to move at a time.
+    """
+    keep = np.array(keep, dtype=bool)
+    num_kept = 0
+    for start in range(0, self.size, block_size):
+      block_keep = keep[start:start + block_size]
+      num_block_kept = int(block_keep.sum())
+      for name, column in self._columns.items():
+        column[num_kept:num_kept + num_block_kept] = (
+            column[start:start + block_size][:len(block_keep)][block_keep])
+      num_kept += num_block_kept
+    self.size = num_kept
+    self.moved()
+
+  def copy(self):
+    """Returns an independent copy of the live rows."""
+    population = Population(capacity=self.size, diet_types=self.diet_types)
+    for name, column in self._columns.items():
+      population._columns[name][:self.size] = column[:self.size]
+    population.size = self.size
+    return population
+
+  def to_arrays(self):
+    """The live rows of every column, for a checkpoint (see from_arrays)."""
+    return {name: column[:self.size] for name, column in self._columns.items()}
+
+  @classmethod
+  def from_arrays(cls, arrays, diet_types=DIET_TYPES, copy=True):
+    """Builds a population from the columns of to_arrays.
+
+    Arguments:
+      arrays: {string: np.array}; The columns.
+      diet_types: [string]; Names of the diet codes stored in diet_type.
+      copy: bool; Copy the columns into memory? If not, the population works
+        on the arrays themselves until it has to grow (see forks.py).
+    """
+    size = len(arrays["age"])
+    population = cls(capacity=size, diet_types=diet_types)
+    for name, dtype, shape in COLUMNS:
+      if copy:
+        population._columns[name][:size] = arrays[name]
+      else:
+        population._columns[name] = np.asarray(arrays[name], dtype=dtype)
+    population.size = size
+    return population
+
+  def creatures(self):
+    """Returns a list of CreatureViews, one per row."""
+    return [CreatureView(self, i) for i in range(self.size)]
+
+
+def _view_property(name, codes=None):
+  """A property reading/writing one column of a CreatureView's row."""
+  def getter(self):
+    value = self._population._columns[name][self._index]
+    if codes is not None:
+      return codes[value]
+    if value.shape == ():
+      return value.item()
+    return value
+  def setter(self, value):
+    if codes is not None:
+      value = codes.index(value)
+    self._population._columns[name][self._index] = value
+  return property(getter, setter)
+
+class CreatureView:
+  """A Creature-like handle onto one row of a Population.
+
+  Exposes the same attributes as Creature, so code written against the object
+  engine (show_me, plot_history, the scripts) keeps working. Reads and writes
+  go straight through to the population's arrays; location is returned as a
+  view, so location[0] = 5 moves the creature (call population.moved()
+  after moving one that way; setting location does it for you).
+
+  Views are invalidated when the population is compacted (at the end of each
+  day), so get fresh ones from World.creatures rather than holding on to them.
+
+  Arguments:
+    population: Population; The arrays backing this creature.
+    index: int; The creature's row in population.
+  """
+  food_stored = _view_property('food_stored')
+  mutation = _view_property('mutation', codes=MUTATIONS)
+  speed = _view_property('speed')
+  metabolism = _view_property('metabolism')
+  age = _view_property('age')
+  is_alive = _view_property('is_alive')
+  meat_value = _view_property('meat_value')
+  reproduction_mutation_chance = _view_property('reproduction_mutation_chance')
+  randomly_teleports = _view_property('randomly_teleports')
+
+  def __init__(self, population, index):
+    self._population = population
+    self._index = index
+
+  @property
+  def location(self):
+    return self._population._columns['location'][self._index]
+
+  @location.setter
+  def location(self, location):
+    self._population._columns['location'][self._index] = location
+    self._population.moved()
+
+  @property
+  def diet_type(self):
+    return self._population.diet_types[
+        self._population._columns['diet_type'][self._index]]
+
+  @diet_type.setter
+  def diet_type(self, diet_type):
+    self._population._columns['diet_type'][self._index] = (
+        self._population.diet_types.index(diet_type))
+
+  def __eq__(self, other):
+    return (isinstance(other, CreatureView) and
+            other._population is self._population and
+            other._index == self._index)
+
+  def __hash__(self):
+    return hash((id(self._population), self._index))
@@ -0,0 +1,426 @@
+import os
+
+import numpy as np
+from PIL import GifImagePlugin, Image
+
+# The renderer paints palette indices rather than colors, so a frame is one
+# byte per pixel and goes straight into palette-based formats (PNG, GIF).
+# (name, RGB) of every color, in palette order.
+PALETTE_COLORS = [
+    ("GRASS", (238, 232, 170)),      # palegoldenrod
+    ("FOOD", (0, 128, 0)),           # g
+    ("DEAD", (0, 0, 0)),             # k
+    ("WALL", (64, 64, 64)),
+    ("HERBIVORE", (191, 0, 191)),    # m
+    ("CARNIVORE", (255, 0, 0)),      # r
+    ("SUPER_CARNIVORE", (65, 105, 225)),  # royalblue
+    # Colors for any other diet types.
+    ("EXTRA_1", (255, 140, 0)),
+    ("EXTRA_2", (0, 160, 160)),
+    ("EXTRA_3", (139, 69, 19)),
+    ("EXTRA_4", (128, 128, 128)),
+    # Background of titled (matplotlib) frames.
+    ("WHITE", (255, 255, 255)),
+]
+PALETTE = np.array([rgb for name, rgb in PALETTE_COLORS], dtype=np.uint8)
+COLOR = {name: i for i, (name, rgb) in enumerate(PALETTE_COLORS)}
+
+# Glyph of each diet type: (color, size as a fraction of a cell). Same
+# colors and relative marker sizes show_me has always used; bigger glyphs are
+# painted on top.
+DIET_GLYPHS = {
+    "HERBIVORE": (COLOR["HERBIVORE"], 2/6),
+    "CARNIVORE": (COLOR["CARNIVORE"], 4/6),
+    "SUPER_CARNIVORE": (COLOR["SUPER_CARNIVORE"], 1),
+}
+FOOD_GLYPH = (COLOR["FOOD"], 1/6)
+EXTRA_COLORS = [COLOR[name] for name, rgb in PALETTE_COLORS
+                if name.startswith("EXTRA")]
+
+def diet_glyphs(diet_types):
+  """Returns the (color, size) glyph of each of diet_types.
+
+  Diets without a glyph of their own get one of the extra colors, at half a
+  cell.
+  """
+  extras = iter(EXTRA_COLORS*len(diet_types))
+  return [DIET_GLYPHS.get(diet, None) or (next(extras), 3/6)
+          for diet in diet_types]
+
+# Rough width of a frame, in pixels.
+FRAME_PIXELS = 600
+
+def default_cell_pixels(field_size):
+  """Pixels per cell giving a roughly FRAME_PIXELS wide frame."""
+  return max(1, FRAME_PIXELS//field_size)
+
+def _paint(frame, cell_pixels, x, y, color, size):
+  """Paints a square glyph, size (a fraction of a cell) wide, on each cell."""
+  if len(x) == 0:
+    return
+  glyph = max(1, int(round(size*cell_pixels)))
+  start = (cell_pixels - glyph)//2
+  # View the frame as (cell x, pixel in cell, cell y, pixel in cell).
+  cells = frame.reshape(frame.shape[0]//cell_pixels, cell_pixels,
+                        frame.shape[1]//cell_pixels, cell_pixels)
+  cells[x, start:start + glyph, y, start:start + glyph] = color
+
+def render_frame(field_size, food_x, food_y, x, y, diet, is_alive,
+                 glyphs, cell_pixels=None, has_boundaries=False):
+  """Paints a frame of the field and its creatures.
+
+  Everything is drawn straight into an array of palette indices (see
+  PALETTE), with one square glyph per creature: the grass, then the food,
+  then each diet type in turn (the living, then the dead).
+
+  Arguments:
+    field_size: int; Length of a side of the square field.
+    food_x, food_y: int arrays; Cells with food on them.
+    x, y: int arrays (N,); Location of each creature.
+    diet: int array (N,); Diet code of each creature.
+    is_alive: bool array (N,); Which creatures are alive.
+    glyphs: [(int, float)]; (color, size) of each diet code (see
+      diet_glyphs).
+    cell_pixels: int; Width of a cell, in pixels. Defaults to
+      default_cell_pixels(field_size).
+    has_boundaries: bool; Draw a wall around the field?
+  Returns:
+    uint8 np.array (field_size*cell_pixels, field_size*cell_pixels); Palette
+      index of each pixel. PALETTE[frame] gives the RGB image.
+  """
+  cell_pixels = cell_pixels or default_cell_pixels(field_size)
+  frame = np.full((field_size*cell_pixels, field_size*cell_pixels),
+                  COLOR["GRASS"], dtype=np.uint8)
+  _paint(frame, cell_pixels, food_x, food_y, *FOOD_GLYPH)
+  for code in np.argsort([size for color, size in glyphs], kind="stable"):
+    color, size = glyphs[code]
+    this_diet = diet == code
+    alive = this_diet & is_alive
+    dead = this_diet & ~is_alive
+    _paint(frame, cell_pixels, x[alive], y[alive], color, size)
+    _paint(frame, cell_pixels, x[dead], y[dead], COLOR["DEAD"], size)
+  if has_boundaries:
+    frame[[0, -1], :] = COLOR["WALL"]
+    frame[:, [0, -1]] = COLOR["WALL"]
+  return frame
+
+def _creature_layers(world):
+  """Returns (x, y, diet, is_alive) of every creature in world."""
+  if world.population is not None:
+    population = world.population
+    location = population.location
+    diet = population.diet_type
+    is_alive = population.is_alive
+  else:
+    creatures = world.creatures
+    location = np.array([x.location for x in creatures],
+                        dtype=np.int64).reshape(-1, 2)
+    diet = np.array([world.trophic_table.code(x.diet_type)
+                     for x in creatures], dtype=np.int64)
+    is_alive = np.array([x.is_alive for x in creatures], dtype=bool)
+  return location[:, 0], location[:, 1], diet, is_alive
+
+def world_layers(world):
+  """Pulls out what render_frame needs to paint world as it is right now.
+
+  Returns:
+    (food_x, food_y, x, y, diet, is_alive); See render_frame.
+  """
+  food_x, food_y = np.nonzero(world.field.food_grid)
+  return (food_x, food_y) + _creature_layers(world)
+
+def render_world(world, cell_pixels=None):
+  """Paints a frame of world as it is right now (see render_frame)."""
+  return render_frame(world.field.field_size,
+                      *world_layers(world),
+                      diet_glyphs(world.trophic_table.diet_types),
+                      cell_pixels=cell_pixels,
+                      has_boundaries=world.field.has_boundaries)
+
+def density_counts(world, block_size, section=None):
+  """Bins the food and creatures of world into square blocks.
+
+  Only the creatures and the field's block_food are looked at, never a full
+  food grid, so this works on fields of any size.
+
+  Arguments:
+    world: World; The world to bin.
+    block_size: int; Length of a side of each block, in cells.
+    section: (low_x, high_x, low_y, high_y); Only bin [low_x, high_x) x
+      [low_y, high_y). Defaults to the whole field.
+  Returns:
+    (food, counts, cells); Float array (X, Y) of the food in each block, int
+      array (D, X, Y) of living creatures of each diet code in each block and
+      int array (X, Y) of how many cells each block has (the ones on the high
+      edges may be cut short).
+  """
+  food = world.field.block_food(block_size, section)
+  low_x, high_x, low_y, high_y = section or (0, world.field.field_size,
+                                             0, world.field.field_size)
+  x, y, diet, is_alive = _creature_layers(world)
+  inside = (is_alive & (x >= low_x) & (x < high_x) &
+            (y >= low_y) & (y < high_y))
+  num_x, num_y = food.shape
+  block = ((diet[inside].astype(np.int64)*num_x +
+            (x[inside] - low_x)//block_size)*num_y +
+           (y[inside] - low_y)//block_size)
+  num_diets = len(world.trophic_table.diet_types)
+  counts = np.bincount(block, minlength=num_diets*num_x*num_y).reshape(
+      num_diets, num_x, num_y)
+  width_x = np.diff(np.minimum(np.arange(num_x + 1)*block_size + low_x,
+                               high_x))
+  width_y = np.diff(np.minimum(np.arange(num_y + 1)*block_size + low_y,
+                               high_y))
+  return food, counts, np.outer(width_x, width_y)
+
+def render_density(world, pixels=FRAME_PIXELS, section=None,
+                   food_scale=None, creature_scale=None):
+  """Paints a downsampled map of where the food and creatures are.
+
+  For fields too big to draw a glyph per cell: the field is split into
+  blocks, about pixels of them to a side, and each block is one pixel. A
+  block goes from grass to food color with the food per cell in it, and is
+  then tinted with the color of each diet type (smallest glyphs first) by the
+  creatures per cell of that diet.
+
+  Arguments:
+    world: World; The world to draw.
+    pixels: int; Rough width of the image, in pixels.
+    section: (low_x, high_x, low_y, high_y); Only draw [low_x, high_x) x
+      [low_y, high_y). Defaults to the whole field.
+    food_scale: float; Food per cell that gets the full food color. Defaults
+      to the most in any block.
+    creature_scale: float; Creatures per cell that get their diet's full
+      color. Defaults to the most of any diet in any block.
+    Fix the scales to keep the colors steady over the frames of a movie or
+    the tiles of a pyramid.
+  Returns:
+    uint8 np.array (X, Y, 3); RGB image, one pixel per block.
+  """
+  field_size = world.field.field_size
+  low_x, high_x, low_y, high_y = section or (0, field_size, 0, field_size)
+  block_size = max(1, -(-max(high_x - low_x, high_y - low_y)//pixels))
+  food, counts, cells = density_counts(world, block_size, section)
+
+  def level(density, scale):
+    scale = scale or density.max() or 1
+    return np.clip(density/scale, 0, 1)[..., None]
+
+  image = np.empty(food.shape + (3,))
+  image[:] = PALETTE[COLOR["GRASS"]]
+  image += (PALETTE[COLOR["FOOD"]] - image)*level(food/cells, food_scale)
+  glyphs = diet_glyphs(world.trophic_table.diet_types)
+  densities = counts/cells
+  creature_scale = creature_scale or densities.max()
+  for code in np.argsort([size for color, size in glyphs], kind="stable"):
+    color, size = glyphs[code]
+    image += (PALETTE[color] - image)*level(densities[code], creature_scale)
+  return image.round().astype(np.uint8)
+
+def render_tile(world, zoom, tile_x, tile_y, tile_pixels=256,
+                food_scale=None, creature_scale=None):
+  """Paints one tile of a pyramid of density maps (see render_density).
+
+  At zoom z the field is split into 2**z x 2**z tiles, so each zoom level
+  doubles the detail. Only the tile's section of the field is looked at.
+
+  Arguments:
+    world: World; The world to draw.
+    zoom: int; Zoom level, 0 is the whole field in one tile.
+    tile_x, tile_y: int; Which tile, in [0, 2**zoom).
+    tile_pixels: int; Width of a tile, in pixels.
+    food_scale, creature_scale: float; See render_density.
+  Returns:
+    uint8 np.array (tile_pixels, tile_pixels, 3); RGB image. Tiles hanging
+      off the high edges of the field are padded with white.
+  """
+  field_size = world.field.field_size
+  span = -(-field_size//2**zoom)
+  low_x, low_y = tile_x*span, tile_y*span
+  if not (0 <= low_x < field_size and 0 <= low_y < field_size):
+    raise ValueError("There's no tile " + str((tile_x, tile_y)) +
+                     " at zoom " + str(zoom))
+  high_x, high_y = min(low_x + span, field_size), min(low_y + span, field_size)
+  image = render_density(world, tile_pixels, (low_x, high_x, low_y, high_y),
+                         food_scale, creature_scale)
+  # Blow the blocks up to the tile's scale, tile_pixels for span cells.
+  width = max(1, round((high_x - low_x)*tile_pixels/span))
+  height = max(1, round((high_y - low_y)*tile_pixels/span))
+  tile = np.full((tile_pixels, tile_pixels, 3), PALETTE[COLOR["WHITE"]],
+                 dtype=np.uint8)
+  tile[:width, :height] = Image.fromarray(image).resize((height, width),
+                                                         Image.NEAREST)
+  return tile
+
+def save_tile_pyramid(world, directory, max_zoom=None, tile_pixels=256):
+  """Saves every tile of a pyramid of density maps, zoom/x_y.png.
+
+  The colors are scaled the same way on every tile (by the zoom 0 map), so
+  they can be compared. There are 4**zoom tiles at each zoom, so on really
+  big fields keep max_zoom low and use render_tile for a closer look at the
+  regions you care about.
+
+  Arguments:
+    world: World; The world to draw.
+    directory: string; Where to save the tiles.
+    max_zoom: int; Deepest zoom level to save. Defaults to the first one with
+      a pixel per cell.
+    tile_pixels: int; Width of a tile, in pixels.
+  Returns:
+    int; How many tiles were saved.
+  """
+  field_size = world.field.field_size
+  if max_zoom is None:
+    max_zoom = max(0, int(np.ceil(np.log2(field_size/tile_pixels))))
+  food, counts, cells = density_counts(
+      world, max(1, -(-field_size//tile_pixels)))
+  food_scale = (food/cells).max() or 1
+  creature_scale = (counts/cells).max() or 1
+  num_tiles = 0
+  for zoom in range(max_zoom + 1):
+    os.makedirs(os.path.join(directory, str(zoom)), exist_ok=True)
+    span = -(-field_size//2**zoom)
+    for tile_x in range(-(-field_size//span)):
+      for tile_y in range(-(-field_size//span)):
+        tile = render_tile(world, zoom, tile_x, tile_y, tile_pixels,
+                           food_scale, creature_scale)
+        Image.fromarray(tile).save(
+            os.path.join(directory, str(zoom),
+                         str(tile_x) + "_" + str(tile_y) + ".png"),
+            compress_level=1)
+        num_tiles += 1
+  return num_tiles
+
+def to_image(frame):
+  """Returns frame as a PIL image (palette mode, unless it's already RGB)."""
+  if frame.ndim == 3:
+    return Image.fromarray(frame)
+  image = Image.fromarray(frame, mode="P")
+  image.putpalette(PALETTE.reshape(-1).tolist())
+  return image
+
+def save_frame(frame, file_name, title=None):
+  """Saves a frame as a PNG.
+
+  Without a title the palette indices are written out directly (fast). With
+  one, matplotlib draws the frame with the title above it.
+
+  Arguments:
+    frame: uint8 np.array; Palette indices (see render_frame), or an RGB
+      image (see render_density).
+    file_name: string; Where to save the PNG.
+    title: string; Optional title.
+  """
+  if title is None:
+    to_image(frame).save(file_name, compress_level=1)
+    return
+  import matplotlib
+  matplotlib.use('Agg')
+  from matplotlib import pyplot as plt
+  fig, ax = plt.subplots(1, 1, figsize=(6, 6.4))
+  ax.imshow(PALETTE[frame] if frame.ndim == 2 else frame,
+            interpolation="nearest")
+  ax.set_title(title)
+  ax.axis('off')
+  fig.savefig(file_name)
+  plt.close(fig)
+
+def _palette_image():
+  """A 1x1 image carrying PALETTE, for quantizing other images onto it."""
+  image = Image.new("P", (1, 1))
+  image.putpalette(PALETTE.reshape(-1).tolist())
+  return image
+
+def gif_frame(frame, frame_duration=100):
+  """Encodes one frame of an animated gif (see GifWriter).
+
+  Arguments:
+    frame: uint8 np.array or PIL image; A frame of palette indices (see
+      render_frame), or any image (including RGB arrays), which is mapped
+      onto PALETTE.
+    frame_duration: int; How long to show the frame, in milliseconds.
+  Returns:
+    (bytes, (int, int)); The encoded frame and its (width, height).
+  """
+  if isinstance(frame, np.ndarray) and frame.ndim == 2:
+    image = to_image(frame)
+  else:
+    if isinstance(frame, np.ndarray):
+      frame = to_image(frame)
+    # No dithering, the palette has all the colors we draw with.
+    image = frame.convert("RGB").quantize(palette=_palette_image(), dither=0)
+  data = GifImagePlugin.getdata(image, duration=frame_duration)
+  return b"".join(data), image.size
+
+class GifWriter:
+  """Writes an animated gif a frame at a time.
+
+  Frames are encoded and written out as soon as they're added, against one
+  global color table (PALETTE), so memory stays flat however long the gif
+  gets and no frames need to go through files first.
+  ```
+  with GifWriter("days.gif", frame_duration=800) as gif:
+    for day in range(100):
+      world.pass_day(40)
+      gif.add(render_world(world))
+  ```
+
+  Arguments:
+    file_name: string; Where to save the gif.
+    frame_duration: int; How long to show each frame, in milliseconds.
+    loop: int; How many times to play the gif (0 is forever).
+  """
+  def __init__(self, file_name, frame_duration=100, loop=0):
+    self.file_name = file_name
+    self.frame_duration = frame_duration
+    self.loop = loop
+    self.size = None
+    self.num_frames = 0
+    self._file = open(file_name, "wb")
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+  def _write_header(self, size):
+    """Screen size, the global color table and the looping extension."""
+    # The color table has 2**(bits + 1) entries, padded with black.
+    bits = max(0, int(np.ceil(np.log2(len(PALETTE)))) - 1)
+    color_table = np.zeros((2**(bits + 1), 3), dtype=np.uint8)
+    color_table[:len(PALETTE)] = PALETTE
+    self._file.write(
+        b"GIF89a" +
+        np.array(size, dtype="<u2").tobytes() +
+        bytes([0x80 | bits, COLOR["GRASS"], 0]) +
+        color_table.tobytes() +
+        b"!\xff\x0bNETSCAPE2.0\x03\x01" +
+        np.array(self.loop, dtype="<u2").tobytes() + b"\x00")
+    self.size = size
+
+  def add_encoded(self, data, size):
+    """Appends a frame already encoded by gif_frame."""
+    if self.size is None:
+      self._write_header(size)
+    elif size != self.size:
+      raise ValueError("Every frame of a gif must be the same size, got " +
+                       str(size) + " after " + str(self.size))
+    self._file.write(data)
+    self.num_frames += 1
+
+  def add(self, frame):
+    """Appends a frame (see gif_frame)."""
+    self.add_encoded(*gif_frame(frame, self.frame_duration))
+
+  def extend(self, frames):
+    """Appends every frame of an iterable, e.g. a generator of frames."""
+    for frame in frames:
+      self.add(frame)
+
+  def close(self):
+    """Finishes the gif."""
+    if self._file.closed:
+      return
+    self._file.write(b";")
+    self._file.close()
@@ -1,24 +1,33 @@
 import argparse
 import os
-import pickle
 
 from util import save_gif
 
 import sys
 sys.path.insert(1, sys.path[0]+'/..')
 
+import checkpoint
+from frames import FramePipeline
 from world import World, DailyHistory
 from SET_ME import TMP_DIR
 
 def main():
   parser = argparse.ArgumentParser()
-  parser.add_argument("--world_pkl", "-wp", help="pickled world file")
+  parser.add_argument("--world_checkpoint", "-wc",
+                      help="world checkpoint file (from save_checkpoint)")
+  parser.add_argument("--world_pkl", "-wp",
+                      help="old pickled world file, converted to a checkpoint")
   args = parser.parse_args()
-  if args.world_pkl:
+  if args.world_checkpoint:
     # Reuse old world.
-    print("Reusing world", args.world_pkl)
-    with open(TMP_DIR + args.world_pkl, "rb") as f:
-      my_world=pickle.load(f)
+    print("Reusing world", args.world_checkpoint)
+    my_world = World.load_checkpoint(TMP_DIR + args.world_checkpoint)
+  elif args.world_pkl:
+    # Reuse an old pickled world, saving it as a checkpoint for next time.
+    print("Converting world", args.world_pkl)
+    my_world = checkpoint.import_pickle(
+        TMP_DIR + args.world_pkl,
+        TMP_DIR + os.path.splitext(args.world_pkl)[0] + ".npz")
   else:
     # Create a small world, with lots of food and 1 creature.
     print("Creating World...")
@@ -32,19 +41,23 @@ def main():
     # Overwrite location to start the creature near the middle of the map.
     my_world.creatures[0].location = [20, 20]
 
-  for i in range(40):
-    my_world.pass_day(40,
-                      plot_steps=(True if my_world.days_passed < 7 else False))
-    my_world.show_me(save_plot=True)
-    print("days_passed: ", my_world.days_passed,
-          "; creatures: ", len(my_world.creatures))
+  # The step frames are drawn in the background while the world carries on,
+  # straight into a gif.
+  with FramePipeline(gif_name=TMP_DIR + "the_first_days.gif",
+                     frame_duration=100) as frame_pipeline:
+    for i in range(40):
+      my_world.pass_day(
+          40,
+          plot_steps=(True if my_world.days_passed < 7 else False),
+          frame_pipeline=frame_pipeline)
+      my_world.show_me(save_plot=True, annotate=True)
+      print("days_passed: ", my_world.days_passed,
+            "; creatures: ", len(my_world.creatures))
 
   my_world.plot_history(save_plot=True)
-  save_gif("*_t_*.png", "the_first_days", delete_imgs=True, frame_duration=100)
   save_gif("world_2*.png", "each_day", delete_imgs=True, frame_duration=800)
 
-  with open(TMP_DIR + "my_world.pkl", "wb") as f:
-    pickle.dump(my_world, f)
+  my_world.save_checkpoint(TMP_DIR + "my_world.npz")
 
 if __name__ == "__main__":
   main()
\ No newline at end of file
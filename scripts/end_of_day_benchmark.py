@@ -0,0 +1,65 @@
+import argparse
+import time
+import numpy as np
+
+import sys
+sys.path.insert(1, sys.path[0]+'/..')
+
+from world import World
+
+def time_end_day(engine, num_creatures, repeats):
+  """Times World.end_day for a world with num_creatures creatures.
+
+  Everybody starts the evening with 0, 1 or 2 food, so about a third of the
+  creatures die, a third just get by and a third reproduce.
+
+  Arguments:
+    engine: string; World engine to time (see World).
+    num_creatures: int; Number of creatures in the world.
+    repeats: int; Number of fresh worlds to time; the best time is kept.
+  Returns:
+    float; Seconds taken by the fastest end_day.
+  """
+  # Keep the density of creatures (and food) fixed as the world grows.
+  field_size = int(np.ceil(np.sqrt(4*num_creatures)))
+  best = np.inf
+  for repeat in range(repeats):
+    world = World(field_size, 0.1, num_creatures, engine=engine, seed=repeat)
+    food = world.rng.integers(3, size=num_creatures)
+    if world.population is not None:
+      world.population.food_stored = food
+    else:
+      for creature, creature_food in zip(world.creatures, food):
+        creature.food_stored = creature_food
+    # We went behind the world's back, so it has to count again.
+    world.recount()
+
+    start = time.perf_counter()
+    world.end_day()
+    best = min(best, time.perf_counter() - start)
+  return best
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--max_creatures", "-mc", type=int, default=10**6,
+                      help="largest world to time with the ARRAYS engine")
+  parser.add_argument("--max_object_creatures", "-mo", type=int,
+                      default=10**5,
+                      help="largest world to time with the OBJECTS engine")
+  parser.add_argument("--repeats", "-r", type=int, default=3)
+  args = parser.parse_args()
+
+  print("%-8s %10s %12s %16s" % (
+      "engine", "creatures", "end_day (s)", "us per creature"))
+  for engine, max_creatures in [("OBJECTS", args.max_object_creatures),
+                                ("ARRAYS", args.max_creatures)]:
+    num_creatures = 1000
+    while num_creatures <= max_creatures:
+      seconds = time_end_day(engine, num_creatures, args.repeats)
+      # Linear scaling means this last column stays (roughly) flat.
+      print("%-8s %10i %12.4f %16.2f" % (
+          engine, num_creatures, seconds, 1e6*seconds/num_creatures))
+      num_creatures *= 10
+
+if __name__ == "__main__":
+  main()
@@ -13,7 +13,10 @@ import sys
 sys.path.insert(1, sys.path[0]+'/..')
 
 from SET_ME import TMP_DIR
-from world import World, DailyHistory
+import stopping
+import sweeps
+import thresholds
+from world import World
 
 def frac_true(series):
   listy = series.tolist()
@@ -24,9 +27,83 @@ def d_frac_true(series):
   return np.sqrt(sum(listy)/len(listy)*(1-sum(listy)/len(listy))/len(listy))
 
 
+# The sweep: every point is a world, run for num_days days. Everything the
+# summaries depend on is in the points (one-value axes for the settings
+# every world shares), since the points are what the sweep's cache is keyed
+# by: change a setting and the worlds get run again.
+GRID = sweeps.grid(
+    steps_per_day=range(40, 80, 10),
+    field_size=[25],
+    food_density=[.03],
+    num_days=[200],
+    # Days before the population is counted as settled.
+    stable_threshold=[100],
+    food_spoils=[True],
+    creatures_randomly_teleport=[True],
+    engine=["TRAJECTORIES"],
+    trial=range(3))
+
+def padded(column, num_days):
+  """A column of the history books, padded with zeros out to num_days days.
+
+  A world that died out stopped early, but for the summaries it's as if it
+  had kept going with nobody in it (as it used to).
+  """
+  column = np.asarray(column, dtype=np.float64)
+  return np.concatenate([column, np.zeros(num_days + 1 - len(column))])
+
+def run_world(point, seed):
+  """Runs a sweep point's world and sums up how its creatures fared."""
+  field_size = point['field_size']
+  food_density = point['food_density']
+  this_world = World(field_size,
+                     food_density,
+                     int(np.round(field_size**2*food_density)),
+                     food_spoils=point['food_spoils'],
+                     creatures_randomly_teleport=(
+                         point['creatures_randomly_teleport']),
+                     engine=point['engine'],
+                     seed=seed)
+  # No need to keep going once everybody's dead: the empty days are just
+  # zeros.
+  num_days = point['num_days']
+  this_world.run(num_days, point['steps_per_day'],
+                 stop_when=[stopping.Extinct()])
+  this_world.plot_history(save_plot=True)
+  history = this_world.history
+  stable_threshold = point['stable_threshold']
+  creature_history = padded(history.num_creatures,
+                            num_days)[stable_threshold:]
+  birth_history = padded(history.num_births, num_days)[stable_threshold:]
+  death_history = padded(history.num_deaths, num_days)[stable_threshold:]
+  return {
+      'avg_num_creatures': np.mean(creature_history),
+      'sem_num_creatures': stats.sem(creature_history),
+      'avg_births': np.mean(birth_history),
+      'sem_births': stats.sem(birth_history),
+      'avg_deaths': np.mean(death_history),
+      'sem_deaths': stats.sem(death_history),
+      'creatures_survived': this_world.history.num_creatures[-1] > 0}
+
 def main():
   parser = argparse.ArgumentParser()
   parser.add_argument("--data_pkl", "-dp", help="previous data pkl")
+  parser.add_argument("--seed", "-s", type=int,
+                      help="seed, for reproducible worlds")
+  parser.add_argument("--cache_dir", "-cd", default="lifetime_study_cache",
+                      help="where finished sweep points are kept (under "
+                           "TMP_DIR), so a rerun picks up where it left off")
+  parser.add_argument("--processes", "-p", type=int,
+                      help="worker processes (default: one per CPU)")
+  parser.add_argument("--find_threshold", "-ft", action="store_true",
+                      help="search for the steps per day where half the "
+                           "worlds survive, rather than marking 72.4")
+  parser.add_argument("--low", type=int,
+                      help="fewest steps per day --find_threshold tries "
+                           "(default: the sweep's fewest)")
+  parser.add_argument("--high", type=int,
+                      help="most steps per day --find_threshold tries "
+                           "(default: the sweep's most)")
   args = parser.parse_args()
   if args.data_pkl:
     # Reuse old world.
@@ -34,67 +111,43 @@ def main():
     with open(TMP_DIR + args.data_pkl, "rb") as f:
       data=pickle.load(f)
   else:
-    print("Will save new data")
-    data = pd.DataFrame(columns=[
-        'steps_per_day',
-        'trial',
-        'avg_num_creatures',
-        'sem_num_creatures',
-        'avg_births',
-        'sem_births',
-        'avg_deaths',
-        'sem_deaths',
-        'creatures_survived',
-        'field_size',
-        'food_density']
-    ).astype({
-        'steps_per_day': 'int32',
-        'trial': 'int32',
-        'avg_num_creatures': 'float64',
-        'sem_num_creatures': 'float64',
-        'avg_births': 'float64',
-        'sem_births': 'float64',
-        'avg_deaths': 'int32',
-        'sem_deaths': 'float64',
-        'creatures_survived': 'bool',
-        'field_size': 'int64',
-        'food_density': 'float64'})
-
-  food_density = .03
-  stable_threshold = 100
-
-  num_steps_array = range(40, 80, 10)
-  num_trials = 3
-  field_size = 25
-
-  for i, num_steps in enumerate(num_steps_array):
-    for trial in range(num_trials):
-      print("fraction done:",
-            np.round((i*num_trials+trial)/(len(num_steps_array)*num_trials), 2))
-      this_world = World(field_size,
-                         food_density,
-                         int(np.round(field_size**2*food_density)),
-                         food_spoils=True,
-                         creatures_randomly_teleport=True)
-      for j in range(200):
-        this_world.pass_day(num_steps)
-      this_world.plot_history(save_plot=True)
-      creature_history = [x.num_creatures for x in this_world.history[stable_threshold:]]
-      birth_history = [x.num_births for x in this_world.history[stable_threshold:]]
-      death_history = [x.num_deaths for x in this_world.history[stable_threshold:]]
-      this_df = {
-          'steps_per_day': num_steps,
-          'trial': trial,
-          'avg_num_creatures': np.mean(creature_history),
-          'sem_num_creatures': stats.sem(creature_history),
-          'avg_births': np.mean(birth_history),
-          'sem_births': stats.sem(birth_history),
-          'avg_deaths': np.mean(death_history),
-          'sem_deaths': stats.sem(death_history),
-          'creatures_survived': this_world.history[-1].num_creatures > 0,
-          'field_size': this_world.field.field_size,
-          'food_density': food_density}
-      data = pd.concat([data, pd.DataFrame(this_df, index=[i])])
+    print("Running", len(GRID), "worlds")
+    data = pd.DataFrame(sweeps.run(
+        run_world, GRID, TMP_DIR + args.cache_dir, seed=args.seed,
+        processes=args.processes)).astype({
+            'steps_per_day': 'int32',
+            'trial': 'int32',
+            'avg_num_creatures': 'float64',
+            'sem_num_creatures': 'float64',
+            'avg_births': 'float64',
+            'sem_births': 'float64',
+            'avg_deaths': 'float64',
+            'sem_deaths': 'float64',
+            'creatures_survived': 'bool',
+            'field_size': 'int64',
+            'food_density': 'float64'})
+  food_density = data['food_density'].iloc[0]
+
+  # Steps per day where half the worlds survive.
+  threshold = 72.4
+  if args.find_threshold:
+    settings = GRID[0]
+    steps_per_day = [point['steps_per_day'] for point in GRID]
+    low = min(steps_per_day) if args.low is None else args.low
+    high = max(steps_per_day) if args.high is None else args.high
+    found = thresholds.find_threshold(
+        thresholds.ensemble_survival(
+            num_days=settings['num_days'],
+            field_size=settings['field_size'],
+            food_fill_factor=food_density,
+            food_spoils=settings['food_spoils'],
+            creatures_randomly_teleport=(
+                settings['creatures_randomly_teleport'])),
+        low=low, high=high, seed=args.seed)
+    threshold = found.estimate
+    print("Half the worlds survive at", threshold, "steps per day (between",
+          found.low, "and", found.high, "after", found.num_trials,
+          "worlds,", found.reason + ")")
 
   survived_data = data[data['creatures_survived']]
   frac_survived_df = data.groupby(
@@ -106,7 +159,7 @@ def main():
   fig3,ax3 = plt.subplots(1, 1, figsize = (6, 4))
   fig4,ax4 = plt.subplots(1, 1, figsize = (6, 4))
 
-  ax1.plot([72.4, 72.4], [-.5, 1.5], '-.', color='0.8', label=None)
+  ax1.plot([threshold, threshold], [-.5, 1.5], '-.', color='0.8', label=None)
   # data.groupby('steps_per_day').agg({'creatures_survived': frac_true}).plot(ax=ax)
   for fs in sorted(frac_survived_df['field_size'].unique()):
     this_field_size_survival_data = frac_survived_df[frac_survived_df['field_size']==fs]
@@ -121,7 +174,7 @@ def main():
   ax1.set_ylabel('frac sims w/ creatures after 200 days')
   ax1.legend(title="Linear Field Size ($\sqrt{M}$)")
 
-  ax1.plot([72.4, 72.4], [-.5, 1.5], '-.', color='0.8', label=None) # [72.4, 72.4]
+  ax1.plot([threshold, threshold], [-.5, 1.5], '-.', color='0.8', label=None)
   for fs in sorted(survived_data['field_size'].unique()):
     this_field_size_survived_data = survived_data[survived_data['field_size']==fs]
     ax2.errorbar(
@@ -147,8 +200,8 @@ def main():
             (this_field_size_survived_data['avg_births']*this_field_size_survived_data['sem_num_creatures']/this_field_size_survived_data['avg_num_creatures']**2)**2),
         fmt='.', label="%i" % (fs)
     )
-  ax4.plot([72, 200], [0.315, 0.315], '-.', color='0.8', label=None)
-  ax4.plot([72, 200], [0.3333, 0.3333], '-.', color='0.8', label=None)
+  ax4.plot([threshold, 200], [0.315, 0.315], '-.', color='0.8', label=None)
+  ax4.plot([threshold, 200], [0.3333, 0.3333], '-.', color='0.8', label=None)
 
   n_array = np.arange(40, 200)
 
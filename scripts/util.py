@@ -5,30 +5,28 @@ from PIL import Image
 import sys
 sys.path.insert(1, sys.path[0]+'/..')
 
+from render import GifWriter
 from SET_ME import TMP_DIR
 
 def save_gif(file_pattern, gif_name, delete_imgs=False, frame_duration=100):
-  """Using Pillow image library to change alphabetical png files into gifs.
+  """Streams alphabetical png files into a gif, one image at a time.
+
+  Only one image is open at once (see render.GifWriter), so memory stays flat
+  however many files there are.
 
   Arguments:
     file_pattern: string; File pattern of the images to use.
     gif_name: string; Filename to save ('.gif' will be appended automatically).
   """
-  frames = []
-  imgs = glob.glob(TMP_DIR + file_pattern)
-
-  # Open the images.
-  for i in sorted(imgs):
-    frames.append(Image.open(i))
-
-  if len(frames) == 0:
+  imgs = sorted(glob.glob(TMP_DIR + file_pattern))
+  if len(imgs) == 0:
     return
 
-  # Save into looping gif file.
-  frames[0].save(TMP_DIR + gif_name + '.gif',
-                 format='GIF',
-                 append_images=frames[1:],
-                 save_all=True,
-                 duration=frame_duration, loop=0)
+  # Append the images to a looping gif file.
+  with GifWriter(TMP_DIR + gif_name + '.gif',
+                 frame_duration=frame_duration) as gif:
+    for i in imgs:
+      with Image.open(i) as frame:
+        gif.add(frame)
   if delete_imgs:
-    [os.remove(file) for file in imgs]
\ No newline at end of file
+    [os.remove(file) for file in imgs]
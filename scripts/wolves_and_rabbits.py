@@ -1,24 +1,34 @@
 import argparse
+import os
 import numpy as np
-import pickle
 
 from util import save_gif
 
 import sys
 sys.path.insert(1, sys.path[0]+'/..')
 
+import checkpoint
+from frames import FramePipeline
 from world import World, DailyHistory
 from SET_ME import TMP_DIR
 
 def main():
   parser = argparse.ArgumentParser()
-  parser.add_argument("--world_pkl", "-wp", help="pickled world file")
+  parser.add_argument("--world_checkpoint", "-wc",
+                      help="world checkpoint file (from save_checkpoint)")
+  parser.add_argument("--world_pkl", "-wp",
+                      help="old pickled world file, converted to a checkpoint")
   args = parser.parse_args()
-  if args.world_pkl:
+  if args.world_checkpoint:
     # Reuse old world.
-    print("Reusing world", args.world_pkl)
-    with open(TMP_DIR + args.world_pkl, "rb") as f:
-      my_world=pickle.load(f)
+    print("Reusing world", args.world_checkpoint)
+    my_world = World.load_checkpoint(TMP_DIR + args.world_checkpoint)
+  elif args.world_pkl:
+    # Reuse an old pickled world, saving it as a checkpoint for next time.
+    print("Converting world", args.world_pkl)
+    my_world = checkpoint.import_pickle(
+        TMP_DIR + args.world_pkl,
+        TMP_DIR + os.path.splitext(args.world_pkl)[0] + ".npz")
   else:
     # Create a small world, with lots of food, rabbits and wolves.
     field_size = 100
@@ -37,25 +47,26 @@ def main():
     #                           creature_diet_type="SUPER_CARNIVORE",
     #                           creatures_randomly_teleport=True) # They all died if they don't....
 
-  for i in range(60):
-    my_world.pass_day(40,
-                      plot_steps=(True if i < 10 else False))
-    my_world.show_me(save_plot=True)
-    print("days_passed:", my_world.days_passed,
-          "; creatures:", len(my_world.creatures),
-          "; rabbits:", len([x for x in my_world.creatures
-                               if x.diet_type == "HERBIVORE"]),
-          "; wolves:", len([x for x in my_world.creatures
-                              if x.diet_type == "CARNIVORE"]),
-          "; wolf-eaters:", len([x for x in my_world.creatures
-                              if x.diet_type == "SUPER_CARNIVORE"]))
+  # The step frames are drawn in the background while the world carries on,
+  # straight into a gif.
+  with FramePipeline(gif_name=TMP_DIR + "the_first_days.gif",
+                     frame_duration=100) as frame_pipeline:
+    for i in range(60):
+      my_world.pass_day(40,
+                        plot_steps=(True if i < 10 else False),
+                        frame_pipeline=frame_pipeline)
+      my_world.show_me(save_plot=True, annotate=True)
+      stats = my_world.stats()
+      print("days_passed:", stats.day,
+            "; creatures:", stats.num_creatures,
+            "; rabbits:", stats.diet_counts["HERBIVORE"],
+            "; wolves:", stats.diet_counts["CARNIVORE"],
+            "; wolf-eaters:", stats.diet_counts["SUPER_CARNIVORE"])
 
   my_world.plot_history(save_plot=True)
-  save_gif("*_t_*.png", "the_first_days", delete_imgs=True, frame_duration=100)
   save_gif("world_2*.png", "each_day", delete_imgs=True, frame_duration=800)
 
-  with open(TMP_DIR + "my_world.pkl", "wb") as f:
-    pickle.dump(my_world, f)
+  my_world.save_checkpoint(TMP_DIR + "my_world.npz")
 
 if __name__ == "__main__":
   main()
\ No newline at end of file
@@ -0,0 +1,87 @@
+import collections
+
+import numpy as np
+
+# Why World.run stopped.
+#   reason: string; The stop condition's reason (see the conditions below),
+#     or MAX_DAYS if none of them came up.
+#   days_run: int; Days passed in this run.
+#   days_passed: int; The world's days_passed when it stopped.
+#   message: string; Says what happened, for people.
+Stop = collections.namedtuple(
+    'Stop',
+    ['reason',
+     'days_run',
+     'days_passed',
+     'message']
+)
+
+# A stop condition is anything with a reason (an UPPERCASE string) that can
+# be called on a world, giving a message if the world should stop or None
+# if it should carry on. World.run checks them before every day.
+
+class Extinct:
+  """Stops once everybody's dead."""
+  reason = "EXTINCTION"
+
+  def __call__(self, world):
+    if world.stats().num_creatures == 0:
+      return "Everybody died out"
+    return None
+
+class DietExtinct:
+  """Stops once every creature of a diet type is dead.
+
+  Stops right away if there weren't any to begin with.
+
+  Arguments:
+    diet_type: string; One of the world's trophic_table.diet_types.
+  """
+  reason = "DIET_EXTINCTION"
+
+  def __init__(self, diet_type):
+    self.diet_type = diet_type
+
+  def __call__(self, world):
+    if world.stats().diet_counts[self.diet_type] == 0:
+      return "Every " + self.diet_type + " died out"
+    return None
+
+class Stationary:
+  """Stops once the number of creatures has settled down.
+
+  Looks at the last 2*window days of num_creatures in the history books,
+  and stops when the mean and the standard deviation of the later window
+  are both within a tolerance of the earlier one's (relative to the bigger
+  of the two). Neither moving means the population is fluctuating around an
+  equilibrium rather than still heading somewhere.
+
+  Arguments:
+    window: int; Days in each of the two windows compared.
+    mean_tolerance: float; How far apart the means can be, as a fraction.
+    std_tolerance: float; How far apart the standard deviations can be, as a
+      fraction (they're noisier than the means).
+  """
+  reason = "STATIONARY"
+
+  def __init__(self, window=50, mean_tolerance=0.05, std_tolerance=0.25):
+    if window < 2:
+      raise ValueError("Stationary needs a window of at least 2 days, got " +
+                       str(window))
+    self.window = window
+    self.mean_tolerance = mean_tolerance
+    self.std_tolerance = std_tolerance
+
+  def __call__(self, world):
+    num_creatures = world.history.num_creatures
+    if len(num_creatures) < 2*self.window:
+      return None
+    recent = np.asarray(num_creatures[-2*self.window:], dtype=np.float64)
+    before, after = recent[:self.window], recent[self.window:]
+    means = before.mean(), after.mean()
+    stds = before.std(), after.std()
+    if (abs(means[1] - means[0]) <= self.mean_tolerance*max(means) and
+        abs(stds[1] - stds[0]) <= self.std_tolerance*max(stds)):
+      return ("The number of creatures settled at %.1f +/- %.1f over the "
+              "last %d days" % (means[1], stds[1], self.window))
+    return None
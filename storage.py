@@ -0,0 +1,129 @@
+import json
+import os
+
+import numpy as np
+
+# Bump this if the layout of a world's directory changes.
+STORAGE_VERSION = 3
+
+def array_path(directory, name):
+  return os.path.join(directory, name + ".npy")
+
+def create_array(directory, name, shape, dtype):
+  """Creates a zeroed, memory-mapped .npy file directory/name.npy.
+
+  Arguments:
+    directory: string; Where to put the file.
+    name: string; Name of the array (the file is name.npy).
+    shape: tuple; Shape of the array.
+    dtype: np.dtype; Type of the array.
+  Returns:
+    np.memmap; The new array, backed by the file.
+  """
+  return np.lib.format.open_memmap(array_path(directory, name), mode="w+",
+                                   dtype=dtype, shape=shape)
+
+def open_array(directory, name):
+  """Opens directory/name.npy for reading and writing, without loading it."""
+  return np.lib.format.open_memmap(array_path(directory, name), mode="r+")
+
+def grow_array(directory, name, array, num_rows, capacity):
+  """Moves the first num_rows rows of array into a bigger file.
+
+  The new file is written next to the old one and then swapped in, so a crash
+  leaves one or the other.
+
+  Returns:
+    np.memmap; The new array, with capacity rows.
+  """
+  grown = create_array(directory, name + ".grow",
+                       (capacity,) + array.shape[1:], array.dtype)
+  grown[:num_rows] = array[:num_rows]
+  grown.flush()
+  del grown
+  os.replace(array_path(directory, name + ".grow"),
+             array_path(directory, name))
+  return open_array(directory, name)
+
+def replace_array(directory, name, values):
+  """Stores values as directory/name.npy, replacing whatever was there.
+
+  Like grow_array, the new file is written first and then swapped in.
+
+  Returns:
+    np.memmap; The stored values.
+  """
+  stored = create_array(directory, name + ".new", values.shape, values.dtype)
+  stored[:] = values
+  stored.flush()
+  del stored
+  os.replace(array_path(directory, name + ".new"),
+             array_path(directory, name))
+  return open_array(directory, name)
+
+def rows_path(directory, name):
+  return os.path.join(directory, name + ".bin")
+
+def _row_bytes(dtype, shape):
+  return np.dtype(dtype).itemsize*int(np.prod(shape, dtype=np.int64))
+
+def append_rows(directory, name, rows, num_rows):
+  """Appends rows to directory/name.bin, an append-only column.
+
+  The file is nothing but the rows' bytes, one after the other, so a run that
+  crashes leaves at worst a partial last row behind, which open_rows ignores.
+
+  Arguments:
+    directory: string; Where the file is.
+    name: string; Name of the column (the file is name.bin).
+    rows: np.array; The rows to add.
+    num_rows: int; How many rows the file should already have. Anything
+      after them (e.g. a row half written before a crash) is dropped first.
+  """
+  rows = np.ascontiguousarray(rows)
+  with open(rows_path(directory, name), "ab") as f:
+    expected = num_rows*_row_bytes(rows.dtype, rows.shape[1:])
+    if f.tell() != expected:
+      f.truncate(expected)
+    f.write(rows.tobytes())
+
+def open_rows(directory, name, dtype, shape=(), num_rows=None):
+  """Maps the complete rows of directory/name.bin, read only.
+
+  Arguments:
+    directory: string; Where the file is.
+    name: string; Name of the column (the file is name.bin).
+    dtype: np.dtype; Type of the column.
+    shape: tuple; Shape of a single row.
+    num_rows: int; Map at most this many rows. Defaults to all of them.
+  Returns:
+    np.array (rows,) + shape; Backed by the file, nothing is read up front.
+  """
+  path = rows_path(directory, name)
+  available = (os.path.getsize(path)//_row_bytes(dtype, shape)
+               if os.path.exists(path) else 0)
+  if num_rows is not None:
+    available = min(available, num_rows)
+  if available == 0:
+    return np.zeros((0,) + tuple(shape), dtype=dtype)
+  return np.memmap(path, dtype=dtype, mode="r",
+                   shape=(available,) + tuple(shape))
+
+def write_metadata(directory, metadata, name="metadata"):
+  """Writes directory/<name>.json (atomically: all or nothing)."""
+  metadata = dict(metadata, storage_version=STORAGE_VERSION)
+  path = os.path.join(directory, name + ".json")
+  with open(path + ".tmp", "w") as f:
+    json.dump(metadata, f)
+  os.replace(path + ".tmp", path)
+
+def read_metadata(directory, name="metadata"):
+  """Reads directory/<name>.json."""
+  with open(os.path.join(directory, name + ".json")) as f:
+    metadata = json.load(f)
+  if metadata.get("storage_version") != STORAGE_VERSION:
+    raise ValueError(
+        directory + " holds a world stored with version " +
+        str(metadata.get("storage_version")) + ", expected " +
+        str(STORAGE_VERSION))
+  return metadata
@@ -0,0 +1,101 @@
+import numpy as np
+
+# Counter-based random numbers: rather than taking turns drawing from one
+# generator, every random number is a hash of what it's for (a key, a day,
+# a creature...). Numbers keyed differently are independent, and a number
+# is the same however many others get drawn around it, so lots of
+# replicates can draw all at once without their numbers getting mixed up.
+# The hash is splitmix64's.
+
+# splitmix64's increment (2**64 divided by the golden ratio).
+GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+def mix(z):
+  """Scrambles uint64s into random looking uint64s (splitmix64's finalizer)."""
+  with np.errstate(over='ignore'):
+    z = (z ^ (z >> np.uint64(30)))*np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27)))*np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+def hash_words(*words):
+  """Hashes a few words into one random uint64.
+
+  Arguments:
+    words: Non-negative ints or int arrays (broadcast against each other).
+  Returns:
+    uint64 np.array; One random number per broadcast entry.
+  """
+  z = np.uint64(0)
+  with np.errstate(over='ignore'):
+    for word in words:
+      z = mix(z + (np.asarray(word).astype(np.uint64) + np.uint64(1))*GOLDEN)
+  return z
+
+def uniform(bits):
+  """Floats in [0, 1), from random uint64s (their top 53 bits)."""
+  return (bits >> np.uint64(11)).astype(np.float64)*2.0**-53
+
+def below(bits, high):
+  """Whole numbers in [0, high), from random uint64s."""
+  return (uniform(bits)*high).astype(np.int64)
+
+def replicate_keys(seed, num_replicates):
+  """A key for each replicate's random numbers.
+
+  Replicate r's key comes from seed.spawn(num_replicates)[r] (as if seed
+  hadn't spawned anything yet), so it's the same however many replicates
+  there are.
+
+  Arguments:
+    seed: None, int or np.random.SeedSequence; The seed.
+    num_replicates: int; How many keys.
+  Returns:
+    uint64 np.array (num_replicates,); The keys.
+  """
+  if not isinstance(seed, np.random.SeedSequence):
+    seed = np.random.SeedSequence(seed)
+  return np.array(
+      [np.random.SeedSequence(seed.entropy,
+                              spawn_key=seed.spawn_key + (r,),
+                              pool_size=seed.pool_size).generate_state(
+                                  1, np.uint64)[0]
+       for r in range(num_replicates)], dtype=np.uint64)
+
+class KeyedDraws:
+  """Stands in for a np.random.Generator, keying every entry of each draw.
+
+  Entry i of each draw is a hash of keys[i] and how many draws came before,
+  so as long as everybody makes the same sequence of draws, what entry i
+  gets only depends on keys[i]. Only draws of len(keys) numbers are
+  allowed.
+
+  Arguments:
+    keys: uint64 np.array; A key for each entry of a draw.
+  """
+  def __init__(self, keys):
+    self.keys = keys
+    self._num_draws = 0
+
+  def _bits(self, size, extra=0):
+    if size not in (len(self.keys), (len(self.keys),)):
+      raise ValueError("KeyedDraws can only draw " + str(len(self.keys)) +
+                       " numbers at a time, got size " + str(size))
+    bits = hash_words(self.keys, self._num_draws, extra)
+    if extra == 0:
+      self._num_draws += 1
+    return bits
+
+  def random(self, size):
+    return uniform(self._bits(size))
+
+  def integers(self, high, size, dtype=np.int64):
+    return below(self._bits(size), high).astype(dtype)
+
+  def choice(self, a, size):
+    return np.asarray(a)[below(self._bits(size), len(a))]
+
+  def normal(self, loc, scale, size):
+    # Box-Muller, from two numbers keyed the same but for the extra word.
+    radius = np.sqrt(-2*np.log1p(-uniform(self._bits(size, extra=1))))
+    angle = 2*np.pi*uniform(self._bits(size))
+    return loc + scale*radius*np.cos(angle)
@@ -0,0 +1,115 @@
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+
+import numpy as np
+
+import storage
+
+def grid(**axes):
+  """Every combination of the values of some parameters, as sweep points.
+
+  E.g. grid(steps_per_day=[40, 50], trial=range(3)) gives 6 points,
+  {"steps_per_day": 40, "trial": 0} and so on, the last axis changing
+  fastest.
+
+  Arguments:
+    axes: Each parameter's values (any iterable of JSON-able values).
+  Returns:
+    [dict]; The points.
+  """
+  names = list(axes)
+  return [dict(zip(names, values))
+          for values in itertools.product(*[list(x) for x in axes.values()])]
+
+def _jsonable(value):
+  """Turns numpy scalars and arrays into plain Python, for json.dump."""
+  if isinstance(value, (np.generic, np.ndarray)):
+    return value.tolist()
+  raise TypeError("Can't save " + repr(value) + " in a sweep's cache")
+
+def _key(point):
+  """The point's parameters as text, the same whatever order they're in."""
+  return json.dumps(point, sort_keys=True, default=_jsonable)
+
+def point_seed(entropy, point):
+  """The seed of a sweep point: the sweep's entropy plus its parameters.
+
+  A point gets the same seed whichever grid it's in, so growing a grid
+  doesn't change the points already run.
+  """
+  digest = hashlib.sha256(_key(point).encode()).digest()
+  return np.random.SeedSequence(
+      entropy, spawn_key=[int.from_bytes(digest[i:i + 4], "little")
+                          for i in range(0, 16, 4)])
+
+def _cache_path(cache_dir, entropy, point):
+  digest = hashlib.sha256((str(entropy) + _key(point)).encode()).hexdigest()
+  return os.path.join(cache_dir, "point_" + digest[:32] + ".json")
+
+def _run_point(job):
+  """Runs one point in a worker (see run)."""
+  run_point, point, seed, path = job
+  return path, run_point(point, seed)
+
+def run(run_point, points, cache_dir, seed=None, processes=None):
+  """Runs every point of a parameter sweep, in parallel, skipping done ones.
+
+  The points are spread over a pool of worker processes. Each point's
+  summary is saved in cache_dir as soon as it comes back, keyed by the
+  point's parameters and seed, so running the sweep again (after a crash,
+  or with more points) only runs the points that aren't done yet.
+
+  Only the parameters and the seed key the cache, so anything else a
+  summary depends on (the number of days, settings every world shares)
+  belongs in the points too, as a one-value axis of the grid: left
+  hard-coded in run_point, changing it would quietly reuse stale summaries.
+
+  Arguments:
+    run_point: function; Called as run_point(point, seed) in a worker for
+      each point, with seed a np.random.SeedSequence (see point_seed):
+      builds and runs its world(s) and returns a summary, a dict of
+      JSON-able numbers (numpy scalars are fine). It has to pickle, so it
+      has to be defined at the top level of a module.
+    points: [dict]; The points (see grid), dicts of JSON-able parameters.
+    cache_dir: string; Where to keep the summaries.
+    seed: int; The sweep's seed. Defaults to the one the cache was started
+      with (or a fresh one, for a new cache). A different seed is a
+      different sweep: nothing in the cache is reused.
+    processes: int; How many worker processes. Defaults to one per CPU.
+  Returns:
+    [dict]; One row per point, in order: the point's parameters followed by
+      its summary (ready for pd.DataFrame).
+  """
+  os.makedirs(cache_dir, exist_ok=True)
+  if seed is not None:
+    entropy = np.random.SeedSequence(seed).entropy
+  elif os.path.exists(os.path.join(cache_dir, "sweep.json")):
+    entropy = storage.read_metadata(cache_dir, name="sweep")["entropy"]
+  else:
+    entropy = np.random.SeedSequence().entropy
+  storage.write_metadata(cache_dir, dict(entropy=entropy), name="sweep")
+
+  paths = [_cache_path(cache_dir, entropy, x) for x in points]
+  todo = {}
+  for point, path in zip(points, paths):
+    if not os.path.exists(path):
+      todo.setdefault(path, point)
+  if todo:
+    jobs = [(run_point, point, point_seed(entropy, point), path)
+            for path, point in todo.items()]
+    with multiprocessing.Pool(processes) as pool:
+      # Each summary is saved as soon as it's in, so a crash loses nothing
+      # that's finished.
+      for path, summary in pool.imap_unordered(_run_point, jobs):
+        with open(path + ".tmp", "w") as f:
+          json.dump(summary, f, default=_jsonable)
+        os.replace(path + ".tmp", path)
+
+  rows = []
+  for point, path in zip(points, paths):
+    with open(path) as f:
+      rows.append(dict(point, **json.load(f)))
+  return rows
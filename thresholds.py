@@ -0,0 +1,164 @@
+import collections
+import statistics
+
+import numpy as np
+
+from ensemble import Ensemble
+
+# What find_threshold found.
+#   estimate: float; Where the chance of success crosses the target.
+#   low, high: The final bracket: the chance is confidently below the target
+#     at low and above it at high (or the other way round, if it falls).
+#   reason: string; Why the search stopped:
+#     CONVERGED: The bracket is down to the resolution; estimate is its
+#       middle.
+#     UNDECIDED: A value inside the bracket couldn't be told apart from the
+#       target with the replicates allowed; estimate is that value.
+#   evaluations: {value: (successes, trials)}; Every value tried.
+#   num_trials: int; Replicates run in all.
+Threshold = collections.namedtuple(
+    'Threshold',
+    ['estimate',
+     'low',
+     'high',
+     'reason',
+     'evaluations',
+     'num_trials']
+)
+
+def wilson_interval(successes, trials, confidence=0.95):
+  """The Wilson score interval for a chance of success.
+
+  Unlike the textbook p +/- z*sqrt(p(1 - p)/n), it behaves when successes
+  are 0 or all of the trials, which is exactly where survival studies live.
+
+  Arguments:
+    successes: int; How many trials succeeded.
+    trials: int; How many trials there were (at least 1).
+    confidence: float; Chance the interval covers the true value.
+  Returns:
+    (low, high); The interval.
+  """
+  z = statistics.NormalDist().inv_cdf(1 - (1 - confidence)/2)
+  p = successes/trials
+  middle = (p + z**2/(2*trials))/(1 + z**2/trials)
+  half_width = (z/(1 + z**2/trials)*
+                np.sqrt(p*(1 - p)/trials + z**2/(4*trials**2)))
+  return float(middle - half_width), float(middle + half_width)
+
+def find_threshold(succeeds, low, high, target=0.5, increasing=True,
+                   resolution=1, integer=True, batch_size=32, max_batches=8,
+                   confidence=0.95, seed=None):
+  """Finds where the chance of success crosses target, by bisection.
+
+  Rather than running the same number of replicates at every point of a
+  grid, this only runs them where they narrow things down: replicates are
+  run at the middle of the bracket, a batch at a time, just until the
+  Wilson interval of its chance of success is clear of the target (most
+  values far from the threshold take a batch or two), and then the bracket
+  is halved. It stops once the bracket is down to resolution, or when a
+  value can't be told apart from the target within max_batches (it's then
+  as good an estimate as any).
+
+  The chance is checked after every batch, so the real chance of a wrong
+  turn is a bit more than 1 - confidence.
+
+  Arguments:
+    succeeds: function; Called as succeeds(value, num_trials, seed), with
+      seed a np.random.SeedSequence: runs num_trials independent replicates
+      at value and returns how many succeeded (see ensemble_survival).
+    low, high: The range to search. The chance has to be on either side of
+      target at the two ends (checked first).
+    target: float; The chance of success to find.
+    increasing: bool; Does the chance of success go up with value?
+    resolution: float; Stop once the bracket is this narrow.
+    integer: bool; Only try whole numbers (e.g. steps per day).
+    batch_size: int; Replicates per batch.
+    max_batches: int; Most batches to run at any one value.
+    confidence: float; Confidence of each Wilson interval.
+    seed: None, int or np.random.SeedSequence; Seeds the batches.
+  Returns:
+    Threshold; The estimate, the final bracket and every evaluation.
+  """
+  if not low < high:
+    raise ValueError("find_threshold needs low < high, got " + str(low) +
+                     " and " + str(high))
+  if not isinstance(seed, np.random.SeedSequence):
+    seed = np.random.SeedSequence(seed)
+  evaluations = {}
+
+  def side(value):
+    """Is the chance at value BELOW or ABOVE target (or UNDECIDED)?"""
+    successes, trials = evaluations.get(value, (0, 0))
+    for _ in range(max_batches):
+      successes += int(succeeds(value, batch_size, seed.spawn(1)[0]))
+      trials += batch_size
+      evaluations[value] = (successes, trials)
+      chance_low, chance_high = wilson_interval(successes, trials, confidence)
+      if chance_high < target:
+        return "BELOW"
+      if chance_low > target:
+        return "ABOVE"
+    return "UNDECIDED"
+
+  def result(estimate, reason):
+    return Threshold(estimate, low, high, reason, evaluations,
+                     sum(trials for _, trials in evaluations.values()))
+
+  # Which side of the target is each end of the range on?
+  ends = {"BELOW": low, "ABOVE": high} if increasing else {
+      "ABOVE": low, "BELOW": high}
+  for value, expected in [(low, "BELOW" if increasing else "ABOVE"),
+                          (high, "ABOVE" if increasing else "BELOW")]:
+    found = side(value)
+    if found == "UNDECIDED":
+      return result(value, "UNDECIDED")
+    if found != expected:
+      raise ValueError(
+          "The chance of success is " + found + " " + str(target) + " at " +
+          str(value) + ", so the threshold isn't between " + str(low) +
+          " and " + str(high) + " (or increasing should be " +
+          str(not increasing) + ")")
+
+  while high - low > resolution:
+    middle = (low + high)/2
+    if integer:
+      middle = int(np.floor(middle))
+      if middle in (low, high):
+        break
+    found = side(middle)
+    if found == "UNDECIDED":
+      return result(middle, "UNDECIDED")
+    ends[found] = middle
+    low, high = sorted(ends.values())
+  return result((low + high)/2, "CONVERGED")
+
+def ensemble_survival(num_days=200, field_size=25, food_fill_factor=0.03,
+                      **ensemble_args):
+  """A succeeds for find_threshold: does a world survive, given steps_in_day?
+
+  Runs the batch of replicates as one Ensemble (see ensemble.py) for up to
+  num_days days (stopping early if they all die out) and counts the
+  survivors.
+
+  Arguments:
+    num_days: int; Days a world has to survive.
+    field_size, food_fill_factor: As for World.
+    ensemble_args: Any other arguments for Ensemble (num_initial_creatures
+      defaults to one per food spot sprouted).
+  Returns:
+    function; succeeds(steps_in_day, num_trials, seed).
+  """
+  ensemble_args.setdefault(
+      "num_initial_creatures",
+      int(np.round(field_size**2*food_fill_factor)))
+
+  def succeeds(steps_in_day, num_trials, seed):
+    ensemble = Ensemble(num_trials, field_size, food_fill_factor, seed=seed,
+                        **ensemble_args)
+    for _ in range(num_days):
+      ensemble.pass_day(int(steps_in_day))
+      if ensemble.extinct().all():
+        return 0
+    return int((~ensemble.extinct()).sum())
+  return succeeds
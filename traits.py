@@ -0,0 +1,88 @@
+import numpy as np
+
+# The numeric, heritable traits every creature carries.
+#   speed: int; Spaces moved per step.
+#   metabolism: float; Food eaten each day (and needed again to reproduce).
+#   meat_value: float; Food value to predators.
+#   reproduction_mutation_chance: float; [0, 1] chance a baby mutates.
+TRAITS = ["speed", "metabolism", "meat_value", "reproduction_mutation_chance"]
+
+# (lowest, highest) value each trait can drift to. Nobody gets to live on
+# thin air, so metabolism stays positive.
+TRAIT_BOUNDS = {
+    "speed": (0, None),
+    "metabolism": (0.1, None),
+    "meat_value": (0, None),
+    "reproduction_mutation_chance": (0, 1),
+}
+
+# Speed and metabolism of the classic mutations.
+MUTATION_TRAITS = {
+    "NORMAL": dict(speed=1, metabolism=1),
+    "EFFICIENT": dict(speed=1, metabolism=0.5),
+    "SPEEDY": dict(speed=2, metabolism=1),
+}
+
+# Quantiles of each trait kept in the history books.
+QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+class TraitDrift:
+  """How far babies' traits drift from their parent's.
+
+  Every baby starts as a copy of its parent (or, if it mutates, with the speed
+  and metabolism of its new mutation) and then each trait is nudged. Speed is
+  a whole number of spaces, so it takes discrete steps; the rest get Gaussian
+  noise. Everything is clipped to TRAIT_BOUNDS. The defaults are no drift at
+  all, so babies are exact copies like they've always been.
+
+  Arguments:
+    speed: float; Chance a baby is one space faster (or, equally likely,
+      slower) than its parent.
+    metabolism: float; Std. dev. of the noise added to metabolism.
+    meat_value: float; Std. dev. of the noise added to meat_value.
+    reproduction_mutation_chance: float; Std. dev. of the noise added to
+      reproduction_mutation_chance.
+  """
+  def __init__(self,
+               speed=0,
+               metabolism=0,
+               meat_value=0,
+               reproduction_mutation_chance=0):
+    self.scale = dict(speed=speed,
+                      metabolism=metabolism,
+                      meat_value=meat_value,
+                      reproduction_mutation_chance=reproduction_mutation_chance)
+
+  def drift(self, traits, rng):
+    """Nudges a batch of babies' traits in place.
+
+    Arguments:
+      traits: {string: np.array}; Each trait's values, one entry per baby.
+      rng: np.random.Generator; The world's random numbers.
+    """
+    for name in TRAITS:
+      scale = self.scale[name]
+      values = traits[name]
+      if scale == 0 or len(values) == 0:
+        continue
+      if name == "speed":
+        nudged = rng.random(len(values)) < scale
+        values += nudged*rng.choice([-1, 1], size=len(values))
+      else:
+        values += rng.normal(0, scale, size=len(values))
+      lowest, highest = TRAIT_BOUNDS[name]
+      np.clip(values, lowest, highest, out=values)
+
+def trait_quantiles(traits):
+  """Summarizes each trait's distribution for the history books.
+
+  Arguments:
+    traits: {string: np.array}; Each trait's values, one entry per creature.
+  Returns:
+    {string: np.array}; QUANTILES of each trait (NaN if nobody's left).
+  """
+  return {
+      name: (np.quantile(traits[name], QUANTILES) if len(traits[name])
+             else np.full(len(QUANTILES), np.nan))
+      for name in TRAITS
+  }
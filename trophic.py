@@ -0,0 +1,53 @@
+import numpy as np
+
+class TrophicTable:
+  """Who eats whom, as an integer-coded food web.
+
+  Diet types are numbered by their position in diet_types, and
+  eats[predator, prey] says whether creatures of diet predator eat creatures
+  of diet prey. Any food web can be described this way (omnivores,
+  cannibals, long food chains, ...) and the engines handle them all the same
+  way.
+
+  Arguments:
+    diet_types: [string]; Names of the diet types.
+    eats: [(string, string)]; (predator, prey) pairs of diet names.
+    eats_food: [string]; Diets that grab the food growing on the field.
+
+  Additional Attributes:
+    eats: bool np.array (D, D); eats[i, j] is True if diet i eats diet j.
+    eats_food: bool np.array (D,); Which diets grab food off the field.
+    is_predator: bool np.array (D,); Which diets eat anybody.
+    is_prey: bool np.array (D,); Which diets get eaten by anybody.
+  """
+  def __init__(self, diet_types, eats=(), eats_food=()):
+    self.diet_types = list(diet_types)
+    self.eats = np.zeros((len(self.diet_types), len(self.diet_types)),
+                         dtype=bool)
+    for predator, prey in eats:
+      self.eats[self.code(predator), self.code(prey)] = True
+    self.eats_food = np.isin(self.diet_types, list(eats_food))
+    self.is_predator = self.eats.any(axis=1)
+    self.is_prey = self.eats.any(axis=0)
+
+  def code(self, diet_type):
+    """Returns the integer code of the diet type called diet_type."""
+    if diet_type not in self.diet_types:
+      raise ValueError("Unknown diet type " + str(diet_type) +
+                       "; expected one of " + str(self.diet_types))
+    return self.diet_types.index(diet_type)
+
+  def predator_eats(self, predator, prey):
+    """Does diet predator eat diet prey? (Both given by name.)"""
+    return self.eats[self.code(predator), self.code(prey)]
+
+  def grabs_food(self, diet_type):
+    """Does diet diet_type grab food off the field?"""
+    return self.eats_food[self.code(diet_type)]
+
+# The classic food chain: rabbits eat grass, wolves eat rabbits, and
+# wolf-eaters eat wolves.
+DEFAULT_TROPHIC_TABLE = TrophicTable(
+    ["HERBIVORE", "CARNIVORE", "SUPER_CARNIVORE"],
+    eats=[("CARNIVORE", "HERBIVORE"), ("SUPER_CARNIVORE", "CARNIVORE")],
+    eats_food=["HERBIVORE"])
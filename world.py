@@ -1,24 +1,26 @@
-import collections
 from datetime import datetime
+import os
 import matplotlib
 matplotlib.use('Agg')
 from matplotlib import pyplot as plt
 import numpy as np
 
+import checkpoint
+from counters import Counters, Stats
 from creature import Creature
-from field import Field
+from field import ChunkedField, Field
+import forks
+from history import DailyHistory, FOOD_BIN_WIDTH, History
+from keyframes import Keyframes
+import kernels
+from occupancy import DenseOccupancy, HashOccupancy, SortedOccupancy
+from population import CreatureView, MUTATIONS, Population
+import render
 from SET_ME import TMP_DIR
-
-DailyHistory = collections.namedtuple(
-    'DailyHistory',
-    ['day',
-     'num_creatures',
-     'total_food_stored',
-     'num_births',
-     'num_deaths',
-     'food_on_field',
-     'creature_list']
-)
+import storage
+from stopping import Stop
+from traits import TRAITS, TraitDrift, QUANTILES
+from trophic import DEFAULT_TROPHIC_TABLE, TrophicTable
 
 class World:
   """Creates a world object consisting of a field and a list of creatures.
@@ -39,7 +41,71 @@ class World:
     field_has_boundaries: bool; Does the world's field have boundaries?
     food_spoils: bool; Does the food in the world, on the field and stored by
       creatures spoil (disappear) at the end of the day?
+    food_dtype: np.dtype; Type of the field's food grid (see Field), e.g.
+      np.uint8 or np.float32 to save memory on huge fields.
+    field_chunk_size: int; If set, the field is a ChunkedField of chunks this
+      many cells on a side, only allocated where the creatures go. For fields
+      too big to hold in memory (use with an array engine).
     creature_meat_value: float; how much food do I get if I eat a creature?
+    engine: string; How the creatures are stored and stepped:
+      OBJECTS: One Creature object per dude, moved one at a time (default).
+      ARRAYS: A Population of parallel numpy arrays, moved all at once.
+        Same rules and statistics as OBJECTS, but much faster for big
+        worlds. (Babies draw their random numbers in bulk rather than one at
+        a time, so the same seed doesn't give the same world as OBJECTS.)
+        World.creatures then returns CreatureViews onto the arrays.
+      TRAJECTORIES: Like ARRAYS, but on days without predators each
+        creature's whole day of steps is drawn at once and food is handed out
+        by sorting the visits. Same statistics, a few sorts per day.
+    update_mode: string; How the creatures take each step:
+      SEQUENTIAL: One at a time, in a fresh random order every step (default).
+      SYNCHRONOUS: All at once (array engines only). Contention for food or
+        prey goes to a random priority drawn fresh each step from world.rng.
+        Food is handed out exactly as in SEQUENTIAL, so worlds without
+        predators play out identically; predation differs (see
+        kernels.synchronous_step and the README).
+    seed: None, int or np.random.SeedSequence; Seeds the world's own random
+      number generator (world.rng). Worlds built from the same seed play out
+      identically; use World.spawn_seeds for independent replicates.
+    occupancy_index: string; How to keep track of who's standing where
+      (world.occupancy, see occupancy.py):
+      HASH: Only occupied cells are stored (default for OBJECTS).
+      DENSE: A list for every cell of the field (the old creatures_by_loc).
+      SORTED: Sorted cell ids, rebuilt after the creatures move (the only
+        option, and the default, for the array engines).
+    trophic_table: TrophicTable; Who eats whom (see trophic.py). Defaults to
+      the HERBIVORE < CARNIVORE < SUPER_CARNIVORE food chain. The initial
+      creatures get the table's first diet type.
+    trait_drift: TraitDrift; How far babies' speed, metabolism, meat value
+      and mutation chance drift from their parent's (see traits.py). No drift
+      by default.
+    storage: string; Where the world's arrays live:
+      MEMORY: In RAM (default).
+      MEMMAP: In memory-mapped .npy files in storage_dir (array engines with
+        a dense field only): the food grid, the population's columns and the
+        occupancy index. The OS pages in only the parts in use, so the world
+        can be bigger than RAM, and World.open(storage_dir) picks the world
+        back up after any completed day without unpickling anything. The
+        history books are kept on disk too, without snapshots.
+    storage_dir: string; Directory for MEMMAP storage. Defaults to a new
+      world_<timestamp> directory under TMP_DIR.
+    history_snapshot_every: int; The history books (world.history, see
+      history.History) keep a few numbers and histograms for every day. Set
+      this to also keep a copy of every creature every this many days (1 for
+      every day, which costs memory in proportion to days x creatures).
+    history_dir: string; If set, the history books are written to files in
+      this directory as the world goes, rather than kept in memory (see
+      history.History), so they can be read with History.open while the
+      world runs, or after it crashes. MEMMAP worlds always keep their books
+      on disk, in storage_dir by default.
+    keyframe_every: int; If set, a full copy of the world is kept every this
+      many days, and the random numbers at the start of every day, so that
+      at_day can rebuild any past day by replaying at most keyframe_every - 1
+      days (see keyframes.Keyframes). Bigger saves memory, smaller saves
+      time.
+    keyframe_dir: string; If set, the keyframes are kept in files in this
+      directory rather than in memory. MEMMAP worlds with keyframes keep them
+      in storage_dir by default.
     """
   def __init__(self,
                field_size,
@@ -50,13 +116,90 @@ class World:
                creatures_randomly_teleport=False,
                field_has_boundaries=False,
                food_spoils=False,
-               creature_meat_value=2):
-    self.field = Field(field_size, has_boundaries=field_has_boundaries)
+               food_dtype=np.float64,
+               field_chunk_size=None,
+               creature_meat_value=2,
+               engine="OBJECTS",
+               update_mode="SEQUENTIAL",
+               seed=None,
+               occupancy_index=None,
+               trophic_table=None,
+               trait_drift=None,
+               storage="MEMORY",
+               storage_dir=None,
+               history_snapshot_every=None,
+               history_dir=None,
+               keyframe_every=None,
+               keyframe_dir=None):
+    if engine not in ("OBJECTS", "ARRAYS", "TRAJECTORIES"):
+      raise ValueError(
+          "engine must be OBJECTS, ARRAYS or TRAJECTORIES, got " + str(engine))
+    self.engine = engine
+    if update_mode not in ("SEQUENTIAL", "SYNCHRONOUS"):
+      raise ValueError(
+          "update_mode must be SEQUENTIAL or SYNCHRONOUS, got " +
+          str(update_mode))
+    if update_mode == "SYNCHRONOUS" and engine == "OBJECTS":
+      raise ValueError("SYNCHRONOUS updates need the ARRAYS or TRAJECTORIES "
+                       "engine")
+    self.update_mode = update_mode
+    if storage not in ("MEMORY", "MEMMAP"):
+      raise ValueError("storage must be MEMORY or MEMMAP, got " + str(storage))
+    if storage == "MEMMAP" and (engine == "OBJECTS" or
+                                field_chunk_size is not None):
+      raise ValueError("MEMMAP storage needs the ARRAYS or TRAJECTORIES "
+                       "engine and a dense field (no field_chunk_size)")
+    if storage == "MEMMAP" and history_snapshot_every is not None:
+      raise ValueError("MEMMAP worlds don't keep history snapshots")
+    if keyframe_dir is not None and keyframe_every is None:
+      raise ValueError("keyframe_dir needs keyframe_every")
+    self.storage = storage
+    self.storage_dir = None
+    if storage == "MEMMAP":
+      self.storage_dir = storage_dir or os.path.join(
+          TMP_DIR, datetime.now().strftime("world_%Y%m%d%H%M%S%f"))
+      os.makedirs(self.storage_dir, exist_ok=True)
+    self.trophic_table = trophic_table or DEFAULT_TROPHIC_TABLE
+    self.trait_drift = trait_drift or TraitDrift()
+    if not isinstance(seed, np.random.SeedSequence):
+      seed = np.random.SeedSequence(seed)
+    self.seed_sequence = seed
+    self.rng = np.random.default_rng(seed)
+    if field_chunk_size is None:
+      self.field = Field(field_size,
+                         has_boundaries=field_has_boundaries,
+                         rng=self.rng,
+                         dtype=food_dtype,
+                         directory=self.storage_dir)
+    else:
+      self.field = ChunkedField(field_size,
+                                has_boundaries=field_has_boundaries,
+                                rng=self.rng,
+                                dtype=food_dtype,
+                                chunk_size=field_chunk_size)
     self.field.sprout(food_fill_factor)
-    self.creatures = []
-    self.creatures_by_loc = [
-        [[] for x in range(field_size)] for y in range(field_size)
-    ]
+    self.counters = Counters(self.trophic_table.diet_types)
+    if engine == "OBJECTS":
+      self.population = None
+      self._creatures = []
+      occupancy_index = occupancy_index or "HASH"
+      if occupancy_index == "HASH":
+        self.occupancy = HashOccupancy(field_size)
+      elif occupancy_index == "DENSE":
+        self.occupancy = DenseOccupancy(field_size)
+      else:
+        raise ValueError("The OBJECTS engine needs a HASH or DENSE "
+                         "occupancy_index, got " + str(occupancy_index))
+    else:
+      if occupancy_index not in (None, "SORTED"):
+        raise ValueError("The array engines need a SORTED occupancy_index, "
+                         "got " + str(occupancy_index))
+      self.population = Population(
+          capacity=num_initial_creatures,
+          diet_types=self.trophic_table.diet_types,
+          directory=self.storage_dir)
+      self.occupancy = SortedOccupancy(field_size, self.population,
+                                       directory=self.storage_dir)
     self.create_creatures(
         num_initial_creatures,
         creature_mutation=creature_mutation,
@@ -65,16 +208,265 @@ class World:
         creature_meat_value=creature_meat_value
     )
     self.days_passed = 0
-    self.history = []
+    self.history = History(self.trophic_table.diet_types,
+                           snapshot_every=history_snapshot_every,
+                           directory=history_dir or self.storage_dir)
+    self.keyframes = None
+    if keyframe_every is not None:
+      self.keyframes = Keyframes(keyframe_every,
+                                 directory=keyframe_dir or self.storage_dir)
     self.food_fill_factor = food_fill_factor
     self.food_spoils = food_spoils
+    self.flush()
+
+  def flush(self):
+    """Saves a MEMMAP world so World.open can pick it up (no-op otherwise).
+
+    Called after every day; the arrays are already in their files, so this
+    just flushes them and writes the rest of the world (a few numbers, the
+    random number generator and where the history books are) to
+    metadata.json. The books write themselves as each day is recorded, and
+    the running counters (see stats) are saved too, so nothing needs adding
+    up again when the world is opened.
+    """
+    if self.storage != "MEMMAP":
+      return
+    self.field.flush()
+    self.population.flush()
+    storage.write_metadata(self.storage_dir, dict(
+        self._metadata(),
+        history_dir=self.history.directory,
+        keyframe_dir=(None if self.keyframes is None
+                      else self.keyframes.directory)))
+
+  def _metadata(self):
+    """Everything about the world but its arrays, as a JSON-able dict.
+
+    Saved by flush and in checkpoints; _from_metadata reads it back.
+    """
+    trophic = self.trophic_table
+    predators, prey = np.nonzero(trophic.eats)
+    return dict(
+        field_size=self.field.field_size,
+        field_has_boundaries=self.field.has_boundaries,
+        food_fill_factor=self.food_fill_factor,
+        food_spoils=self.food_spoils,
+        engine=self.engine,
+        update_mode=self.update_mode,
+        days_passed=self.days_passed,
+        num_creatures=(len(self._creatures) if self.population is None
+                       else len(self.population)),
+        diet_types=trophic.diet_types,
+        eats=[[trophic.diet_types[i], trophic.diet_types[j]]
+              for i, j in zip(predators, prey)],
+        eats_food=[x for x, eats in zip(trophic.diet_types, trophic.eats_food)
+                   if eats],
+        trait_drift={k: float(v) for k, v in self.trait_drift.scale.items()},
+        seed=dict(entropy=self.seed_sequence.entropy,
+                  spawn_key=list(self.seed_sequence.spawn_key),
+                  n_children_spawned=self.seed_sequence.n_children_spawned),
+        rng_state=self.rng.bit_generator.state,
+        food_on_field=self.field.total_food(),
+        counters=dict(diet_counts=self.counters.diet_counts.tolist(),
+                      mutation_counts=self.counters.mutation_counts.tolist(),
+                      food_stored=self.counters.food_stored,
+                      num_births=self.counters.num_births,
+                      num_deaths=self.counters.num_deaths),
+    )
+
+  @classmethod
+  def _from_metadata(cls, metadata):
+    """Starts a world from _metadata, without a field, creatures or history.
+
+    The caller fills those in, along with storage and storage_dir.
+    """
+    world = cls.__new__(cls)
+    world.engine = metadata["engine"]
+    world.update_mode = metadata["update_mode"]
+    world.trophic_table = TrophicTable(metadata["diet_types"],
+                                       eats=metadata["eats"],
+                                       eats_food=metadata["eats_food"])
+    world.trait_drift = TraitDrift(**metadata["trait_drift"])
+    world.seed_sequence = np.random.SeedSequence(
+        metadata["seed"]["entropy"],
+        spawn_key=metadata["seed"]["spawn_key"],
+        n_children_spawned=metadata["seed"]["n_children_spawned"])
+    world.rng = np.random.default_rng(world.seed_sequence)
+    world.rng.bit_generator.state = metadata["rng_state"]
+    world.counters = Counters(metadata["diet_types"])
+    for name, value in metadata["counters"].items():
+      if isinstance(value, list):
+        value = np.array(value, dtype=np.int64)
+      setattr(world.counters, name, value)
+    world.days_passed = metadata["days_passed"]
+    world.food_fill_factor = metadata["food_fill_factor"]
+    world.food_spoils = metadata["food_spoils"]
+    world.keyframes = None
+    return world
+
+  @classmethod
+  def open(cls, storage_dir):
+    """Picks up a MEMMAP world where it left off.
+
+    Nothing is unpickled or copied: the arrays are mapped straight from their
+    files, so this is instant however big the world is.
+
+    Arguments:
+      storage_dir: string; The world's storage_dir.
+    Returns:
+      World; The world as of its last completed day.
+    """
+    metadata = storage.read_metadata(storage_dir)
+    world = cls._from_metadata(metadata)
+    world.storage = "MEMMAP"
+    world.storage_dir = storage_dir
+    world.field = Field.open(storage_dir,
+                             has_boundaries=metadata["field_has_boundaries"],
+                             rng=world.rng,
+                             total_food=metadata["food_on_field"])
+    world.population = Population.open(storage_dir,
+                                       metadata["num_creatures"],
+                                       diet_types=metadata["diet_types"])
+    world.occupancy = SortedOccupancy(world.field.field_size,
+                                      world.population,
+                                      directory=storage_dir)
+    # The books may have a day more than the rest, if we crashed in between.
+    world.history = History.open(metadata["history_dir"],
+                                 num_days=world.days_passed + 1)
+    if metadata["keyframe_dir"] is not None:
+      # Likewise, the log may have started the day we crashed in.
+      world.keyframes = Keyframes.open(metadata["keyframe_dir"],
+                                       num_days=world.days_passed)
+    return world
+
+  def save_checkpoint(self, file_name):
+    """Saves the whole world to a compressed checkpoint file.
+
+    The field, the creatures, the random number generator and the history
+    books go into one versioned .npz file of plain arrays (see
+    checkpoint.py), which is much smaller and quicker to load than a pickle
+    of the world, and doesn't break when the classes change.
+
+    Arguments:
+      file_name: string; Where to save it (.npz is the usual extension).
+    """
+    checkpoint.save(self, file_name)
+
+  @classmethod
+  def load_checkpoint(cls, file_name):
+    """Loads a world saved by save_checkpoint.
+
+    The world carries on exactly as the saved one would have. It's always
+    loaded into memory (a MEMMAP world comes back with MEMORY storage).
+
+    Arguments:
+      file_name: string; The checkpoint file.
+    Returns:
+      World; The world as it was saved.
+    """
+    return checkpoint.load(file_name, cls)
+
+  def at_day(self, day):
+    """Rebuilds the world exactly as it was after day days.
+
+    Needs keyframe_every: the keyframe before day is loaded and the days
+    from there are passed again, so this takes at most keyframe_every - 1
+    days of simulation. Any step frames of those days aren't drawn again.
+
+    Arguments:
+      day: int; How many days should have passed (up to days_passed).
+    Returns:
+      World; A separate world, in memory and without keyframes of its own,
+        with the history books up to that day.
+    """
+    if self.keyframes is None:
+      raise ValueError("at_day needs a world made with keyframe_every")
+    return self.keyframes.replay(self, day)
+
+  def fork(self, num_branches, fork_dir=None):
+    """Branches the world into independent copies of itself, cheaply.
+
+    For what-ifs: fork an evolved world and change each branch a different
+    way (add wolves, turn on spoiling, ...). The world is saved once, as a
+    trunk of plain array files in fork_dir, and every branch maps the
+    field's and population's arrays copy-on-write, so a branch only takes
+    up memory for what it changes (see forks.open_branch). Each branch gets
+    its own seed from spawn_seeds, so they play out differently. To run the
+    branches in parallel worker processes, see forks.run_branches.
+
+    Arguments:
+      num_branches: int; How many branches.
+      fork_dir: string; Where to keep the trunk (for as long as the branches
+        are around). Defaults to a new fork_<timestamp> directory under
+        TMP_DIR.
+    Returns:
+      [World]; The branches, with MEMORY storage and without keyframes. This
+        world carries on unchanged (but for the seeds it spawned).
+    """
+    fork_dir = fork_dir or forks.new_trunk_dir()
+    forks.write_trunk(self, fork_dir)
+    return [forks.open_branch(fork_dir, seed, type(self))
+            for seed in self.spawn_seeds(num_branches)]
+
+  def spawn_seeds(self, num_seeds):
+    """Spawns independent seeds from this world's seed.
+
+    Handy for replicates run in parallel: World(..., seed=seed) for each of
+    the spawned seeds gives reproducible worlds that don't share random
+    numbers with each other (or with this world).
+
+    Arguments:
+      num_seeds: int; How many seeds to spawn.
+    Returns:
+      [np.random.SeedSequence]; The child seeds.
+    """
+    return self.seed_sequence.spawn(num_seeds)
+
+  @property
+  def creatures(self):
+    """list; Every creature in the world (CreatureViews for ARRAYS)."""
+    if self.population is not None:
+      return self.population.creatures()
+    return self._creatures
+
+  @creatures.setter
+  def creatures(self, creatures):
+    if self.population is not None:
+      # Views onto our own arrays must survive us clearing them out.
+      snapshot = self.population.copy()
+      creatures = [
+          CreatureView(snapshot, x._index)
+          if isinstance(x, CreatureView) and x._population is self.population
+          else x
+          for x in creatures]
+      self.population.compact(np.zeros(len(self.population), dtype=bool))
+      for creature in creatures:
+        self.population.append_creature(creature)
+    else:
+      self._creatures = list(creatures)
+    self._count_creatures()
+
+  def creatures_at(self, location):
+    """Returns a list of the creatures standing at location.
+
+    Arguments:
+      location: list of length 2; Location on the field.
+    """
+    if self.population is not None:
+      return [CreatureView(self.population, i)
+              for i in self.occupancy.at(location)]
+    return list(self.occupancy.at(location))
+
+  def occupied_cells(self):
+    """Returns an int array (K, 2) of the locations with anybody in them."""
+    return self.occupancy.occupied_cells()
 
   def create_creatures(self,
                        num_creatures,
                        creature_mutation="NORMAL",
                        creature_reproduction_mutation_prob=0,
                        creatures_randomly_teleport=False,
-                       creature_diet_type="HERBIVORE",
+                       creature_diet_type=None,
                        creature_meat_value=2):
     """Places num_creatures creatures randomly around the world.
 
@@ -87,12 +479,33 @@ class World:
       mutation: string; Mutation of the creature.
       creatures_randomly_teleport: bool; Do the creatures teleport to a random
         location on the field every day?
-      creature_diet_type: "HERBIVORE" or "CARNIVORE" or "SUPER_CARNIVORE"
+      creature_diet_type: string; One of the world's trophic_table.diet_types,
+        "HERBIVORE", "CARNIVORE" or "SUPER_CARNIVORE" by default. Defaults to
+        the first of them.
     """
     all_my_creatures  = []
-    for randy in np.random.choice(self.field.field_size**2,
-                                  num_creatures,
-                                  replace=False):
+    if creature_diet_type is None:
+      creature_diet_type = self.trophic_table.diet_types[0]
+    diet_code = self.trophic_table.code(creature_diet_type)
+    if self.population is not None:
+      randy = self.rng.choice(self.field.field_size**2,
+                              num_creatures,
+                              replace=False)
+      self.population.append(
+          np.stack(np.divmod(randy, self.field.field_size), axis=1),
+          mutation=MUTATIONS.index(creature_mutation),
+          reproduction_mutation_chance=creature_reproduction_mutation_prob,
+          diet_type=diet_code,
+          randomly_teleports=creatures_randomly_teleport,
+          meat_value=creature_meat_value)
+      self.counters.add(np.full(num_creatures, diet_code),
+                        np.full(num_creatures,
+                                MUTATIONS.index(creature_mutation)))
+      return
+
+    for randy in self.rng.choice(self.field.field_size**2,
+                                 num_creatures,
+                                 replace=False):
       x_loc = int(np.floor(randy/self.field.field_size))
       y_loc = randy%self.field.field_size
       self.add_creature(
@@ -111,10 +524,23 @@ class World:
     Arguments:
       creature: int; Creature to add.
     """
+    self.counters.add(self.trophic_table.code(creature.diet_type),
+                      MUTATIONS.index(creature.mutation),
+                      creature.food_stored)
+    if self.population is not None:
+      self.population.append_creature(creature)
+      return
     self.creatures.append(creature)
-    self.creatures_by_loc[creature.location[0]][creature.location[1]].append(
-        creature
-    )
+    self.occupancy.add(creature)
+
+  def add_creatures(self, creatures):
+    """Adds a batch of creatures to the world.
+
+    Arguments:
+      creatures: [Creature]; Creatures to add.
+    """
+    for creature in creatures:
+      self.add_creature(creature)
 
   def remove_creature(self, creature):
     """Removes the creature from the world.
@@ -122,76 +548,147 @@ class World:
     Arguments:
       creature: int; Creature to remove.
     """
-    self.creatures = [x for x in self.creatures if x != creature]
-    self.creatures_by_loc[creature.location[0]][creature.location[1]] = [
-        x for x in
-        self.creatures_by_loc[creature.location[0]][creature.location[1]]
-        if x != creature
-    ]
-
-  def show_me(self, time_of_day=None, save_plot=False):
+    self.remove_creatures([creature])
+
+  def remove_creatures(self, creatures):
+    """Removes a batch of creatures from the world in one pass.
+
+    Marks the creatures, then compacts the creature list (and each cell they
+    were standing in) once, so removing D of N creatures costs O(N) rather
+    than O(N*D).
+
+    Arguments:
+      creatures: [Creature]; Creatures to remove.
+    """
+    if self.population is not None:
+      keep = np.ones(len(self.population), dtype=bool)
+      keep[[creature._index for creature in creatures]] = False
+      self._count_out(~keep)
+      self.population.compact(keep)
+      return
+
+    gone = set(id(x) for x in creatures)
+    if not gone:
+      return
+    for creature in creatures:
+      self.counters.remove(self.trophic_table.code(creature.diet_type),
+                           MUTATIONS.index(creature.mutation),
+                           creature.food_stored)
+    self._creatures = [x for x in self.creatures if id(x) not in gone]
+    # Tidy up every cell the departed were standing in, just once each.
+    self.occupancy.remove_many(creatures)
+
+  def _count_out(self, gone):
+    """Takes the population's rows marked in gone out of the counters."""
+    population = self.population
+    self.counters.remove(population.diet_type[gone],
+                         population.mutation[gone],
+                         population.food_stored[gone])
+
+  def stats(self):
+    """The world's vital statistics, right now, without counting anybody.
+
+    Everything comes from running counters (self.counters, see counters.py)
+    kept up to date as creatures come and go, grab food and eat, so this
+    costs the same however big the world is. If you change the creatures
+    or the food yourself (say, setting food_stored), call recount first.
+
+    Returns:
+      Stats; Day, creatures (by diet type and mutation), today's births and
+        deaths, food on the field and food stored.
+    """
+    counters = self.counters
+    return Stats(
+        day=self.days_passed,
+        num_creatures=int(counters.diet_counts.sum()),
+        diet_counts=dict(zip(counters.diet_types,
+                             counters.diet_counts.tolist())),
+        mutation_counts=dict(zip(MUTATIONS, counters.mutation_counts.tolist())),
+        num_births=counters.num_births,
+        num_deaths=counters.num_deaths,
+        food_on_field=self.field.total_food(),
+        total_food_stored=counters.food_stored)
+
+  def recount(self):
+    """Counts the creatures and the food from scratch (see stats).
+
+    Today's births and deaths can't be recounted, so they're left alone.
+    """
+    self._count_creatures()
+    self.field.recount()
+
+  def _count_creatures(self):
+    """Counts the creatures (not the food) from scratch."""
+    if self.population is not None:
+      population = self.population
+      self.counters.recount(population.diet_type, population.mutation,
+                            population.food_stored)
+    else:
+      creatures = self.creatures
+      self.counters.recount(
+          np.array([self.trophic_table.code(x.diet_type) for x in creatures],
+                   dtype=np.int64),
+          np.array([MUTATIONS.index(x.mutation) for x in creatures],
+                   dtype=np.int64),
+          np.array([x.food_stored for x in creatures], dtype=float))
+
+  def show_me(self, time_of_day=None, save_plot=False, annotate=False,
+              density=None):
     """Plots the field, food, and creatures.
 
+    The frame is painted straight into an array by render.render_world: grass,
+    food, then herbivores, carnivores and super carnivores (black once
+    they're dead), each a bigger square than the last. Fields with more cells
+    than the frame has pixels are drawn as a density map instead (see
+    render.render_density).
+
     Arguments:
       save_plot: bool; Whether or not to save the plot to disc.
       time_of_day: int; if set, will display in the title
+      annotate: bool; Add a title (days passed, time of day) to saved frames.
+        This goes through matplotlib, so it's a lot slower.
+      density: bool; Draw a density map rather than a glyph per creature?
+        Defaults to only for fields bigger than render.FRAME_PIXELS.
+    Returns:
+      uint8 np.array; The frame, as indices into render.PALETTE (or an RGB
+        image for density maps).
     """
-    increment_size = float(100/1.5)/self.field.field_size
-    fig, ax = plt.subplots(1,1, figsize = (6, 6))
-    ax.spy(
-        [
-            [1 for x in range(self.field.field_size)]
-            for y in range(self.field.field_size)
-        ],
-        markersize=6*increment_size, c="palegoldenrod")
-    ax.spy(self.field.food_grid, markersize=1*increment_size, c="g")
-
-    herbivore_loc = self.field.food_grid*0
-    dead_herbivore_loc = self.field.food_grid*0
-    for dude in self.creatures:
-      if dude.diet_type == "HERBIVORE":
-        if dude.is_alive:
-          herbivore_loc[dude.location[0], dude.location[1]] = 1
-        else:
-          dead_herbivore_loc[dude.location[0], dude.location[1]] = 1
-
-    ax.spy(herbivore_loc, markersize=2*increment_size, c="m")
-    ax.spy(dead_herbivore_loc, markersize=2*increment_size, c="k")
-
-    carnivore_loc = self.field.food_grid*0
-    dead_carnivore_loc = self.field.food_grid*0
-    for dude in [x for x in self.creatures if x.diet_type == "CARNIVORE"]:
-      if dude.is_alive:
-        carnivore_loc[dude.location[0], dude.location[1]] = 1
-      else:
-        dead_carnivore_loc[dude.location[0], dude.location[1]] = 1
-
-    ax.spy(carnivore_loc, markersize=4*increment_size, c="r")
-    ax.spy(dead_carnivore_loc, markersize=4*increment_size, c="k")
-
-    super_carnivore_loc = self.field.food_grid*0
-    for dude in [x for x in self.creatures if x.diet_type == "SUPER_CARNIVORE"]:
-      super_carnivore_loc[dude.location[0], dude.location[1]] = 1
-
-    ax.spy(super_carnivore_loc, markersize=6*increment_size, c="royalblue")
+    if density is None:
+      density = self.field.field_size > render.FRAME_PIXELS
+    if density:
+      frame = render.render_density(self)
+    else:
+      frame = render.render_world(self)
+    file_name, my_title = self._frame_name(time_of_day)
 
-    my_title = 'Days passed: ' + str(self.days_passed)
-    if type(time_of_day) == int:
-      my_title += "; time: " + str(time_of_day)
-    ax.set_title(my_title)
-    ax.set_xticks([], [])
-    ax.set_yticks([], [])
-    if not self.field.has_boundaries:
+    if save_plot:
+      render.save_frame(frame, file_name,
+                        title=(my_title if annotate else None))
+    else:
+      fig, ax = plt.subplots(1,1, figsize = (6, 6))
+      ax.imshow(render.PALETTE[frame] if frame.ndim == 2 else frame,
+                interpolation='nearest')
+      ax.set_title(my_title)
       ax.axis('off')
+    return frame
 
-    if save_plot:
-      file_name = TMP_DIR + datetime.now().strftime("world_%Y%m%d%H%M%S%f")
-      if type(time_of_day) == int:
-        file_name += "_t_%i" % (time_of_day)
-      fig.savefig(file_name + ".png", fmt='png')
-      plt.close()
+  def _frame_name(self, time_of_day=None):
+    """Returns the (file name, title) of a frame of the world right now."""
+    title = 'Days passed: ' + str(self.days_passed)
+    file_name = TMP_DIR + datetime.now().strftime("world_%Y%m%d%H%M%S%f")
+    if type(time_of_day) == int:
+      title += "; time: " + str(time_of_day)
+      file_name += "_t_%i" % (time_of_day)
+    return file_name + ".png", title
+
+  def _plot_step(self, time_of_day, frame_pipeline):
+    """Saves a frame of this step, in the background if there's a pipeline."""
+    if frame_pipeline is None:
+      self.show_me(save_plot=True, time_of_day=time_of_day)
+    else:
+      frame_pipeline.submit(self, self._frame_name(time_of_day)[0])
 
-  def pass_day(self, steps_in_day, plot_steps=False):
+  def pass_day(self, steps_in_day, plot_steps=False, frame_pipeline=None):
     """Pass a day of length steps_in_day throughout the world.
 
     Creatures will run around, grab food for each step in the day. At the end
@@ -203,67 +700,193 @@ class World:
       save_plot: bool; Whether or not to save the plot to disc.
       steps_in_day: int; How many times the creatures should move today.
       plot_steps: bool; should we save a png for every step today?
+      frame_pipeline: frames.FramePipeline; If set, the step pngs are drawn
+        and saved by its workers while the world carries on.
     """
     if self.days_passed == 0:
       # Record starting state (0 births or deaths).
-      self._record_history(0)
+      self._record_history()
+    if self.keyframes is not None:
+      self.keyframes.start_day(self, steps_in_day, plot_steps)
+    self.counters.new_day()
 
     # Go, little dudes, go!!
-    for t in range(steps_in_day):
-      for this_creature in np.random.choice(self.creatures,
-                                            len(self.creatures),
-                                            replace=False):
-        this_creature.move_and_grab(self)
-      if plot_steps:
-        self.show_me(save_plot=True, time_of_day=t)
+    if self.population is not None:
+      self._move_arrays(steps_in_day, plot_steps, frame_pipeline)
+    else:
+      creatures = self.creatures
+      for first_step, directions, rank in kernels.draw_moves(
+          self.rng, steps_in_day, len(creatures)):
+        for t, (step_directions, step_rank) in enumerate(
+            zip(directions, rank), start=first_step):
+          for i in np.argsort(step_rank):
+            creatures[i].move_and_grab(self, step_directions[i])
+          if plot_steps:
+            self._plot_step(t, frame_pipeline)
+
+    self.end_day()
+
+    # Long day...
+    self.days_passed += 1
+    self._record_history()
+    self.flush()
+
+  def run(self, max_days, steps_in_day, stop_when=(), plot_steps=False,
+          frame_pipeline=None):
+    """Passes days until a stop condition comes up, or max_days have passed.
+
+    The conditions (see stopping.py) are checked before every day, in
+    order, so a world that's gone extinct or settled down doesn't use up
+    any more time. E.g.
+      world.run(200, 60, stop_when=[stopping.Extinct(),
+                                    stopping.Stationary(window=50)])
+
+    Arguments:
+      max_days: int; Most days to pass.
+      steps_in_day: int; Number of steps in each day.
+      stop_when: [condition]; Stop conditions, e.g. stopping.Extinct(),
+        stopping.DietExtinct("CARNIVORE") or stopping.Stationary().
+      plot_steps, frame_pipeline: As for pass_day.
+    Returns:
+      stopping.Stop; Why the world stopped, and when.
+    """
+    for days_run in range(max_days + 1):
+      for condition in stop_when:
+        message = condition(self)
+        if message is not None:
+          return Stop(condition.reason, days_run, self.days_passed, message)
+      if days_run < max_days:
+        self.pass_day(steps_in_day, plot_steps=plot_steps,
+                      frame_pipeline=frame_pipeline)
+    return Stop("MAX_DAYS", max_days, self.days_passed,
+                "Passed all " + str(max_days) + " days")
+
+  def end_day(self):
+    """Wraps up the day: eating, births, deaths, spoiling, sprouting, etc.
+
+    Births and deaths are handled in bulk (mark, then compact once), so this
+    costs O(N) for N creatures no matter how many are born or die. They're
+    added to today's counts in self.counters (see stats).
+
+    Returns:
+      int; Number of creatures that died today.
+    """
+    if self.population is not None:
+      return self._end_day_arrays()
 
     # Eat and reproduce, if you can, my dudes!
     babies = []
     for this_creature in self.creatures:
+      food_stored = this_creature.food_stored
       babies += this_creature.eat_die_reproduce(self)
+      self.counters.food_stored += this_creature.food_stored - food_stored
 
     # Welcome little dudes!
-    [self.add_creature(baby) for baby in babies]
+    self.add_creatures(babies)
+    self.counters.num_births += len(babies)
 
     # Goodbye, loyal dudes! :(
     deaths = [x for x in self.creatures if not x.is_alive]
-    num_deaths = len(deaths)
-    [self.remove_creature(death) for death in deaths]
+    self.remove_creatures(deaths)
+    self.counters.num_deaths += len(deaths)
 
     # Spoil food if we need to.
     if self.food_spoils:
       self.field.spoil()
       for this_creature in self.creatures:
         this_creature.food_stored=0
+      self.counters.food_stored = 0.0
 
     # The land is fertile! :)
     self.field.sprout(self.food_fill_factor)
 
-    # Everybody who can teleport, does.
-    [creature.maybe_teleport(self) for creature in self.creatures]
+    # Everybody who can teleport, does. (Destinations are drawn for the
+    # jumpers only, in order, just like kernels.teleport.)
+    jumpers = [x for x in self.creatures if x.randomly_teleports]
+    destinations = self.rng.integers(self.field.field_size,
+                                     size=(len(jumpers), 2))
+    [creature.maybe_teleport(self, list(destination))
+     for creature, destination in zip(jumpers, destinations)]
+    return len(deaths)
+
+  def _move_arrays(self, steps_in_day, plot_steps, frame_pipeline=None):
+    """Moves the creatures of the array engines through the day."""
+    population = self.population
+    trophic = self.trophic_table
+    nobody_hunts = not trophic.is_predator[population.diet_type].any()
+    if self.engine == "TRAJECTORIES" and nobody_hunts and not plot_steps:
+      self.counters.food_stored += kernels.herbivore_day(
+          population, self.field, steps_in_day, self.rng, trophic)
+    else:
+      step = (kernels.synchronous_step if self.update_mode == "SYNCHRONOUS"
+              else kernels.sequential_step)
+      for first_step, directions, rank in kernels.draw_moves(
+          self.rng, steps_in_day, len(population)):
+        for t, (step_directions, step_rank) in enumerate(
+            zip(directions, rank), start=first_step):
+          self.counters.food_stored += step(
+              population, self.field, step_directions, step_rank, trophic)
+          if plot_steps:
+            self._plot_step(t, frame_pipeline)
+
+  def _end_day_arrays(self):
+    """end_day for the array engines."""
+    population = self.population
+
+    # Eat and reproduce, if you can, my dudes! (Babies are welcomed, too.)
+    num_before = len(population)
+    num_babies, food_eaten = kernels.eat_die_reproduce(population, self.rng,
+                                                       self.trait_drift)
+    self.counters.food_stored -= food_eaten
+    self.counters.add(population.diet_type[num_before:],
+                      population.mutation[num_before:])
+    self.counters.num_births += num_babies
 
-    # Long day...
-    self.days_passed += 1
-    self._record_history(num_deaths)
+    # Goodbye, loyal dudes! :(
+    dead = ~population.is_alive
+    num_deaths = int(dead.sum())
+    self._count_out(dead)
+    self.counters.num_deaths += num_deaths
+    population.compact(population.is_alive)
+
+    # Spoil food if we need to.
+    if self.food_spoils:
+      self.field.spoil()
+      population.food_stored = 0
+      self.counters.food_stored = 0.0
 
-  def _record_history(self, deaths):
+    # The land is fertile! :)
+    self.field.sprout(self.food_fill_factor)
+
+    # Everybody who can teleport, does.
+    kernels.teleport(population, self.field.field_size, self.rng)
+    return num_deaths
+
+  def _record_history(self):
     """Record a line in the history books.
 
-    Arguments:
-      deaths: int; Number of deaths to record. These dudes are gone...
+    The totals and counts come straight from stats; only the histograms and
+    trait quantiles need everybody's numbers.
     """
-    self.history.append(
-        DailyHistory(
-            day=self.days_passed,
-            num_creatures=len(self.creatures),
-            total_food_stored=sum([x.food_stored for x in self.creatures]),
-            num_births=(0 if self.days_passed == 0 else
-                len([x for x in self.creatures if x.age == 0])),
-            num_deaths=deaths,
-            creature_list=self.creatures.copy(),
-            food_on_field=sum(sum(self.field.food_grid))
-        )
-    )
+    snapshot = None
+    if self.population is not None:
+      population = self.population
+      if self.history.wants_snapshot(self.days_passed):
+        # A frozen copy, so history doesn't change under our feet.
+        snapshot = population.copy()
+      columns = {name: getattr(population, name)
+                 for name in ["food_stored", "age"] + TRAITS}
+    else:
+      creatures = self.creatures
+      if self.history.wants_snapshot(self.days_passed):
+        snapshot = Population(capacity=len(creatures),
+                              diet_types=self.trophic_table.diet_types)
+        for creature in creatures:
+          snapshot.append_creature(creature)
+      columns = {name: np.array([getattr(x, name) for x in creatures])
+                 for name in ["food_stored", "age"] + TRAITS}
+      columns["age"] = columns["age"].astype(np.int64)
+    self.history.record(self.stats(), columns, snapshot=snapshot)
 
   def plot_history(self, save_plot=False):
     """Plot the history of the world.
@@ -271,14 +894,14 @@ class World:
     Arguments:
       save_plot: bool; Save the plot to disc?
     """
-    fig,axes = plt.subplots(4, 3, figsize = (18, 15))
-    day_history = np.array([x.day for x in self.history])
-    num_creatures_history = np.array([x.num_creatures for x in self.history])
-    num_births_history = np.array([x.num_births for x in self.history])
-    num_deaths_history = np.array([x.num_deaths for x in self.history])
-    total_food_stored_history = np.array(
-        [x.total_food_stored for x in self.history])
-    food_on_field_history = np.array([x.food_on_field for x in self.history])
+    fig,axes = plt.subplots(5, 3, figsize = (18, 19))
+    history = self.history
+    day_history = history.day
+    num_creatures_history = history.num_creatures
+    num_births_history = history.num_births
+    num_deaths_history = history.num_deaths
+    total_food_stored_history = history.total_food_stored
+    food_on_field_history = history.food_on_field
 
     def _set_properties(ax, upper_y, y_label, x_label="Time (days)"):
       ax.grid(b=True, which='major')
@@ -287,11 +910,9 @@ class World:
       ax.set_ylabel(y_label)
       ax.set_ylim(0, max(upper_y, 1))
 
-    diet_types = set()
-    # Get the set of all mutations throughout history.
-    for this_day_history in self.history:
-      for this_creature in this_day_history.creature_list:
-        diet_types.add(this_creature.diet_type)
+    # Every diet type that turned up at some point in history.
+    diet_codes = np.flatnonzero(history.diet_counts.sum(axis=0))
+    diet_types = [history.diet_types[i] for i in diet_codes]
 
     # If only 1 diet type, plot creatures, births, deaths.
     if len(diet_types) < 2:
@@ -300,23 +921,16 @@ class World:
       axes[0,0].plot(day_history, num_deaths_history, 'r', label="Deaths")
     # Otherwise, plot time series of diet types.
     else:
-      diet_type_cts_hist = [dict.fromkeys(diet_types, 0) for x in self.history]
-      for this_day_history in self.history:
-        for this_creature in this_day_history.creature_list:
-          diet_type_cts_hist[this_day_history.day][this_creature.diet_type] += 1
-      for dt in sorted(diet_types):
-        dtch = np.array([x[dt] for x in diet_type_cts_hist])
-        axes[0,0].plot(dtch, label=dt)
+      for code, dt in sorted(zip(diet_codes, diet_types), key=lambda x: x[1]):
+        axes[0,0].plot(day_history, history.diet_counts[:, code], label=dt)
 
     _set_properties(axes[0,0], max(num_creatures_history)*1.05, 'Creatures')
     axes[0,0].legend()
 
 
-    mutations = set()
-    # Get the set of all mutations throughout history.
-    for this_day_history in self.history:
-      for this_creature in this_day_history.creature_list:
-        mutations.add(this_creature.mutation)
+    # Every mutation that turned up at some point in history.
+    mutation_codes = np.flatnonzero(history.mutation_counts.sum(axis=0))
+    mutations = [MUTATIONS[i] for i in mutation_codes]
 
     # If there's only one type of mutation and we didn't already plot it above,
     # plot creatures, births, and deaths.
@@ -327,15 +941,10 @@ class World:
       axes[0,1].legend()
     # Otherwise, plot mutations.
     else:
-      # Get the number of creatures with each mutation throughout history
-      mut_cts_history = [dict.fromkeys(mutations, 0) for x in self.history]
-      for this_day_history in self.history:
-        for this_creature in this_day_history.creature_list:
-          mut_cts_history[this_day_history.day][this_creature.mutation] += 1
-
-      running_sum = np.array([0 for x in range(len(self.history))])
-      for mut in sorted(mutations):
-        mut_ct_history = np.array([x[mut] for x in mut_cts_history])
+      running_sum = np.zeros(len(history), dtype=np.int64)
+      for code, mut in sorted(zip(mutation_codes, mutations),
+                              key=lambda x: x[1]):
+        mut_ct_history = history.mutation_counts[:, code]
         axes[0,1].fill_between(day_history,
                                running_sum,
                                running_sum + mut_ct_history,
@@ -354,32 +963,22 @@ class World:
     )
 
     # The 0th entry in the history is actually just the starting state.
-    days_with_creatures = np.array(
-        [i for i in np.where(today_creatures>0)[0] if i !=0])
-
-    axes[0,2].fill_between(
-        [day_history[i-1] for i in days_with_creatures],
-        [0 for x in days_with_creatures],
-        [0 for x in days_with_creatures],
-        label=None)
-    axes[0,2].fill_between(
-        [day_history[i-1] for i in days_with_creatures],
-        [num_births_history[i]/today_creatures[i] for i in days_with_creatures],
-        [(today_creatures[i]-num_deaths_history[i])/today_creatures[i]
-            for i in days_with_creatures],
-        label='barely made it')
-    axes[0,2].fill_between(
-        [day_history[i-1] for i in days_with_creatures],
-        [0 for x in days_with_creatures],
-        [num_births_history[i]/today_creatures[i]
-            for i in days_with_creatures],
-        label='reproduced')
-    axes[0,2].fill_between(
-        [day_history[i-1] for i in days_with_creatures],
-        [(today_creatures[i]-num_deaths_history[i])/today_creatures[i]
-            for i in days_with_creatures],
-        [1 for i in days_with_creatures],
-        label = 'died')
+    days_with_creatures = np.flatnonzero(today_creatures > 0)
+    days_with_creatures = days_with_creatures[days_with_creatures != 0]
+    previous_days = day_history[days_with_creatures - 1]
+    reproduced = (num_births_history[days_with_creatures]/
+                  today_creatures[days_with_creatures])
+    survived = ((today_creatures - num_deaths_history)[days_with_creatures]/
+                today_creatures[days_with_creatures])
+    no_days = np.zeros(len(days_with_creatures))
+
+    axes[0,2].fill_between(previous_days, no_days, no_days, label=None)
+    axes[0,2].fill_between(previous_days, reproduced, survived,
+                           label='barely made it')
+    axes[0,2].fill_between(previous_days, no_days, reproduced,
+                           label='reproduced')
+    axes[0,2].fill_between(previous_days, survived, no_days + 1,
+                           label = 'died')
 
     handles, labels = axes[0,2].get_legend_handles_labels()
     axes[0,2].legend(handles[::-1], labels[::-1])
@@ -402,7 +1001,7 @@ class World:
                            num_creatures_history,
                            label='barely made it')
     axes[1,0].fill_between(day_history,
-                           [0 for x in day_history],
+                           np.zeros(len(day_history)),
                            num_births_history,
                            label='newborns')
     axes[1,0].fill_between(day_history,
@@ -434,34 +1033,27 @@ class World:
 
 
     # Plot births/creature, deaths/creature, food stored/food on field.
-    days_w_creats = np.array(
-        [i for i in np.where(num_creatures_history>0)[0]
-            if i != self.days_passed])
+    days_w_creats = np.flatnonzero(num_creatures_history > 0)
+    days_w_creats = days_w_creats[days_w_creats != self.days_passed]
     axes[1,2].plot(
-        [day_history[i] for i in days_w_creats],
-        [num_births_history[i]/num_creatures_history[i] for i in days_w_creats],
+        day_history[days_w_creats],
+        num_births_history[days_w_creats]/num_creatures_history[days_w_creats],
         'g', label="Births/Starting Creatures")
     axes[1,2].plot(
-        [day_history[i] for i in days_w_creats],
-        [num_deaths_history[i+1]/num_creatures_history[i]
-            for i in days_w_creats],
+        day_history[days_w_creats],
+        (num_deaths_history[days_w_creats + 1]/
+         num_creatures_history[days_w_creats]),
         'r', label="Deaths/Starting Creatures")
     max_y = 1
 
-    days_w_food = np.array(
-        [i for i in np.where(food_on_field_history>0)[0] if i !=0])
+    days_w_food = np.flatnonzero(food_on_field_history > 0)
+    days_w_food = days_w_food[days_w_food != 0]
     if len(days_w_food) > 1:
-
-      axes[1,2].plot(
-          [day_history[i] for i in days_w_food],
-          [total_food_stored_history[i]/food_on_field_history[i]
-              for i in days_w_food],
-          'b--', label="Food stored/Food on field")
-      max_y = max(
-          max_y,
-          max([total_food_stored_history[i]/food_on_field_history[i]
-              for i in days_w_food])
-      )
+      food_ratio = (total_food_stored_history[days_w_food]/
+                    food_on_field_history[days_w_food])
+      axes[1,2].plot(day_history[days_w_food], food_ratio,
+                     'b--', label="Food stored/Food on field")
+      max_y = max(max_y, food_ratio.max())
     _set_properties(axes[1,2], 1.05*max_y, '')
     axes[1,2].legend()
 
@@ -472,27 +1064,25 @@ class World:
     #                 normed=True,
     #                 lw=2)
     # ax.grid(b=True, which='major')
+    # ... in the meantime, that spot shows how the traits evolve (below).
 
 
     # Plot avg food stored per creature.
-    axes[2,1].plot(
-        [day_history[i] for i in days_w_creats],
-        [total_food_stored_history[i]/num_creatures_history[i]
-            for i in days_w_creats],
-        'g--')
+    food_per_creature = (total_food_stored_history[days_w_creats]/
+                         num_creatures_history[days_w_creats])
+    axes[2,1].plot(day_history[days_w_creats], food_per_creature, 'g--')
     _set_properties(
         axes[2,1],
-        1.05*max([total_food_stored_history[i]/num_creatures_history[i]
-            for i in days_w_creats]),
+        1.05*np.max(food_per_creature, initial=0),
         'Avg Food Stored/Creature'
     )
 
 
     # Plot the final distribution of amount of food stored by creatures.
-    labels, counts = np.unique(
-        [x.food_stored for x in self.history[-1].creature_list if x.age>0],
-        return_counts=True)
-    axes[2,2].bar(labels, counts, align='center')
+    counts = history.food_stored_histogram[-1]
+    labels = np.arange(len(counts))*FOOD_BIN_WIDTH
+    axes[2,2].bar(labels[counts > 0], counts[counts > 0],
+                  width=FOOD_BIN_WIDTH, align='edge')
     axes[2,2].set_xlabel('Food Stored')
     axes[2,2].set_ylabel('Creatures (non-newborns)')
     axes[2,2].set_title('Final Food Stored distribution ')
@@ -528,15 +1118,31 @@ class World:
                             total_food_stored_history[i]))
 
 
-    # Plot final age distribution of the creatures.
-    labels, counts = np.unique([x.age for x in self.history[-1].creature_list],
-                               return_counts=True)
-    axes[3,2].bar(labels, counts, align='center')
+    # Plot final age distribution of the creatures (the last bar is everybody
+    # older, too).
+    counts = history.age_histogram[-1]
+    labels = np.arange(len(counts))
+    axes[3,2].bar(labels[counts > 0], counts[counts > 0], align='center')
     axes[3,2].set_xlabel('Age')
     axes[3,2].set_ylabel('Creatures')
     axes[3,2].set_title('Final age distribution')
 
 
+    # Plot how each trait is distributed over time: the median, with bands
+    # for the middle 50% and 90% of the creatures.
+    for ax, name in zip([axes[4,0], axes[4,1], axes[4,2], axes[2,0]], TRAITS):
+      quantiles = history.trait_quantiles[:, TRAITS.index(name)]
+      ax.fill_between(day_history, quantiles[:, 0], quantiles[:, -1],
+                      alpha=0.3, color='b', label='5-95%')
+      ax.fill_between(day_history, quantiles[:, 1], quantiles[:, -2],
+                      alpha=0.5, color='b', label='25-75%')
+      ax.plot(day_history, quantiles[:, len(QUANTILES)//2], 'b',
+              label='median')
+      upper_y = np.nanmax(quantiles) if not np.isnan(quantiles).all() else 1
+      _set_properties(ax, upper_y*1.05, name.replace('_', ' ').capitalize())
+      ax.legend()
+
+
     fig.tight_layout()
 
     if save_plot: